@@ -1,23 +1,116 @@
 import csv
 
 from django.contrib import admin
+from django.db import transaction
 from django.http import HttpResponse
+from django.utils import timezone
 
-from products.models import Cart, Group, Order, OrderProduct, Product
-from products.selectors import orders_report
+from products.cache import bump_catalog_version
+from products.models import (Cart, Group, ImportJob, LowStockAlert, Order,
+                             OrderProduct, Product)
+from products.selectors import low_stock_products, orders_report
+from products.services import record_tombstones
+from products.suggest import suggest_index
+
+
+class CatalogAdmin(admin.ModelAdmin):
+    """
+    Сбрасывает кеш каталога после изменений из админки и пишет
+    надгробия удаленных объектов
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(bump_catalog_version)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        record_tombstones(self.model._meta.model_name, [obj.pk])
+        super().delete_model(request, obj)
+        transaction.on_commit(bump_catalog_version)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        record_tombstones(
+            self.model._meta.model_name,
+            list(queryset.values_list('pk', flat=True))
+        )
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(bump_catalog_version)
+
+
+class LowStockFilter(admin.SimpleListFilter):
+    title = 'Остаток'
+    parameter_name = 'stock'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('low', 'Заканчивается'),
+            ('out', 'Нет в наличии'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'low':
+            return low_stock_products(queryset)
+        if self.value() == 'out':
+            return low_stock_products(queryset, threshold=1)
+        return queryset
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(CatalogAdmin):
     search_fields = ['=id', 'article', 'name', '=amount', '=price']
-    list_filter = ('group', 'created_at', 'amount')
+    list_filter = ('group', 'created_at', LowStockFilter)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(lambda: suggest_index.add([obj]))
+
+    def delete_model(self, request, obj):
+        pk = obj.pk
+        super().delete_model(request, obj)
+        transaction.on_commit(lambda: suggest_index.remove([pk]))
+
+    def delete_queryset(self, request, queryset):
+        pks = list(queryset.values_list('pk', flat=True))
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(lambda: suggest_index.remove(pks))
 
 
 @admin.register(Group)
-class GroupAdmin(admin.ModelAdmin):
+class GroupAdmin(CatalogAdmin):
     search_fields = ['=id', 'name', 'description']
     list_filter = ('created_at',)
 
+    def delete_model(self, request, obj):
+        # SET_NULL у товаров идет через update() без auto_now,
+        # поэтому версию строк товаров двигаем явно, а хеш содержимого
+        # сбрасываем, чтобы импорт перезаписал группу товара
+        obj.products.update(updated_at=timezone.now(), content_hash=None)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        Product.objects.filter(group__in=queryset).update(
+            updated_at=timezone.now(), content_hash=None
+        )
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(LowStockAlert)
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ('product', 'amount', 'created_at')
+    list_select_related = ('product',)
+    list_filter = ('created_at',)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'kind', 'status', 'rows_done', 'created_rows', 'updated_rows',
+        'created_at', 'finished_at'
+    )
+    list_filter = ('kind', 'status', 'created_at')
+
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
@@ -28,7 +121,7 @@ class CartAdmin(admin.ModelAdmin):
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     search_fields = ['=id']
-    list_filter = ('is_paid', 'products', 'user')
+    list_filter = ('is_paid', 'created_at', 'products', 'user')
     actions = ('export_as_csv',)
 
     def export_as_csv(self, request, queryset):
@@ -0,0 +1,263 @@
+import datetime
+import hashlib
+import time
+from typing import Any, Callable, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+STOCK_VERSION_KEY = 'catalog:stock'
+STOCK_CHANGES_KEY = 'catalog:stock:{version}'
+STOCK_CHANGES_TIMEOUT = 60 * 60
+STOCK_CHANGES_LIMIT = 1000
+PRODUCT_FRAGMENT_KEY = 'product:fragment:{pk}:{version}{variant}'
+SINGLE_FLIGHT_LOCK_TIMEOUT = 10
+SINGLE_FLIGHT_POLL_INTERVAL = 0.02
+
+
+def get_catalog_version() -> int:
+    """
+    Returns
+    -------
+    version :
+        текущая версия каталога товаров и групп
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # после вытеснения ключа начинаем с метки времени, чтобы не
+        # совпасть с версиями, под которыми еще лежат старые ответы
+        cache.add(CATALOG_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version() -> int:
+    """
+    Инвалидирует все закешированные ответы каталога
+
+    Returns
+    -------
+    version :
+        новая версия каталога
+    """
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+        return cache.incr(CATALOG_VERSION_KEY)
+
+
+def get_stock_version() -> int:
+    """
+    Returns
+    -------
+    version :
+        текущая версия остатков товаров. Остатки меняются на каждое
+        добавление в корзину, поэтому версия у них своя и снимок
+        каталога из-за них не перестраивается
+    """
+    version = cache.get(STOCK_VERSION_KEY)
+    if version is None:
+        cache.add(STOCK_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(STOCK_VERSION_KEY)
+    return version
+
+
+def bump_stock_version(pks: Sequence[int]) -> int:
+    """
+    Parameters
+    ----------
+    pks :
+        pk товаров, у которых изменился остаток
+
+    Returns
+    -------
+    version :
+        новая версия остатков, под ней в кеше лежат pks
+    """
+    try:
+        version = cache.incr(STOCK_VERSION_KEY)
+    except ValueError:
+        get_stock_version()
+        version = cache.incr(STOCK_VERSION_KEY)
+    cache.set(
+        STOCK_CHANGES_KEY.format(version=version), list(pks),
+        timeout=STOCK_CHANGES_TIMEOUT
+    )
+    return version
+
+
+def get_stock_changes(since: int, version: int) -> set[int] | None:
+    """
+    Parameters
+    ----------
+    since :
+        версия остатков, которая уже учтена
+    version :
+        текущая версия остатков
+
+    Returns
+    -------
+    pks :
+        pk товаров, у которых менялся остаток после since, или None,
+        если часть изменений уже вытеснена из кеша, еще не записана
+        или их слишком много
+    """
+    if not 0 <= version - since <= STOCK_CHANGES_LIMIT:
+        return None
+    keys = [
+        STOCK_CHANGES_KEY.format(version=v)
+        for v in range(since + 1, version + 1)
+    ]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return None
+    return set().union(*changes.values())
+
+
+def catalog_cache_key(request) -> str:
+    """
+    Parameters
+    ----------
+    request :
+        запрос к каталогу
+
+    Returns
+    -------
+    key :
+        ключ кеша из версий каталога и остатков, формата ответа, пути
+        и отсортированных параметров
+    """
+    params = '&'.join(
+        f'{key}={value}'
+        for key, values in sorted(request.query_params.lists())
+        for value in values
+    )
+    # формат ответа может прийти в Accept, а не в параметрах
+    return (
+        f'catalog:{get_catalog_version()}.{get_stock_version()}:'
+        f'{request.accepted_renderer.format}:'
+        f'{request.get_host()}{request.path}?{params}'
+    )
+
+
+def catalog_etag(key: str) -> str:
+    """
+    Parameters
+    ----------
+    key :
+        ключ кеша ответа, уже содержащий версию каталога
+
+    Returns
+    -------
+    etag :
+        строгий ETag ответа
+    """
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def row_version(updated_at: datetime.datetime) -> int:
+    """
+    Parameters
+    ----------
+    updated_at :
+        дата изменения строки
+
+    Returns
+    -------
+    version :
+        версия строки в микросекундах
+    """
+    return int(updated_at.timestamp() * 1_000_000)
+
+
+def get_or_render_fragments(
+        instances: Sequence, render: Callable[[Sequence], list[dict]],
+        variant: str = ''
+) -> list[dict]:
+    """
+    Parameters
+    ----------
+    instances :
+        товары страницы с полями id и updated_at,
+        экземпляры модели или строки values()
+    render :
+        сериализация списка товаров, вызывается только для промахов
+    variant :
+        суффикс ключа для неполных представлений (fields/exclude)
+
+    Returns
+    -------
+    fragments :
+        сериализованные товары в порядке instances. Ключ фрагмента
+        содержит версию строки, поэтому сохранение товара или импорт
+        сами делают старый фрагмент недостижимым
+    """
+    keys = [
+        PRODUCT_FRAGMENT_KEY.format(
+            pk=values['id'], version=row_version(values['updated_at']),
+            variant=variant
+        )
+        for values in (
+            instance if isinstance(instance, dict) else instance.__dict__
+            for instance in instances
+        )
+    ]
+    fragments = cache.get_many(keys)
+    misses = [
+        (key, instance) for key, instance in zip(keys, instances)
+        if key not in fragments
+    ]
+    if misses:
+        rendered = dict(zip(
+            (key for key, _ in misses),
+            map(dict, render([instance for _, instance in misses]))
+        ))
+        cache.set_many(rendered, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        fragments.update(rendered)
+    return [fragments[key] for key in keys]
+
+
+def get_or_set_single_flight(
+        key: str, producer: Callable[[], Any], timeout: int = None
+) -> Any:
+    """
+    Parameters
+    ----------
+    key :
+        ключ кеша
+    producer :
+        функция, вычисляющая значение при промахе
+    timeout :
+        время жизни значения, по умолчанию CATALOG_CACHE_TIMEOUT
+
+    Returns
+    -------
+    value :
+        значение из кеша или от producer. При промахе producer вызывает
+        только тот, кто взял блокировку, остальные ждут ее результат
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    if timeout is None:
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, timeout=SINGLE_FLIGHT_LOCK_TIMEOUT):
+        try:
+            value = producer()
+            cache.set(key, value, timeout=timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + SINGLE_FLIGHT_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.get(lock_key) is None:
+            break
+    return producer()
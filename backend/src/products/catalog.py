@@ -0,0 +1,304 @@
+import copy
+import datetime
+import operator
+import string
+import threading
+from array import array
+from bisect import bisect_left
+from decimal import Decimal
+from typing import Callable, Iterable, Sequence
+
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from products.cache import (get_catalog_version, get_stock_changes,
+                            get_stock_version)
+from products.models import Group, Product
+
+PRODUCT_COLUMNS = (
+    'id', 'article', 'name', 'amount', 'price', 'group_id',
+    # даты берем строками БД: их порядок совпадает с хронологическим,
+    # а в datetime переводим только строки отдаваемой страницы
+    Cast('created_at', CharField()), Cast('updated_at', CharField())
+)
+# границы цены в копейках, когда одна из них не задана
+PRICE_MIN, PRICE_MAX = -2 ** 63, 2 ** 63 - 1
+# name__icontains на SQLite - LIKE, который без ICU сворачивает регистр
+# только у ASCII, снимок сравнивает названия так же
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+ORDERING_KEYS = {
+    'price': lambda snapshot, i: (snapshot.prices[i], snapshot.ids[i]),
+    'created_at': lambda snapshot, i: (
+        snapshot.created_at[i], snapshot.ids[i]
+    ),
+}
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога товаров в памяти процесса.
+
+    Колонки хранятся массивами, строка - индекс в них. Строки идут
+    в порядке -id, как Meta.ordering товара, поэтому сортировка по
+    умолчанию - это просто range. Остальные сортировки строятся
+    при первом обращении и запоминаются до замены снимка.
+
+    Остатки меняются чаще всего остального, поэтому у них своя версия:
+    with_stock дает копию снимка с новыми остатками нескольких товаров,
+    а колонки и сортировки остаются общими.
+    """
+    __slots__ = (
+        'version', 'stock_version', 'ids', 'articles', 'names',
+        'folded_names', 'amounts', 'prices', 'group_ids', 'created_at',
+        'updated_at', 'groups', 'group_names', '_orderings', '_ranks'
+    )
+
+    def __init__(
+            self, version: int, rows: Sequence[tuple],
+            group_names: dict = None, stock_version: int = None
+    ):
+        self.version = version
+        self.stock_version = stock_version
+        self.group_names = group_names or {}
+        columns = tuple(zip(*rows)) or ((),) * len(PRODUCT_COLUMNS)
+        (
+            ids, self.articles, self.names, amounts, prices, group_ids,
+            self.created_at, self.updated_at
+        ) = columns
+        self.ids = array('q', ids)
+        self.amounts = array('q', amounts)
+        self.prices = array('q', (int(price * 100) for price in prices))
+        self.group_ids = array('q', (pk or 0 for pk in group_ids))
+        self.folded_names = tuple(
+            name.translate(ASCII_LOWER) for name in self.names
+        )
+        self.groups = {}
+        for i, group_id in enumerate(self.group_ids):
+            self.groups.setdefault(group_id, array('q')).append(i)
+        self._orderings = {}
+        self._ranks = {}
+
+    @classmethod
+    def build(
+            cls, version: int, stock_version: int = None
+    ) -> 'CatalogSnapshot':
+        return cls(version, list(
+            Product.objects.order_by('-id').values_list(
+                *PRODUCT_COLUMNS
+            ).iterator(chunk_size=2000)
+        ), dict(Group.objects.values_list('id', 'name')), stock_version)
+
+    def index(self, pk: int) -> int | None:
+        """
+        Returns
+        -------
+        i :
+            строка товара pk или None, если его нет в снимке
+        """
+        i = bisect_left(self.ids, -pk, key=operator.neg)
+        return i if i < len(self) and self.ids[i] == pk else None
+
+    def with_stock(
+            self, stock_version: int, rows: Iterable[tuple]
+    ) -> 'CatalogSnapshot':
+        """
+        Parameters
+        ----------
+        stock_version :
+            версия остатков, которую учитывает rows
+        rows :
+            pk, остаток и дата изменения товаров, у которых он поменялся
+
+        Returns
+        -------
+        snapshot :
+            копия снимка с новыми остатками, остальные колонки
+            и сортировки общие с этим снимком
+        """
+        snapshot = copy.copy(self)
+        amounts = array('q', self.amounts)
+        updated_at = list(self.updated_at)
+        for pk, amount, updated in rows:
+            i = self.index(pk)
+            if i is not None:
+                amounts[i], updated_at[i] = amount, updated
+        snapshot.amounts, snapshot.updated_at = amounts, tuple(updated_at)
+        snapshot.stock_version = stock_version
+        return snapshot
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_order(self, field: str) -> Sequence[int]:
+        """
+        Parameters
+        ----------
+        field :
+            поле сортировки, как в ProductView.cursor_ordering_fields
+
+        Returns
+        -------
+        rows :
+            индексы всех строк в порядке сортировки с pk как вторым ключом
+        """
+        if field == '-id':
+            return range(len(self))
+        if field == 'id':
+            return range(len(self) - 1, -1, -1)
+        order = self._orderings.get(field)
+        if order is None:
+            key = ORDERING_KEYS[field.lstrip('-')]
+            order = self._orderings[field] = array('q', sorted(
+                range(len(self)), key=lambda i: key(self, i),
+                reverse=field.startswith('-')
+            ))
+        return order
+
+    def get_rank(self, field: str) -> Sequence[int]:
+        rank = self._ranks.get(field)
+        if rank is None:
+            rank = array('q', bytes(8 * len(self)))
+            for position, i in enumerate(self.get_order(field)):
+                rank[i] = position
+            self._ranks[field] = rank
+        return rank
+
+    def price_filter(self, price_min=None, price_max=None) -> Callable:
+        """
+        Returns
+        -------
+        in_price :
+            проверка цены в копейках на границы [price_min, price_max]
+        """
+        low = None if price_min is None else int(price_min * 100)
+        high = None if price_max is None else int(price_max * 100)
+        return lambda price: (
+            (low is None or price >= low) and (high is None or price <= high)
+        )
+
+    def select(
+            self, group: Sequence[int] = None, name: str = None,
+            price_min=None, price_max=None, in_stock: bool = None,
+            ordering: str = '-id'
+    ) -> Sequence[int]:
+        """
+        Parameters
+        ----------
+        group :
+            pk групп, как фильтр group у ProductView
+        name :
+            фильтр по вхождению в название без учета регистра
+        price_min, price_max :
+            границы цены включительно
+        in_stock :
+            True - только в наличии, False - только отсутствующие
+        ordering :
+            поле сортировки
+
+        Returns
+        -------
+        rows :
+            индексы подходящих строк в порядке сортировки
+        """
+        rows = None
+        if group is not None:
+            # 0 в group_ids - товары без группы, фильтр group их не находит
+            rows = [
+                i for group_id in set(group) if group_id > 0
+                for i in self.groups.get(group_id, ())
+            ]
+        # на каждый фильтр свой проход без вызовов функций на строку,
+        # каждый следующий идет только по строкам предыдущего
+        if name:
+            needle = name.translate(ASCII_LOWER)
+            folded_names = self.folded_names
+            rows = [
+                i for i in self._rows(rows) if needle in folded_names[i]
+            ]
+        if price_min is not None or price_max is not None:
+            low = PRICE_MIN if price_min is None else int(price_min * 100)
+            high = PRICE_MAX if price_max is None else int(price_max * 100)
+            prices = self.prices
+            rows = [i for i in self._rows(rows) if low <= prices[i] <= high]
+        if in_stock is not None:
+            amounts = self.amounts
+            if in_stock:
+                rows = [i for i in self._rows(rows) if amounts[i] > 0]
+            else:
+                rows = [i for i in self._rows(rows) if amounts[i] <= 0]
+        if rows is None:
+            return self.get_order(ordering)
+        if ordering == '-id':
+            return sorted(rows)
+        if ordering == 'id':
+            return sorted(rows, reverse=True)
+        return sorted(rows, key=self.get_rank(ordering).__getitem__)
+
+    def _rows(self, rows: Sequence[int] | None) -> Sequence[int]:
+        return range(len(self)) if rows is None else rows
+
+    @staticmethod
+    def _datetime(value: str) -> datetime.datetime:
+        return datetime.datetime.fromisoformat(value).replace(
+            tzinfo=datetime.timezone.utc
+        )
+
+    def row(self, i: int) -> dict:
+        """
+        Returns
+        -------
+        row :
+            строка i в виде строки values() товара для сериализации
+        """
+        return {
+            'id': self.ids[i], 'article': self.articles[i],
+            'name': self.names[i], 'amount': self.amounts[i],
+            'price': Decimal(self.prices[i]).scaleb(-2),
+            'group_id': self.group_ids[i] or None,
+            'created_at': self._datetime(self.created_at[i]),
+            'updated_at': self._datetime(self.updated_at[i]),
+        }
+
+
+class CatalogStore:
+    """
+    Держит снимок каталога процесса и атомарно подменяет его,
+    когда меняется версия каталога в кеше. Если изменились только
+    остатки, в снимке перечитываются остатки измененных товаров
+    """
+    __slots__ = ('_lock', '_snapshot')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def get_snapshot(self) -> CatalogSnapshot:
+        version, stock_version = get_catalog_version(), get_stock_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version or (
+                snapshot.stock_version != stock_version
+        ):
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = CatalogSnapshot.build(version, stock_version)
+                elif snapshot.stock_version != stock_version:
+                    snapshot = self._update_stock(snapshot, stock_version)
+                self._snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _update_stock(
+            snapshot: CatalogSnapshot, stock_version: int
+    ) -> CatalogSnapshot:
+        pks = get_stock_changes(snapshot.stock_version, stock_version)
+        if pks is None:
+            return CatalogSnapshot.build(snapshot.version, stock_version)
+        return snapshot.with_stock(
+            stock_version, Product.objects.filter(pk__in=pks).values_list(
+                'id', 'amount', PRODUCT_COLUMNS[-1]
+            )
+        )
+
+
+catalog_store = CatalogStore()
@@ -0,0 +1,186 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import connection, transaction
+
+from products.models import ProductCounter
+
+VIEWS_KEY = 'product:views'
+FLUSH_LOCK_KEY = 'product:views:flush'
+# меняется при каждой выгрузке, входит в ключ кеша сортировки popular
+FLUSHED_VERSION_KEY = 'product:views:flushed'
+FLUSH_BATCH_SIZE = 500
+# через сколько секунд выгрузка считается брошенной, а ее хеш в Redis
+# забирает следующая
+DRAIN_STALE_TIMEOUT = 10 * 60
+
+
+class MemoryViewBuffer:
+    """Счетчики просмотров в памяти процесса"""
+    __slots__ = ('_lock', '_counts', '_flushed_at')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._flushed_at = time.monotonic()
+
+    def incr(self, pk: int) -> None:
+        with self._lock:
+            self._counts[pk] += 1
+
+    def is_flush_due(self) -> bool:
+        return (
+            time.monotonic() - self._flushed_at
+            >= settings.VIEW_COUNTERS_FLUSH_INTERVAL
+        )
+
+    def drain(self) -> dict[int, int]:
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._flushed_at = time.monotonic()
+        return counts
+
+    def release(self) -> None:
+        pass
+
+
+def redis_client(backend: RedisCache):
+    """
+    Returns
+    -------
+    client, lib :
+        клиент Redis для записи и модуль redis бэкенда RedisCache
+    """
+    # единственное место с внутренностями RedisCache: они не входят в API
+    # Django и сверены с Django 4.2 из requirements.txt, при обновлении
+    # Django проверить RedisCacheClient.get_client и _lib
+    internal = backend._cache
+    return internal.get_client(write=True), internal._lib
+
+
+class RedisViewBuffer:
+    """
+    Счетчики просмотров в хеше Redis (HINCRBY), общие для всех процессов.
+    Клиент берется у RedisCache, чтобы не держать второе подключение.
+
+    Выгрузка переименовывает хеш в draining-ключ и удаляет его только
+    после записи в БД. Хеш процесса, который упал между ними, подхватит
+    выгрузка через DRAIN_STALE_TIMEOUT секунд
+    """
+    __slots__ = ('_cache', '_drained')
+
+    def __init__(self, backend: RedisCache):
+        self._cache = backend
+        self._drained = []
+
+    def incr(self, pk: int) -> None:
+        client, _ = redis_client(self._cache)
+        client.hincrby(self._cache.make_key(VIEWS_KEY), pk, 1)
+
+    def is_flush_due(self) -> bool:
+        # выгружает тот процесс, который первым взял ключ на интервал
+        return self._cache.add(
+            FLUSH_LOCK_KEY, 1, timeout=settings.VIEW_COUNTERS_FLUSH_INTERVAL
+        )
+
+    def drain(self) -> dict[int, int]:
+        client, lib = redis_client(self._cache)
+        key = self._cache.make_key(VIEWS_KEY)
+        prefix = f'{key}:draining:'
+        stale = time.time_ns() - DRAIN_STALE_TIMEOUT * 10 ** 9
+        # время начала выгрузки - первая часть draining-ключа
+        orphans = [
+            orphan for orphan in map(
+                bytes.decode, client.scan_iter(match=f'{prefix}*')
+            )
+            if int(orphan[len(prefix):].split(':')[0]) < stale
+        ]
+        counts = Counter()
+        for source in [key, *orphans]:
+            draining = f'{prefix}{time.time_ns()}:{uuid.uuid4().hex}'
+            # RENAME атомарен: инкременты после него пишутся уже в новый
+            # хеш, а брошенный хеш забирает только одна выгрузка
+            try:
+                client.rename(source, draining)
+            except lib.ResponseError:
+                continue
+            self._drained.append(draining)
+            for pk, count in client.hgetall(draining).items():
+                counts[int(pk)] += int(count)
+        return counts
+
+    def release(self) -> None:
+        """Удаляет выгруженные хеши, когда счетчики уже записаны в БД"""
+        if self._drained:
+            client, _ = redis_client(self._cache)
+            client.delete(*self._drained)
+            self._drained = []
+
+
+def get_view_buffer() -> MemoryViewBuffer | RedisViewBuffer:
+    # django.core.cache.cache - прокси, тип бэкенда есть только у caches
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        return RedisViewBuffer(backend)
+    return memory_view_buffer
+
+
+def flush_view_counters(buffer=None) -> int:
+    """
+    Parameters
+    ----------
+    buffer :
+        буфер счетчиков, по умолчанию буфер текущего кеша
+
+    Returns
+    -------
+    count :
+        кол-во товаров, чьи счетчики записаны в БД. Пишутся одним
+        INSERT ... ON CONFLICT DO UPDATE на пачку FLUSH_BATCH_SIZE строк
+    """
+    buffer = buffer or get_view_buffer()
+    counts = list(buffer.drain().items())
+    table = ProductCounter._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        # буфер очищается после коммита, до него счетчики остаются в нем
+        transaction.on_commit(buffer.release)
+        for start in range(0, len(counts), FLUSH_BATCH_SIZE):
+            batch = counts[start:start + FLUSH_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} (product_id, views)'
+                ' SELECT product.id, buffer.column2'
+                f' FROM (VALUES {", ".join(["(%s, %s)"] * len(batch))})'
+                ' AS buffer JOIN product ON product.id = buffer.column1'
+                # удаленные товары отбрасываются join-ом, WHERE нужен
+                # SQLite, чтобы ON CONFLICT не читался как условие join
+                ' WHERE true'
+                ' ON CONFLICT (product_id)'
+                f' DO UPDATE SET views = {table}.views + excluded.views',
+                [value for row in batch for value in row]
+            )
+    if counts:
+        cache.set(FLUSHED_VERSION_KEY, time.time_ns(), timeout=None)
+    return len(counts)
+
+
+def get_flushed_version() -> int:
+    return cache.get(FLUSHED_VERSION_KEY, 0)
+
+
+def record_view(pk: int) -> None:
+    """
+    Учитывает просмотр товара в буфере и раз в
+    VIEW_COUNTERS_FLUSH_INTERVAL секунд выгружает буфер в БД
+    """
+    buffer = get_view_buffer()
+    buffer.incr(pk)
+    if buffer.is_flush_due():
+        flush_view_counters(buffer)
+
+
+memory_view_buffer = MemoryViewBuffer()
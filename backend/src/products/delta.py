@@ -0,0 +1,122 @@
+import datetime
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from typing import Sequence
+from urllib import parse
+
+from django.db.models import Max, Q, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from products.models import Tombstone
+
+DELTA_LIMIT = 1000
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+# updated_at и pk последней отданной строки, id последнего надгробия;
+# pk и tombstone равны None, если клиент передал просто время
+DeltaPosition = namedtuple('DeltaPosition', ('updated_at', 'pk', 'tombstone'))
+
+
+def decode_since(value: str) -> DeltaPosition:
+    """
+    Parameters
+    ----------
+    value :
+        время в ISO 8601, unix-время в секундах или курсор next
+        из предыдущего ответа
+
+    Returns
+    -------
+    position :
+        позиция, с которой отдаются изменения
+    """
+    updated_at = parse_datetime(value)
+    if updated_at is None:
+        try:
+            updated_at = EPOCH + datetime.timedelta(seconds=float(value))
+        except (ValueError, OverflowError):
+            pass
+    if updated_at is not None:
+        if timezone.is_naive(updated_at):
+            updated_at = timezone.make_aware(updated_at, datetime.timezone.utc)
+        return DeltaPosition(updated_at=updated_at, pk=None, tombstone=None)
+    try:
+        querystring = b64decode(value.encode('ascii')).decode('ascii')
+        tokens = parse.parse_qs(querystring)
+        return DeltaPosition(
+            updated_at=EPOCH + int(tokens['u'][0]) * MICROSECOND,
+            pk=int(tokens['i'][0]), tombstone=int(tokens['t'][0])
+        )
+    except (TypeError, ValueError, KeyError, UnicodeError, OverflowError):
+        raise ValidationError({'updated_since': 'Некорректное значение'})
+
+
+def encode_since(position: DeltaPosition) -> str:
+    querystring = parse.urlencode({
+        'u': (position.updated_at - EPOCH) // MICROSECOND,
+        'i': position.pk or 0,
+        't': position.tombstone,
+    })
+    return b64encode(querystring.encode('ascii')).decode('ascii')
+
+
+def get_delta(
+        queryset: QuerySet, model: str, position: DeltaPosition,
+        limit: int = DELTA_LIMIT
+) -> tuple[Sequence, list[int], DeltaPosition, bool]:
+    """
+    Parameters
+    ----------
+    queryset :
+        отфильтрованный кверисет объектов с полем updated_at
+    model :
+        имя модели в надгробиях
+    position :
+        позиция предыдущей синхронизации
+    limit :
+        максимум измененных и удаленных объектов в ответе
+
+    Returns
+    -------
+    delta :
+        измененные объекты в порядке (updated_at, pk), pk удаленных,
+        позиция для следующего запроса и признак, что есть еще изменения
+    """
+    if position.pk is None:
+        changed = Q(updated_at__gte=position.updated_at)
+    else:
+        changed = Q(updated_at__gt=position.updated_at) | Q(
+            updated_at=position.updated_at, pk__gt=position.pk
+        )
+    objects = list(
+        queryset.filter(changed).order_by('updated_at', 'pk')[:limit + 1]
+    )
+    tombstones = Tombstone.objects.filter(model=model)
+    # верхняя граница фиксирует надгробия, которые войдут в курсор,
+    # даже если параллельно кто-то удаляет объекты
+    last_tombstone = tombstones.aggregate(last=Max('pk'))['last'] or 0
+    tombstones = tombstones.filter(pk__lte=last_tombstone)
+    if position.tombstone is None:
+        tombstones = tombstones.filter(deleted_at__gte=position.updated_at)
+    else:
+        tombstones = tombstones.filter(pk__gt=position.tombstone)
+    deleted = list(
+        tombstones.order_by('pk').values_list('pk', 'object_id')[:limit + 1]
+    )
+    has_more = len(objects) > limit or len(deleted) > limit
+    if len(deleted) > limit:
+        deleted = deleted[:limit]
+        last_tombstone = deleted[-1][0]
+    objects = objects[:limit]
+    if objects:
+        updated_at, pk = objects[-1].updated_at, objects[-1].pk
+    else:
+        updated_at, pk = position.updated_at, position.pk
+    return (
+        objects, [object_id for _, object_id in deleted],
+        DeltaPosition(updated_at=updated_at, pk=pk, tombstone=last_tombstone),
+        has_more
+    )
@@ -0,0 +1,108 @@
+import csv
+from typing import Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from products.models import Product
+
+EXPORT_CHUNK_SIZE = 2000
+# первые колонки совпадают с тем, что принимает import_products_csv
+EXPORT_COLUMNS = (
+    'id', 'article', 'name', 'amount', 'price', 'group_id', 'group_name'
+)
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=cp1251',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Line:
+    """Буфер для csv.writer, который возвращает записанную строку"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def export_rows(chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[tuple]:
+    """
+    Returns
+    -------
+    rows :
+        строки товаров в порядке pk, из БД читаются по chunk_size
+    """
+    return Product.objects.order_by('id').values_list(
+        *EXPORT_COLUMNS[:-1], 'group__name'
+    ).iterator(chunk_size=chunk_size)
+
+
+def _chunked(lines: Iterable[bytes], size: int) -> Iterator[bytes]:
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield b''.join(chunk)
+            chunk = []
+    if chunk:
+        yield b''.join(chunk)
+
+
+def _with_header(rows: Iterable[tuple]) -> Iterator[tuple]:
+    yield EXPORT_COLUMNS
+    yield from rows
+
+
+def iter_csv(
+        rows: Iterable[tuple], chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Returns
+    -------
+    chunks :
+        CSV в cp1251 с заголовком, по chunk_size строк в куске.
+        Символы вне cp1251 заменяются на ?
+    """
+    writer = csv.writer(_Line())
+    lines = (
+        writer.writerow(row).encode('cp1251', errors='replace')
+        for row in _with_header(rows)
+    )
+    return _chunked(lines, chunk_size)
+
+
+def iter_ndjson(
+        rows: Iterable[tuple], chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Returns
+    -------
+    chunks :
+        по объекту JSON на строку, по chunk_size строк в куске
+    """
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    lines = (
+        f'{encoder.encode(dict(zip(EXPORT_COLUMNS, row)))}\n'.encode()
+        for row in rows
+    )
+    return _chunked(lines, chunk_size)
+
+
+EXPORTERS = {'csv': iter_csv, 'ndjson': iter_ndjson}
+
+
+def export_products(
+        export_format: str, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Parameters
+    ----------
+    export_format :
+        csv или ndjson
+    chunk_size :
+        строк в одном чтении из БД и в одном куске вывода
+
+    Returns
+    -------
+    chunks :
+        выгрузка всего каталога кусками байт
+    """
+    return EXPORTERS[export_format](export_rows(chunk_size), chunk_size)
@@ -0,0 +1,151 @@
+from bisect import bisect_right
+
+from django.db.models import Count, Q, QuerySet
+
+from products.cache import (get_catalog_version, get_or_set_single_flight,
+                            get_stock_version)
+from products.selectors import filter_products, price_range_q
+
+# границы корзин цен: [0, 100), [100, 500), ..., [5000, ∞)
+PRICE_FACET_BOUNDS = (100, 500, 1000, 5000)
+FACETS_KEY = 'catalog:{version}:facets:{signature}'
+# фасеты считаются по всей выборке, поэтому только по запросу
+FACETS_PARAM = 'facets'
+
+
+def price_buckets() -> list[tuple[int, int | None]]:
+    bounds = (0, *PRICE_FACET_BOUNDS)
+    return list(zip(bounds, (*PRICE_FACET_BOUNDS, None)))
+
+
+def facets_signature(filters: dict) -> str:
+    """
+    Returns
+    -------
+    signature :
+        каноничная запись фильтров: от пагинации и сортировки
+        фасеты не зависят
+    """
+    return '&'.join(
+        f'{key}={",".join(map(str, sorted(value)))}'
+        if isinstance(value, list) else f'{key}={value}'
+        for key, value in sorted(filters.items())
+    )
+
+
+def _facets(group_counts: dict, names: dict, bucket_counts: list) -> dict:
+    return {
+        'groups': [
+            {'id': pk, 'name': names[pk], 'count': count}
+            for pk, count in sorted(
+                group_counts.items(), key=lambda item: (-item[1], item[0])
+            )
+            if count
+        ],
+        'prices': [
+            {'min': low, 'max': high, 'count': count}
+            for (low, high), count in zip(price_buckets(), bucket_counts)
+        ],
+    }
+
+
+def _bucket_q(low: int, high: int | None) -> Q:
+    # первая корзина без нижней границы, как bisect в снимке
+    q = Q(price__gte=low) if low else Q()
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def _count(q: Q) -> Count:
+    return Count('id', filter=q) if q else Count('id')
+
+
+def build_facets(queryset: QuerySet, filters: dict) -> dict:
+    """
+    Parameters
+    ----------
+    queryset :
+        все товары каталога
+    filters :
+        провалидированные ProductFilterSerializer фильтры
+
+    Returns
+    -------
+    facets :
+        кол-во товаров по группам и корзинам цен одним запросом
+        GROUP BY group_id. Каждый фасет считается без своего фильтра,
+        чтобы были видны соседние группы и диапазоны цен
+    """
+    base = filter_products(queryset, **{
+        key: value for key, value in filters.items()
+        if key not in ('group', 'price_min', 'price_max')
+    })
+    price_q = price_range_q(filters.get('price_min'), filters.get('price_max'))
+    group_q = Q()
+    if filters.get('group') is not None:
+        group_q = Q(group_id__in=filters['group'])
+    rows = base.order_by().values('group_id', 'group__name').annotate(
+        count=_count(price_q),
+        **{
+            f'price_{i}': _count(group_q & _bucket_q(low, high))
+            for i, (low, high) in enumerate(price_buckets())
+        }
+    )
+    group_counts, names = {}, {}
+    bucket_counts = [0] * len(price_buckets())
+    for row in rows:
+        if row['group_id'] is not None:
+            group_counts[row['group_id']] = row['count']
+            names[row['group_id']] = row['group__name']
+        for i in range(len(bucket_counts)):
+            bucket_counts[i] += row[f'price_{i}']
+    return _facets(group_counts, names, bucket_counts)
+
+
+def build_snapshot_facets(snapshot, filters: dict) -> dict:
+    """
+    То же, что build_facets, по снимку каталога в памяти
+    """
+    rows = snapshot.select(
+        name=filters.get('name'), in_stock=filters.get('in_stock')
+    )
+    in_price = snapshot.price_filter(
+        filters.get('price_min'), filters.get('price_max')
+    )
+    groups = filters.get('group')
+    groups = None if groups is None else set(groups)
+    bounds = [bound * 100 for bound in PRICE_FACET_BOUNDS]
+    group_counts = {}
+    bucket_counts = [0] * len(price_buckets())
+    for i in rows:
+        group_id, price = snapshot.group_ids[i], snapshot.prices[i]
+        if group_id and in_price(price):
+            group_counts[group_id] = group_counts.get(group_id, 0) + 1
+        if groups is None or group_id in groups:
+            bucket_counts[bisect_right(bounds, price)] += 1
+    return _facets(group_counts, snapshot.group_names, bucket_counts)
+
+
+def get_or_build_facets(filters: dict, build) -> dict:
+    """
+    Parameters
+    ----------
+    filters :
+        провалидированные фильтры запроса
+    build :
+        подсчет фасетов, вызывается при промахе кеша
+
+    Returns
+    -------
+    facets :
+        фасеты из кеша по версиям каталога и остатков и набору
+        фильтров
+    """
+    return get_or_set_single_flight(
+        FACETS_KEY.format(
+            version=f'{get_catalog_version()}.{get_stock_version()}',
+            signature=facets_signature(filters)
+        ),
+        build
+    )
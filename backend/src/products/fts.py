@@ -0,0 +1,58 @@
+"""
+SQL полнотекстового индекса товаров product_fts (SQLite FTS5).
+
+SQLite пересоздает таблицу product при большинстве AlterField/AddField,
+и вместе со старой таблицей пропадают ее триггеры. Поэтому каждая
+миграция, меняющая product, заканчивается RunSQL(CREATE_FTS_TRIGGERS)
+и начинается с RunSQL(noop, reverse_sql=CREATE_FTS_TRIGGERS) для отката.
+"""
+
+CREATE_FTS_TABLE = (
+    """
+    CREATE VIRTUAL TABLE product_fts USING fts5(
+        name, article,
+        content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+)
+
+CREATE_FTS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_insert
+    AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, article)
+        VALUES (new.id, new.name, new.article);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_delete
+    AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, article)
+        VALUES ('delete', old.id, old.name, old.article);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_update
+    AFTER UPDATE OF name, article ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, article)
+        VALUES ('delete', old.id, old.name, old.article);
+        INSERT INTO product_fts(rowid, name, article)
+        VALUES (new.id, new.name, new.article);
+    END
+    """,
+)
+
+REBUILD_FTS = (
+    "INSERT INTO product_fts(product_fts) VALUES ('rebuild')",
+)
+
+DROP_FTS_TRIGGERS = (
+    'DROP TRIGGER IF EXISTS product_fts_update',
+    'DROP TRIGGER IF EXISTS product_fts_delete',
+    'DROP TRIGGER IF EXISTS product_fts_insert',
+)
+
+DROP_FTS_TABLE = (
+    'DROP TABLE IF EXISTS product_fts',
+)
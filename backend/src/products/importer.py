@@ -0,0 +1,625 @@
+import codecs
+import csv
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from django.apps import apps
+from django.db import models, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ParseError, ValidationError
+
+from products.cache import bump_catalog_version
+from products.models import Group, ImportJob, ImportJobUndo, Product, Tombstone
+from products.suggest import suggest_index
+from services.streaming import iter_chunks
+
+IMPORT_ENCODING = 'cp1251'
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+INTEGER_LIMIT = 2 ** 63
+
+
+@dataclass(slots=True, frozen=True)
+class Column:
+    name: str
+    convert: Callable[[str], Any]
+    required: bool = True
+
+
+def text(max_length: int) -> Callable[[str], str]:
+    def convert(value: str) -> str:
+        value = value.strip()
+        if not value:
+            raise ValueError('Поле не может быть пустым')
+        if len(value) > max_length:
+            raise ValueError(f'Не больше {max_length} символов')
+        return value
+
+    return convert
+
+
+def integer(value: str) -> int:
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError('Ожидалось целое число')
+    if not -INTEGER_LIMIT <= value < INTEGER_LIMIT:
+        raise ValueError('Число вне допустимого диапазона')
+    return value
+
+
+def non_negative(value: str) -> int:
+    value = integer(value)
+    if value < 0:
+        raise ValueError('Не может быть меньше 0')
+    return value
+
+
+def optional(convert: Callable[[str], Any]) -> Callable[[str], Any]:
+    """
+    Returns
+    -------
+    convert :
+        convert, но пустое значение - None, как его пишет экспорт
+    """
+    def convert_optional(value: str) -> Any:
+        return convert(value) if value.strip() else None
+
+    return convert_optional
+
+
+def decimal(max_digits: int, decimal_places: int) -> Callable[[str], Decimal]:
+    exponent = Decimal(1).scaleb(-decimal_places)
+    limit = Decimal(10) ** (max_digits - decimal_places)
+
+    def convert(value: str) -> Decimal:
+        try:
+            value = Decimal(value.strip())
+        except InvalidOperation:
+            raise ValueError('Ожидалось число')
+        if not value.is_finite():
+            raise ValueError('Ожидалось число')
+        quantized = value.quantize(exponent)
+        if quantized != value:
+            raise ValueError(
+                f'Не больше {decimal_places} знаков после запятой'
+            )
+        if abs(quantized) >= limit:
+            raise ValueError(
+                f'Не больше {max_digits - decimal_places} знаков до запятой'
+            )
+        return quantized
+
+    return convert
+
+
+@dataclass(slots=True)
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+
+@dataclass(slots=True)
+class CatalogImportResult(ImportResult):
+    groups_created: int = 0
+
+
+class ImportUndo:
+    """
+    Журнал отката фонового импорта, который коммитит пачки по одной.
+
+    Записи журнала - строки ImportJobUndo задачи, каждая пишется
+    в транзакции своей пачки, поэтому журнал переживает остановку
+    обработчика, а незавершенную задачу откатывает
+    recover_stale_import_jobs. Откат компенсирующий: у обновленной
+    строки возвращаются только колонки импорта и только если после
+    импорта строку никто не менял (хеш содержимого тот же, что записал
+    импорт). Созданная строка удаляется при том же условии и если на
+    нее не ссылаются корзины, заказы или товары.
+    """
+    __slots__ = ('job',)
+
+    def __init__(self, job: ImportJob):
+        self.job = job
+
+    def record(
+            self, model: type[models.Model], field: str, created: list,
+            updated: list
+    ) -> None:
+        """
+        Parameters
+        ----------
+        model :
+            модель пачки
+        field :
+            поле, по которому ищутся строки
+        created :
+            значения field и хеши созданных строк
+        updated :
+            значения field и хеши обновленных строк с прежними
+            значениями колонок импорта
+        """
+        ImportJobUndo.objects.create(
+            job=self.job, model=model._meta.model_name, field=field,
+            created=created, updated=updated
+        )
+
+    def rollback(self) -> bool:
+        """
+        Откатывает пачки в обратном порядке, каждую своей транзакцией
+        вместе с удалением ее записи журнала. Удаленные строки попадают
+        в надгробия для дельта-синхронизации, а восстановленные получают
+        новое updated_at.
+
+        Returns
+        -------
+        rolled_back :
+            были ли записанные пачки
+        """
+        pks = list(self.job.undo.order_by('-id').values_list('pk', flat=True))
+        for pk in pks:
+            with transaction.atomic():
+                entry = ImportJobUndo.objects.get(pk=pk)
+                self.undo_entry(entry)
+                entry.delete()
+        return bool(pks)
+
+    @staticmethod
+    def undo_entry(entry: ImportJobUndo) -> None:
+        model = apps.get_model('products', entry.model)
+        field = entry.field
+        now = timezone.now()
+        for key, content_hash, values in entry.updated:
+            model.objects.filter(**{
+                field: key, 'content_hash': content_hash
+            }).update(**values, updated_at=now)
+        created = dict(entry.created)
+        rows = model.objects.filter(**{f'{field}__in': list(created)})
+        if model is Product:
+            rows = rows.filter(cart=None, order_products=None)
+        elif model is Group:
+            rows = rows.filter(products=None)
+        pks = [
+            pk for pk, key, content_hash in
+            rows.values_list('pk', field, 'content_hash')
+            if created[key] == content_hash
+        ]
+        Tombstone.objects.bulk_create(
+            Tombstone(model=entry.model, object_id=pk) for pk in pks
+        )
+        model.objects.filter(pk__in=pks).delete()
+
+
+class CSVImporter:
+    """
+    Потоковый импорт CSV в модель.
+
+    Файл декодируется и читается построчно, значения колонок
+    проверяются заранее собранными конвертерами, проверки с запросами
+    к БД идут одним запросом на пачку из batch_size строк, а пачка сразу
+    пишется bulk_create. В памяти держится только текущая пачка.
+    Импорт атомарный: при ошибках ничего не сохраняется, а в ответ
+    уходят первые max_errors ошибок с номерами строк файла.
+
+    С задачей job (фоновый импорт) импорт не атомарный: каждая пачка
+    коммитится своей транзакцией, чтобы долгий импорт не держал
+    блокировку записи SQLite на весь файл. Пока импорт идет, его пачки
+    видны запросам к БД, а кеши каталога сбрасываются только в конце.
+    При ошибке записанные пачки отменяются по журналу ImportUndo, кроме
+    строк, которые после импорта успели изменить.
+
+    В режиме upsert строки с уже существующим unique_field обновляются,
+    а строки с тем же хешем содержимого, что в БД, пропускаются без
+    записи: повторный импорт неизмененного файла только читает хеши.
+    """
+    model: type[models.Model]
+    columns: Sequence[Column]
+    unique_field: str
+    batch_size = IMPORT_BATCH_SIZE
+    max_errors = IMPORT_MAX_ERRORS
+
+    def __init__(
+            self, upsert: bool = False,
+            progress: Callable[[int], None] = None, job: ImportJob = None
+    ):
+        """
+        Parameters
+        ----------
+        upsert :
+            обновлять существующие строки вместо ошибки
+        progress :
+            вызывается после каждой пачки с кол-вом прочитанных строк
+        job :
+            фоновая задача: пачки коммитятся по одной, а журнал их отката
+            пишется в ImportJobUndo задачи
+        """
+        self.upsert = upsert
+        self.progress = progress
+        self.errors = []
+        self.result = ImportResult()
+        self.undo = None if job is None else ImportUndo(job)
+
+    @property
+    def update_fields(self) -> list[str]:
+        """Поля, которые upsert перезаписывает у существующих строк"""
+        return [
+            *(column.name for column in self.columns
+              if column.name != self.unique_field),
+            'content_hash', 'updated_at'
+        ]
+
+    def error(self, line: int, field: str, message: str) -> None:
+        self.errors.append((line, field, message))
+
+    def get_error_detail(self) -> dict:
+        """
+        Returns
+        -------
+        detail :
+            первые max_errors ошибок по номерам строк файла в формате
+            ошибок сериализатора: {строка: {поле: [сообщения]}}
+        """
+        detail = {}
+        for line, field, message in sorted(self.errors)[:self.max_errors]:
+            detail.setdefault(line, {}).setdefault(field, []).append(message)
+        return detail
+
+    @property
+    def failed(self) -> bool:
+        return len(self.errors) >= self.max_errors
+
+    def check_header(self, fieldnames: Sequence[str] | None) -> None:
+        """
+        Raises
+        -------
+        ParseError
+            в заголовке нет обязательных колонок
+        """
+        missing = [
+            column.name for column in self.columns
+            if column.required and column.name not in (fieldnames or ())
+        ]
+        if fieldnames and missing:
+            raise ParseError(f'Нет колонок: {", ".join(missing)}')
+
+    @classmethod
+    def convert_row(
+            cls, line: int, row: dict
+    ) -> tuple[dict | None, list[tuple[int, str, str]]]:
+        """
+        Parameters
+        ----------
+        line :
+            номер строки файла
+        row :
+            строка CSV по колонкам заголовка
+
+        Returns
+        -------
+        data, errors :
+            значения колонок или None, если в строке есть ошибки,
+            и сами ошибки. Запросов к БД нет, поэтому строки можно
+            проверять в других процессах
+        """
+        data, errors = {}, []
+        for column in cls.columns:
+            value = row.get(column.name)
+            if value is None:
+                if column.required:
+                    errors.append((line, column.name, 'Обязательное поле'))
+                continue
+            try:
+                data[column.name] = column.convert(value)
+            except ValueError as e:
+                errors.append((line, column.name, str(e)))
+        return (None if errors else data), errors
+
+    def read(self, file: Iterable[bytes]) -> Iterator[tuple[int, dict]]:
+        """
+        Parameters
+        ----------
+        file :
+            файл CSV в кодировке IMPORT_ENCODING
+
+        Returns
+        -------
+        rows :
+            номер строки файла и значения колонок, строки с ошибками
+            пропускаются и попадают в errors
+        """
+        reader = csv.DictReader(codecs.iterdecode(file, IMPORT_ENCODING))
+        self.check_header(reader.fieldnames)
+        for row in reader:
+            if self.failed:
+                return
+            data, errors = self.convert_row(reader.line_num, row)
+            if errors:
+                self.errors.extend(errors)
+            else:
+                yield reader.line_num, data
+
+    def validate_batch(
+            self, rows: list[tuple[int, dict]]
+    ) -> list[tuple[int, dict]]:
+        """
+        Parameters
+        ----------
+        rows :
+            пачка строк после проверки колонок
+
+        Returns
+        -------
+        rows :
+            строки пачки без повторов unique_field. Без upsert значение
+            не должно быть и в БД: строки прошлых пачек уже записаны,
+            поэтому повторы по всему файлу тоже находятся
+        """
+        field = self.unique_field
+        seen = set()
+        valid = []
+        for line, data in rows:
+            if data[field] in seen:
+                self.error(line, field, 'Значение повторяется в файле')
+                continue
+            seen.add(data[field])
+            valid.append((line, data))
+        return valid
+
+    def get_stored_hashes(self, keys: list) -> dict:
+        """
+        Returns
+        -------
+        hashes :
+            хеши содержимого строк БД по значениям unique_field
+        """
+        return dict(self.model.objects.filter(**{
+            f'{self.unique_field}__in': keys
+        }).values_list(self.unique_field, 'content_hash'))
+
+    def record_undo(self, created: list, updated: dict) -> None:
+        """
+        Запись пачки в журнал отката, в транзакции пачки до ее записи
+
+        Parameters
+        ----------
+        created :
+            значения unique_field и хеши создаваемых строк
+        updated :
+            хеши обновляемых строк по значениям unique_field, прежние
+            значения колонок импорта читаются из БД
+        """
+        field = self.unique_field
+        columns = [
+            self.model._meta.get_field(name).attname
+            for name in self.update_fields if name != 'updated_at'
+        ]
+        stored = self.model.objects.filter(**{
+            f'{field}__in': list(updated)
+        }).values(field, *columns) if updated else ()
+        self.undo.record(self.model, field, created, [
+            (
+                values[field], updated[values[field]],
+                {column: values[column] for column in columns}
+            )
+            for values in stored
+        ])
+
+    def write_batch(self, rows: list[tuple[int, dict]]) -> list:
+        """
+        Returns
+        -------
+        objects :
+            созданные и обновленные объекты пачки
+        """
+        field = self.unique_field
+        stored = self.get_stored_hashes([data[field] for _, data in rows])
+        objects, created, updated = [], [], {}
+        for line, data in rows:
+            obj = self.model(**data)
+            obj.content_hash = obj.get_content_hash()
+            key = data[field]
+            if key not in stored:
+                self.result.created += 1
+                created.append((key, obj.content_hash))
+            elif not self.upsert:
+                self.error(line, field, 'Значение уже существует')
+                continue
+            elif stored[key] == obj.content_hash:
+                self.result.skipped += 1
+                continue
+            else:
+                self.result.updated += 1
+                updated[key] = obj.content_hash
+            objects.append(obj)
+        if self.errors or not objects:
+            return []
+        if self.undo is not None:
+            self.record_undo(created, updated)
+        if self.upsert:
+            self.model.objects.bulk_create(
+                objects, batch_size=self.batch_size, update_conflicts=True,
+                unique_fields=[field], update_fields=self.update_fields
+            )
+        else:
+            self.model.objects.bulk_create(objects, batch_size=self.batch_size)
+        return objects
+
+    def run(self, file: Iterable[bytes]) -> ImportResult:
+        """
+        Parameters
+        ----------
+        file :
+            файл CSV
+
+        Returns
+        -------
+        result :
+            кол-во созданных, обновленных и пропущенных строк
+
+        Raises
+        -------
+        ParseError
+            в файле нет данных или колонок
+        ValidationError
+            ошибки в строках, см. get_error_detail
+        """
+        return self.import_rows(self.read(file))
+
+    def import_rows(self, rows: Iterable[tuple[int, dict]]) -> ImportResult:
+        """
+        Parameters
+        ----------
+        rows :
+            номера строк файла и проверенные convert_row значения,
+            ошибки строк уже в errors
+
+        Returns
+        -------
+        result :
+            см. run
+        """
+        if self.undo is None:
+            with transaction.atomic():
+                return self._import_rows(rows)
+        try:
+            return self._import_rows(rows)
+        except BaseException:
+            if self.undo.rollback():
+                bump_catalog_version()
+            raise
+
+    def _import_rows(self, rows: Iterable[tuple[int, dict]]) -> ImportResult:
+        rows_read = 0
+        for batch in iter_chunks(rows, self.batch_size):
+            rows_read += len(batch)
+            # после первой ошибки пачки только проверяются, а файл
+            # дочитывается ради списка ошибок
+            with transaction.atomic(savepoint=False):
+                self.write_batch(self.validate_batch(batch))
+            if self.progress is not None:
+                self.progress(rows_read)
+        if self.errors:
+            raise ValidationError(self.get_error_detail())
+        if not rows_read:
+            raise ParseError('Не найдены данные для импорта')
+        if self.result.created or self.result.updated:
+            transaction.on_commit(bump_catalog_version)
+        return self.result
+
+
+class ProductImporter(CSVImporter):
+    model = Product
+    columns = (
+        Column('article', text(150)),
+        Column('name', text(150)),
+        Column('amount', non_negative),
+        Column('price', decimal(10, 2)),
+        Column('group_id', optional(integer)),
+    )
+    unique_field = 'article'
+
+    def __init__(self, upsert=False, progress=None, job=None):
+        super().__init__(upsert, progress, job)
+        self.groups_pk = set(Group.objects.values_list('pk', flat=True))
+        self.batches = 0
+        self.suggest_reset = False
+        self.suggest_added = []
+
+    def validate_batch(self, rows):
+        valid = []
+        for line, data in rows:
+            group_id = data['group_id']
+            if group_id is not None and group_id not in self.groups_pk:
+                self.error(
+                    line, 'group_id', f'Группа {data["group_id"]} не найдена'
+                )
+                continue
+            valid.append((line, data))
+        return super().validate_batch(valid)
+
+    def write_batch(self, rows):
+        objects = super().write_batch(rows)
+        if not objects:
+            return objects
+        self.batches += 1
+        if self.batches == 1 and not self.upsert:
+            self.suggest_added = objects
+        else:
+            # большой импорт не держим в памяти ради точечного
+            # обновления, а upsert не возвращает pk обновленных строк:
+            # индекс перестроится из БД при следующем запросе
+            self.suggest_reset = True
+        return objects
+
+    def import_rows(self, rows):
+        result = super().import_rows(rows)
+        # индекс подсказок обновляется после смены версии каталога,
+        # которую import_rows ставит в on_commit
+        if self.suggest_reset:
+            transaction.on_commit(suggest_index.clear)
+        elif self.suggest_added:
+            added = self.suggest_added
+            transaction.on_commit(lambda: suggest_index.add(added))
+        return result
+
+
+class GroupImporter(CSVImporter):
+    model = Group
+    columns = (
+        Column('name', text(150)),
+        Column('description', text(200), required=False),
+    )
+    unique_field = 'name'
+
+
+class CatalogImporter(ProductImporter):
+    """
+    Импорт товаров с группами по названию в колонке group.
+
+    Соответствие названий и pk групп читается из БД один раз, группы,
+    которых еще нет, создаются одним bulk_create на пачку перед записью
+    ее товаров, поэтому весь каталог грузится одним проходом по файлу.
+    """
+    columns = (
+        Column('article', text(150)),
+        Column('name', text(150)),
+        Column('amount', non_negative),
+        Column('price', decimal(10, 2)),
+        Column('group', text(150)),
+    )
+
+    def __init__(self, upsert=False, progress=None, job=None):
+        super().__init__(upsert, progress, job)
+        self.result = CatalogImportResult()
+        self.groups = dict(Group.objects.values_list('name', 'pk'))
+        self.groups_pk = set(self.groups.values())
+
+    def create_groups(self, names: list[str]) -> None:
+        groups = [Group(name=name) for name in names]
+        for group in groups:
+            group.content_hash = group.get_content_hash()
+        Group.objects.bulk_create(groups)
+        if self.undo is not None:
+            self.undo.record(Group, 'name', [
+                (group.name, group.content_hash) for group in groups
+            ], [])
+        # pk из bulk_create есть не на всех БД, поэтому читаем заново
+        created = dict(Group.objects.filter(
+            name__in=names
+        ).values_list('name', 'pk'))
+        self.groups.update(created)
+        self.groups_pk.update(created.values())
+        self.result.groups_created += len(created)
+
+    def validate_batch(self, rows):
+        missing = {
+            data['group']: None for _, data in rows
+            if data['group'] not in self.groups
+        }
+        if missing:
+            self.create_groups(list(missing))
+        for _, data in rows:
+            data['group_id'] = self.groups[data.pop('group')]
+        return super().validate_batch(rows)
@@ -0,0 +1,270 @@
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ParseError, ValidationError
+
+from products.cache import bump_catalog_version
+from products.importer import (CatalogImporter, GroupImporter, ImportUndo,
+                               ProductImporter)
+from products.models import ImportJob
+from products.parsers import GZIP_SUFFIX, iter_lines
+
+logger = logging.getLogger(__name__)
+
+IMPORT_JOB_PROGRESS_KEY = 'import_job:{pk}:progress'
+IMPORT_JOB_PROGRESS_TIMEOUT = 60 * 60 * 24
+IMPORTERS = {
+    ImportJob.Kind.PRODUCTS: ProductImporter,
+    ImportJob.Kind.GROUPS: GroupImporter,
+    ImportJob.Kind.CATALOG: CatalogImporter,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMPORT_JOBS_WORKERS,
+                thread_name_prefix='import-job'
+            )
+        return _executor
+
+
+def create_import_job(kind: str, file: File, upsert: bool, user) -> ImportJob:
+    """
+    Parameters
+    ----------
+    kind :
+        что импортируется, ImportJob.Kind
+    file :
+        CSV, сохраняется в хранилище до обработки как есть,
+        сжатый - с суффиксом .gz в имени
+    upsert :
+        режим upsert импорта
+    user :
+        кто запустил импорт
+
+    Returns
+    -------
+    job :
+        задача в очереди. При IMPORT_JOBS_IN_PROCESS она уходит в пул
+        потоков процесса после коммита, иначе ее заберет команда
+        run_import_jobs
+    """
+    job = ImportJob.objects.create(
+        kind=kind, upsert=upsert, file=file,
+        user=user if user.is_authenticated else None
+    )
+    if settings.IMPORT_JOBS_IN_PROCESS:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_import_job_in_thread, job.pk)
+        )
+    return job
+
+
+def get_progress(job: ImportJob) -> int:
+    """
+    Returns
+    -------
+    rows :
+        кол-во прочитанных строк файла. Пока задача идет, прогресс
+        берется из кеша, а в строке задачи на каждую пачку обновляется
+        только heartbeat_at
+    """
+    if job.status != ImportJob.Status.RUNNING:
+        return job.rows_done
+    return cache.get(IMPORT_JOB_PROGRESS_KEY.format(pk=job.pk), 0)
+
+
+def get_throughput(job: ImportJob) -> float | None:
+    """
+    Returns
+    -------
+    throughput :
+        строк в секунду с начала обработки или None, если она не начата
+    """
+    if job.started_at is None:
+        return None
+    finished_at = job.finished_at or timezone.now()
+    elapsed = (finished_at - job.started_at).total_seconds()
+    return round(get_progress(job) / elapsed, 1) if elapsed > 0 else None
+
+
+def run_import_job(pk: int) -> ImportJob | None:
+    """
+    Parameters
+    ----------
+    pk :
+        pk задачи в очереди
+
+    Returns
+    -------
+    job :
+        выполненная задача или None, если ее уже забрал другой
+        обработчик
+    """
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(
+        pk=pk, status=ImportJob.Status.PENDING
+    ).update(
+        status=ImportJob.Status.RUNNING, started_at=now, heartbeat_at=now
+    )
+    if not claimed:
+        return None
+    job = ImportJob.objects.get(pk=pk)
+    # пачки коммитятся по одной, чтобы импорт не держал блокировку
+    # записи SQLite, пока читается весь файл
+    importer = IMPORTERS[job.kind](
+        upsert=job.upsert, progress=import_job_progress(pk), job=job
+    )
+    try:
+        with job.file.open('rb') as file:
+            result = importer.run(
+                iter_lines(file, job.file.name.endswith(GZIP_SUFFIX))
+            )
+    except ValidationError as e:
+        job.status, job.errors = ImportJob.Status.FAILED, e.detail
+    except ParseError as e:
+        job.status = ImportJob.Status.FAILED
+        job.errors = {'detail': str(e.detail)}
+    except Exception:
+        logger.exception('Ошибка задачи импорта %s', pk)
+        job.status = ImportJob.Status.FAILED
+        job.errors = {'detail': 'Внутренняя ошибка импорта'}
+    else:
+        job.status = ImportJob.Status.DONE
+        job.created_rows = result.created
+        job.updated_rows = result.updated
+        job.skipped_rows = result.skipped
+    finish_import_job(job)
+    return job
+
+
+def import_job_progress(pk: int) -> Callable[[int], None]:
+    """
+    Parameters
+    ----------
+    pk :
+        pk выполняемой задачи
+
+    Returns
+    -------
+    progress :
+        progress для импорта: кладет кол-во прочитанных строк в кеш и
+        обновляет heartbeat_at, чтобы задачу не отменили как остановленную
+    """
+    key = IMPORT_JOB_PROGRESS_KEY.format(pk=pk)
+
+    def progress(rows: int) -> None:
+        cache.set(key, rows, timeout=IMPORT_JOB_PROGRESS_TIMEOUT)
+        ImportJob.objects.filter(pk=pk).update(heartbeat_at=timezone.now())
+
+    return progress
+
+
+def finish_import_job(job: ImportJob) -> None:
+    """
+    Сохраняет итог задачи с уже выставленным status, удаляет файл,
+    журнал отката и прогресс в кеше
+    """
+    key = IMPORT_JOB_PROGRESS_KEY.format(pk=job.pk)
+    job.rows_done = cache.get(key, 0)
+    job.finished_at = timezone.now()
+    job.file.delete(save=False)
+    with transaction.atomic():
+        # журнал отката нужен, пока задача не завершена
+        job.save()
+        job.undo.all().delete()
+    cache.delete(key)
+
+
+def recover_stale_import_jobs() -> int:
+    """
+    Отменяет задачи, обработчик которых остановился: задача в RUNNING
+    без новых пачек дольше IMPORT_JOB_STALE_TIMEOUT откатывается по
+    своему журналу и завершается с ошибкой
+
+    Returns
+    -------
+    count :
+        кол-во отмененных задач
+    """
+    stale = ImportJob.objects.filter(
+        status=ImportJob.Status.RUNNING,
+        heartbeat_at__lt=timezone.now() - datetime.timedelta(
+            seconds=settings.IMPORT_JOB_STALE_TIMEOUT
+        )
+    )
+    count = 0
+    for job in stale:
+        # свежая отметка забирает задачу: другой обработчик ее пропустит,
+        # а если остановится и этот, задачу заберут снова
+        claimed = ImportJob.objects.filter(
+            pk=job.pk, status=ImportJob.Status.RUNNING,
+            heartbeat_at=job.heartbeat_at
+        ).update(heartbeat_at=timezone.now())
+        if not claimed:
+            continue
+        logger.warning('Отмена остановленной задачи импорта %s', job.pk)
+        if ImportUndo(job).rollback():
+            bump_catalog_version()
+        job.status = ImportJob.Status.FAILED
+        job.errors = {
+            'detail': 'Обработчик задачи остановился, импорт отменен'
+        }
+        job.rows_done = cache.get(IMPORT_JOB_PROGRESS_KEY.format(pk=job.pk), 0)
+        job.finished_at = timezone.now()
+        job.file.delete(save=False)
+        job.save()
+        count += 1
+    return count
+
+
+def run_import_job_in_thread(pk: int) -> None:
+    try:
+        recover_stale_import_jobs()
+        run_import_job(pk)
+    finally:
+        # у потока пула свое подключение к БД
+        close_old_connections()
+
+
+def run_pending_import_jobs(poll_interval: float = None) -> int:
+    """
+    Parameters
+    ----------
+    poll_interval :
+        если задан, ждать новые задачи с этим интервалом в секундах,
+        иначе выйти, когда очередь пуста
+
+    Returns
+    -------
+    count :
+        кол-во выполненных задач. Перед каждым опросом отменяются
+        задачи остановившихся обработчиков
+    """
+    count = 0
+    while True:
+        recover_stale_import_jobs()
+        pks = list(ImportJob.objects.filter(
+            status=ImportJob.Status.PENDING
+        ).order_by('id').values_list('pk', flat=True))
+        for pk in pks:
+            count += run_import_job(pk) is not None
+        if not pks:
+            if poll_interval is None:
+                return count
+            time.sleep(poll_interval)
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from products.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_products
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка каталога товаров в CSV (cp1251) или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', dest='export_format', choices=list(EXPORT_FORMATS),
+            default='csv'
+        )
+        parser.add_argument(
+            '--output', help='файл выгрузки, по умолчанию stdout'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE
+        )
+
+    def handle(self, *args, export_format, output, chunk_size, **options):
+        chunks = export_products(export_format, chunk_size)
+        if output is None:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        with open(output, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Выгрузка записана в {output}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from products.counters import flush_view_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгрузка счетчиков просмотров товаров из Redis в БД,'
+        ' для запуска по расписанию'
+    )
+
+    def handle(self, *args, **options):
+        count = flush_view_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружены счетчики {count} товаров'
+        ))
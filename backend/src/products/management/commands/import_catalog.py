@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.exceptions import ParseError, ValidationError
+
+from products.jobs import IMPORTERS, finish_import_job, import_job_progress
+from products.models import ImportJob
+from products.parallel import SHARD_SIZE, import_file_parallel
+
+
+class Command(BaseCommand):
+    help = (
+        'Импорт CSV (cp1251) с сервера: разбор частями в пуле процессов,'
+        ' запись пачками в одном процессе. Импорт идет задачей: пачки'
+        ' коммитятся по одной и не держат блокировку записи SQLite,'
+        ' при ошибке записанное откатывается по журналу задачи'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл CSV')
+        parser.add_argument(
+            '--kind', choices=ImportJob.Kind.values,
+            default=ImportJob.Kind.CATALOG,
+            help='формат файла, как у импорта через API'
+        )
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help='обновлять существующие вместо ошибки'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='кол-во процессов разбора, по умолчанию по числу ядер'
+        )
+        parser.add_argument(
+            '--shard-size', type=int, default=SHARD_SIZE,
+            help='размер части файла в байтах'
+        )
+
+    def handle(
+            self, *args, path, kind, upsert, workers, shard_size, **options
+    ):
+        now = timezone.now()
+        job = ImportJob.objects.create(
+            kind=kind, upsert=upsert, status=ImportJob.Status.RUNNING,
+            started_at=now, heartbeat_at=now
+        )
+        importer = IMPORTERS[kind](
+            upsert=upsert, progress=import_job_progress(job.pk), job=job
+        )
+        # итог по умолчанию, если импорт прервут
+        job.status = ImportJob.Status.FAILED
+        start = time.perf_counter()
+        try:
+            result = import_file_parallel(
+                path, importer, workers, shard_size
+            )
+        except ParseError as e:
+            job.errors = {'detail': str(e.detail)}
+            raise CommandError(str(e.detail))
+        except ValidationError as e:
+            job.errors = e.detail
+            for line, fields in e.detail.items():
+                for field, messages in fields.items():
+                    for message in messages:
+                        self.stderr.write(f'строка {line}, {field}: {message}')
+            raise CommandError('Импорт отменен: ошибки в файле')
+        else:
+            job.status = ImportJob.Status.DONE
+            job.created_rows = result.created
+            job.updated_rows = result.updated
+            job.skipped_rows = result.skipped
+        finally:
+            finish_import_job(job)
+        elapsed = time.perf_counter() - start
+        rows = result.created + result.updated + result.skipped
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {result.created}, обновлено {result.updated},'
+            f' пропущено {result.skipped} за {elapsed:.1f} с'
+            f' ({rows / elapsed:.0f} строк/с)'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from products.services import send_low_stock_alerts
+
+
+class Command(BaseCommand):
+    help = (
+        'Оповещения о товарах с остатком ниже LOW_STOCK_THRESHOLD,'
+        ' для запуска по расписанию'
+    )
+
+    def handle(self, *args, **options):
+        products = send_low_stock_alerts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Новых заканчивающихся товаров: {len(products)}'
+        ))
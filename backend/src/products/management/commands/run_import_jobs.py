@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from products.jobs import run_pending_import_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполнение фоновых задач импорта из очереди,'
+        ' с --poll работает как постоянный обработчик'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll', type=float, default=None,
+            help='интервал опроса очереди в секундах'
+        )
+
+    def handle(self, *args, **options):
+        count = run_pending_import_jobs(options['poll'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач импорта: {count}'
+        ))
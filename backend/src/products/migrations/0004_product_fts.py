@@ -0,0 +1,18 @@
+from django.db import migrations
+
+from products.fts import (CREATE_FTS_TABLE, CREATE_FTS_TRIGGERS,
+                          DROP_FTS_TABLE, DROP_FTS_TRIGGERS, REBUILD_FTS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_alter_product_created_at_alter_product_price'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_FTS_TABLE + CREATE_FTS_TRIGGERS + REBUILD_FTS,
+            reverse_sql=DROP_FTS_TRIGGERS + DROP_FTS_TABLE
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 19:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+from products.fts import CREATE_FTS_TRIGGERS
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_fts'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=migrations.RunSQL.noop, reverse_sql=CREATE_FTS_TRIGGERS
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата и время изменения'),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            sql=CREATE_FTS_TRIGGERS, reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+from products.fts import CREATE_FTS_TRIGGERS
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=migrations.RunSQL.noop, reverse_sql=CREATE_FTS_TRIGGERS
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50, verbose_name='Модель')),
+                ('object_id', models.IntegerField(verbose_name='id объекта')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата и время удаления')),
+            ],
+            options={
+                'verbose_name': 'Удаленные объекты',
+                'db_table': 'tombstone',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата и время изменения'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата и время изменения'),
+        ),
+        migrations.RunSQL(
+            sql=CREATE_FTS_TRIGGERS, reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_catalog_delta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата и время создания'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['group', 'price'], name='product_group_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['group', 'created_at'], name='product_group_created_idx'),
+        ),
+    ]
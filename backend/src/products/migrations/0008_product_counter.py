@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 19:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCounter',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='products.product', verbose_name='Товар')),
+                ('views', models.PositiveBigIntegerField(db_index=True, default=0, verbose_name='Просмотры')),
+            ],
+            options={
+                'verbose_name': 'Счетчики товаров',
+                'db_table': 'product_counter',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 19:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowStockAlert',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='low_stock_alert', serialize=False, to='products.product', verbose_name='Товар')),
+                ('amount', models.IntegerField(verbose_name='Остаток при оповещении')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время оповещения')),
+            ],
+            options={
+                'verbose_name': 'Оповещения о малом остатке',
+                'db_table': 'low_stock_alert',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('amount__lt', 100)), fields=['amount'], name='product_low_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_low_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=32, null=True, verbose_name='Хеш содержимого'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=32, null=True, verbose_name='Хеш содержимого'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 19:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0010_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('products', 'Товары'), ('groups', 'Группы')], max_length=20, verbose_name='Что импортируется')),
+                ('upsert', models.BooleanField(default=False, verbose_name='Режим upsert')),
+                ('file', models.FileField(null=True, upload_to='imports/', verbose_name='Файл')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=20, verbose_name='Состояние')),
+                ('rows_done', models.IntegerField(default=0, verbose_name='Обработано строк')),
+                ('created_rows', models.IntegerField(default=0, verbose_name='Создано')),
+                ('updated_rows', models.IntegerField(default=0, verbose_name='Обновлено')),
+                ('skipped_rows', models.IntegerField(default=0, verbose_name='Пропущено')),
+                ('errors', models.JSONField(null=True, verbose_name='Ошибки')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время создания')),
+                ('started_at', models.DateTimeField(null=True, verbose_name='Дата и время начала')),
+                ('finished_at', models.DateTimeField(null=True, verbose_name='Дата и время окончания')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задачи импорта',
+                'db_table': 'import_job',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_import_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='kind',
+            field=models.CharField(choices=[('products', 'Товары'), ('groups', 'Группы'), ('catalog', 'Каталог')], max_length=20, verbose_name='Что импортируется'),
+        ),
+    ]
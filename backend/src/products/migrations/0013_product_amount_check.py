@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 20:11
+
+from django.db import migrations, models
+from django.utils import timezone
+
+from products.fts import CREATE_FTS_TRIGGERS
+
+
+def reset_negative_amounts(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Product.objects.filter(amount__lt=0).update(
+        amount=0, updated_at=timezone.now(), content_hash=None
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_import_job_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            reset_negative_amounts, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.RunSQL(
+            sql=migrations.RunSQL.noop, reverse_sql=CREATE_FTS_TRIGGERS
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(check=models.Q(('amount__gte', 0)), name='product_amount_gte_0'),
+        ),
+        migrations.RunSQL(
+            sql=CREATE_FTS_TRIGGERS, reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
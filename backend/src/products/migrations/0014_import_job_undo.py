@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 21:09
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_product_amount_check'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(null=True, verbose_name='Последняя пачка'),
+        ),
+        migrations.CreateModel(
+            name='ImportJobUndo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50, verbose_name='Модель')),
+                ('field', models.CharField(max_length=50, verbose_name='Ключевое поле')),
+                ('created', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Ключи и хеши созданных строк')),
+                ('updated', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Ключи, хеши и прежние значения обновленных строк')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='undo', to='products.importjob', verbose_name='Задача')),
+            ],
+            options={
+                'verbose_name': 'Журнал отката импорта',
+                'db_table': 'import_job_undo',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
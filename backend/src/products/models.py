@@ -1,8 +1,31 @@
+import hashlib
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
-from django.db.models import CASCADE, SET_NULL, QuerySet
+from django.db.models import CASCADE, SET_NULL, Q, QuerySet
 
 from users.models import User
 
+# верхняя граница частичного индекса по остаткам, порог
+# LOW_STOCK_THRESHOLD из настроек не должен ее превышать
+LOW_STOCK_INDEX_LIMIT = 100
+PRICE_EXPONENT = Decimal('0.01')
+
+
+def content_hash(*values) -> str:
+    """
+    Returns
+    -------
+    hash :
+        хеш значений колонок строки импорта, None и пустая строка
+        не различаются
+    """
+    content = '\x1f'.join(
+        '' if value is None else str(value) for value in values
+    )
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
 
 class Product(models.Model):
     article = models.CharField(
@@ -12,7 +35,8 @@ class Product(models.Model):
     name = models.CharField(max_length=150, verbose_name='Название')
     amount = models.IntegerField(verbose_name='Кол-во')
     price = models.DecimalField(
-        max_digits=10, decimal_places=2, verbose_name='Цена'
+        max_digits=10, decimal_places=2, verbose_name='Цена',
+        db_index=True
     )
     group = models.ForeignKey(
         'Group', related_name='products', on_delete=SET_NULL,
@@ -20,13 +44,53 @@ class Product(models.Model):
     )
     created_at = models.DateTimeField(
         verbose_name='Дата и время создания',
-        auto_now_add=True
+        auto_now_add=True, db_index=True
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата и время изменения',
+        auto_now=True, db_index=True
+    )
+    content_hash = models.CharField(
+        max_length=32, null=True, editable=False,
+        verbose_name='Хеш содержимого'
     )
 
     class Meta:
         db_table = 'product'
         verbose_name = 'Товары'
         ordering = ['-id']
+        constraints = [
+            models.CheckConstraint(
+                check=Q(amount__gte=0), name='product_amount_gte_0'
+            ),
+        ]
+        indexes = [
+            # фильтр по группе с сортировкой по цене или дате, pk -
+            # второй ключ keyset-сортировки (rowid входит в индекс)
+            models.Index(
+                fields=['group', 'price'], name='product_group_price_idx'
+            ),
+            models.Index(
+                fields=['group', 'created_at'],
+                name='product_group_created_idx'
+            ),
+            models.Index(
+                fields=['amount'], name='product_low_stock_idx',
+                condition=Q(amount__lt=LOW_STOCK_INDEX_LIMIT)
+            ),
+        ]
+
+    def get_content_hash(self) -> str:
+        return content_hash(
+            self.article, self.name, self.amount,
+            Decimal(str(self.price)).quantize(PRICE_EXPONENT), self.group_id
+        )
+
+    def save(self, *args, **kwargs):
+        # импорт пропускает строки с тем же хешем, поэтому хеш
+        # пересчитывается при любом сохранении товара
+        self.content_hash = self.get_content_hash()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return (
@@ -51,12 +115,27 @@ class Group(models.Model):
         verbose_name='Дата и время создания',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата и время изменения',
+        auto_now=True, db_index=True
+    )
+    content_hash = models.CharField(
+        max_length=32, null=True, editable=False,
+        verbose_name='Хеш содержимого'
+    )
 
     class Meta:
         db_table = 'group'
         verbose_name = 'Группы товаров'
         ordering = ['-id']
 
+    def get_content_hash(self) -> str:
+        return content_hash(self.name, self.description)
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.get_content_hash()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return (
             f'id {self.pk}'
@@ -65,6 +144,147 @@ class Group(models.Model):
         )
 
 
+class ProductCounter(models.Model):
+    """Счетчики товара, выгружаются из буфера products.counters"""
+    product = models.OneToOneField(
+        Product, related_name='counter', on_delete=CASCADE,
+        primary_key=True, verbose_name='Товар'
+    )
+    views = models.PositiveBigIntegerField(
+        default=0, db_index=True, verbose_name='Просмотры'
+    )
+
+    class Meta:
+        db_table = 'product_counter'
+        verbose_name = 'Счетчики товаров'
+
+    def __str__(self):
+        return f'id товара {self.product_id}, просмотры {self.views}'
+
+
+class LowStockAlert(models.Model):
+    """Товар, по которому уже отправлено оповещение о малом остатке"""
+    product = models.OneToOneField(
+        Product, related_name='low_stock_alert', on_delete=CASCADE,
+        primary_key=True, verbose_name='Товар'
+    )
+    amount = models.IntegerField(verbose_name='Остаток при оповещении')
+    created_at = models.DateTimeField(
+        verbose_name='Дата и время оповещения',
+        auto_now_add=True
+    )
+
+    class Meta:
+        db_table = 'low_stock_alert'
+        verbose_name = 'Оповещения о малом остатке'
+
+    def __str__(self):
+        return f'id товара {self.product_id}, остаток {self.amount}'
+
+
+class Tombstone(models.Model):
+    """Запись об удаленном объекте каталога для дельта-синхронизации"""
+    model = models.CharField(max_length=50, verbose_name='Модель')
+    object_id = models.IntegerField(verbose_name='id объекта')
+    deleted_at = models.DateTimeField(
+        verbose_name='Дата и время удаления',
+        auto_now_add=True, db_index=True
+    )
+
+    class Meta:
+        db_table = 'tombstone'
+        verbose_name = 'Удаленные объекты'
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'id {self.pk}, {self.model} {self.object_id}'
+
+
+class ImportJob(models.Model):
+    """Фоновый импорт CSV: файл, состояние и итог обработки"""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Завершен'
+        FAILED = 'failed', 'Ошибка'
+
+    class Kind(models.TextChoices):
+        PRODUCTS = 'products', 'Товары'
+        GROUPS = 'groups', 'Группы'
+        CATALOG = 'catalog', 'Каталог'
+
+    kind = models.CharField(
+        max_length=20, choices=Kind.choices, verbose_name='Что импортируется'
+    )
+    upsert = models.BooleanField(default=False, verbose_name='Режим upsert')
+    file = models.FileField(
+        upload_to='imports/', null=True, verbose_name='Файл'
+    )
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING,
+        db_index=True, verbose_name='Состояние'
+    )
+    rows_done = models.IntegerField(
+        default=0, verbose_name='Обработано строк'
+    )
+    created_rows = models.IntegerField(default=0, verbose_name='Создано')
+    updated_rows = models.IntegerField(default=0, verbose_name='Обновлено')
+    skipped_rows = models.IntegerField(default=0, verbose_name='Пропущено')
+    errors = models.JSONField(null=True, verbose_name='Ошибки')
+    user = models.ForeignKey(
+        User, related_name='import_jobs', on_delete=SET_NULL, null=True,
+        verbose_name='Пользователь'
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата и время создания', auto_now_add=True
+    )
+    started_at = models.DateTimeField(
+        null=True, verbose_name='Дата и время начала'
+    )
+    finished_at = models.DateTimeField(
+        null=True, verbose_name='Дата и время окончания'
+    )
+    heartbeat_at = models.DateTimeField(
+        null=True, verbose_name='Последняя пачка'
+    )
+
+    class Meta:
+        db_table = 'import_job'
+        verbose_name = 'Задачи импорта'
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'id {self.pk}, {self.kind} {self.status}'
+
+
+class ImportJobUndo(models.Model):
+    """
+    Запись журнала отката фоновой задачи импорта: что изменила одна
+    пачка. Пишется в транзакции пачки и удаляется вместе с ее откатом
+    или после завершения задачи
+    """
+    job = models.ForeignKey(
+        ImportJob, related_name='undo', on_delete=CASCADE,
+        verbose_name='Задача'
+    )
+    model = models.CharField(max_length=50, verbose_name='Модель')
+    field = models.CharField(max_length=50, verbose_name='Ключевое поле')
+    created = models.JSONField(
+        encoder=DjangoJSONEncoder,
+        verbose_name='Ключи и хеши созданных строк'
+    )
+    updated = models.JSONField(
+        encoder=DjangoJSONEncoder,
+        verbose_name='Ключи, хеши и прежние значения обновленных строк'
+    )
+
+    class Meta:
+        db_table = 'import_job_undo'
+        verbose_name = 'Журнал отката импорта'
+        ordering = ['-id']
+
+
 class Cart(models.Model):
     product = models.ForeignKey(
         Product, related_name='cart', on_delete=SET_NULL, null=True,
@@ -109,7 +329,7 @@ class Order(models.Model):
     is_paid = models.BooleanField(default=False)
     created_at = models.DateTimeField(
         verbose_name='Дата и время создания',
-        auto_now_add=True
+        auto_now_add=True, db_index=True
     )
 
     @property
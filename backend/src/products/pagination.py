@@ -0,0 +1,263 @@
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from urllib import parse
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+Cursor = namedtuple('Cursor', ('reverse', 'position', 'pk'))
+# pk вне 64-битного INTEGER SQLite не может даже сравнить
+PK_LIMIT = 2 ** 63
+
+
+def _reverse_ordering(ordering: tuple) -> tuple:
+    return tuple(
+        field[1:] if field.startswith('-') else f'-{field}'
+        for field in ordering
+    )
+
+
+def keyset_ordering(field: str) -> tuple:
+    """
+    Parameters
+    ----------
+    field :
+        поле сортировки, например -price
+
+    Returns
+    -------
+    ordering :
+        поле сортировки и pk с тем же направлением
+    """
+    if field.lstrip('-') == 'id':
+        return (field,)
+    return field, '-id' if field.startswith('-') else 'id'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация без COUNT(*) и OFFSET.
+
+    Позиция курсора - значение поля сортировки и pk последней строки,
+    поэтому любая страница стоит столько же, сколько первая.
+    Поле сортировки выбирается параметром ordering из
+    view.cursor_ordering_fields, первое значение - сортировка по умолчанию.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    ordering_fields = ('-id',)
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is not None:
+            self.cursor = self.cursor._replace(
+                position=self.clean_position(queryset, self.cursor)
+            )
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        ordering = (
+            _reverse_ordering(self.ordering) if reverse else self.ordering
+        )
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None and self.cursor.pk is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(ordering, self.cursor)
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def get_ordering(self, request, view=None) -> tuple:
+        """
+        Returns
+        -------
+        ordering :
+            поле сортировки и pk с тем же направлением
+        """
+        fields = getattr(view, 'cursor_ordering_fields', self.ordering_fields)
+        field = request.query_params.get(self.ordering_param)
+        if field not in fields:
+            field = fields[0]
+        return keyset_ordering(field)
+
+    @staticmethod
+    def get_keyset_filter(ordering: tuple, cursor: Cursor) -> Q:
+        """
+        Parameters
+        ----------
+        ordering :
+            текущая сортировка запроса
+        cursor :
+            декодированный курсор
+        Returns
+        -------
+        Q :
+            условие "строго после курсора", которое индекс по полю
+            сортировки отрабатывает как range scan
+        """
+        pk_lookup = 'id__lt' if ordering[-1].startswith('-') else 'id__gt'
+        if len(ordering) == 1:
+            return Q(**{pk_lookup: cursor.pk})
+        field = ordering[0].lstrip('-')
+        if ordering[0].startswith('-'):
+            bound, strict = f'{field}__lte', f'{field}__lt'
+        else:
+            bound, strict = f'{field}__gte', f'{field}__gt'
+        return Q(**{bound: cursor.position}) & (
+            Q(**{strict: cursor.position}) | Q(**{pk_lookup: cursor.pk})
+        )
+
+    def clean_position(self, queryset: QuerySet, cursor: Cursor):
+        """
+        Returns
+        -------
+        position :
+            позиция курсора значением поля сортировки или None, если
+            сортировка только по pk
+
+        Raises
+        -------
+        NotFound
+            курсор от другой сортировки или позиция подделана
+        """
+        if len(self.ordering) == 1:
+            return None
+        field = queryset.model._meta.get_field(self.ordering[0].lstrip('-'))
+        try:
+            position = field.to_python(cursor.position)
+        except DjangoValidationError:
+            position = None
+        if position is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def decode_cursor(self, request) -> Cursor | None:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = tokens.get('p', [None])[0]
+            pk = int(tokens['i'][0])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not -PK_LIMIT <= pk < PK_LIMIT:
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(reverse=reverse, position=position, pk=pk)
+
+    def encode_cursor(self, cursor: Cursor) -> str:
+        tokens = {'i': cursor.pk}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        if cursor.position is not None:
+            tokens['p'] = cursor.position
+        querystring = parse.urlencode(tokens)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def get_position(self, instance) -> tuple:
+        if isinstance(instance, dict):
+            values = instance
+        else:
+            values = instance.__dict__
+        position = None
+        if len(self.ordering) > 1:
+            position = str(values[self.ordering[0].lstrip('-')])
+        return position, values['id']
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next or not self.page:
+            return None
+        position, pk = self.get_position(self.page[-1])
+        return self.encode_cursor(
+            Cursor(reverse=False, position=position, pk=pk)
+        )
+
+    def get_previous_link(self) -> str | None:
+        if not self.has_previous or not self.page:
+            return None
+        position, pk = self.get_position(self.page[0])
+        return self.encode_cursor(
+            Cursor(reverse=True, position=position, pk=pk)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class CursorModePagination(PageNumberPagination):
+    """
+    Постраничная пагинация по умолчанию, курсорная - если в запросе
+    передан параметр cursor (для первой страницы достаточно ?cursor=).
+    """
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        cursor_param = self.keyset_pagination_class.cursor_query_param
+        if cursor_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = self.keyset_pagination_class()
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        keyset = self.keyset_pagination_class
+        ordering_fields = getattr(
+            view, 'cursor_ordering_fields', keyset.ordering_fields
+        )
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': keyset.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Курсор страницы (пустой - первая страница)',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': keyset.ordering_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Сортировка',
+                'schema': {'type': 'string', 'enum': list(ordering_fields)},
+            },
+        ]
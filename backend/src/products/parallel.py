@@ -0,0 +1,182 @@
+import csv
+import io
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator
+
+from rest_framework.exceptions import ParseError
+
+from products.importer import IMPORT_ENCODING, CSVImporter, ImportResult
+
+SHARD_SIZE = 4 * 1024 * 1024
+
+
+def shard_offsets(
+        mm: mmap.mmap, start: int, shard_size: int
+) -> Iterator[tuple[int, int]]:
+    """
+    Parameters
+    ----------
+    mm :
+        файл, отображенный в память
+    start :
+        смещение первой строки данных
+    shard_size :
+        примерный размер части в байтах
+
+    Returns
+    -------
+    offsets :
+        границы частей [start, end), каждая часть заканчивается
+        переводом строки или концом файла
+    """
+    size = len(mm)
+    while start < size:
+        end = start + shard_size
+        if end >= size:
+            end = size
+        else:
+            newline = mm.find(b'\n', end - 1)
+            end = size if newline == -1 else newline + 1
+        yield start, end
+        start = end
+
+
+def parse_shard(
+        importer_class: type[CSVImporter], path: str, start: int, end: int,
+        fieldnames: list[str]
+) -> tuple[int, list, list, bool]:
+    """
+    Разбор части файла в процессе пула, без запросов к БД.
+
+    Returns
+    -------
+    lines, rows, errors, closed :
+        кол-во строк части, проверенные строки и ошибки, номера строк
+        считаются от начала части. closed ложно, если часть кончается
+        внутри значения в кавычках: граница части пришлась на перевод
+        строки внутри значения
+    """
+    with open(path, 'rb') as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        text = mm[start:end].decode(IMPORT_ENCODING)
+    # кавычки в CSV идут парами: открывающая и закрывающая или
+    # удвоенная внутри значения, поэтому в целых записях их четно
+    closed = not text.count('"') % 2
+    rows, errors = [], []
+    # newline='' сохраняет переводы строк внутри значений, как при
+    # последовательном чтении файла
+    reader = csv.DictReader(io.StringIO(text, newline=''), fieldnames)
+    for row in reader:
+        data, row_errors = importer_class.convert_row(reader.line_num, row)
+        if row_errors:
+            errors.extend(row_errors)
+        else:
+            rows.append((reader.line_num, data))
+    lines = text.count('\n') + (not text.endswith('\n'))
+    return lines, rows, errors, closed
+
+
+def read_file_parallel(
+        path: str, importer: CSVImporter, workers: int = None,
+        shard_size: int = SHARD_SIZE
+) -> Iterator[tuple[int, dict]]:
+    """
+    Parameters
+    ----------
+    path :
+        файл CSV в кодировке IMPORT_ENCODING. Части режутся по
+        переводам строк, поэтому значение с переводом строки на
+        границе части не разбирается, а дает ParseError
+    importer :
+        импорт, в errors которого собираются ошибки строк
+    workers :
+        кол-во процессов разбора, по умолчанию по числу ядер
+    shard_size :
+        примерный размер части файла в байтах
+
+    Returns
+    -------
+    rows :
+        номера строк файла и проверенные значения в порядке файла, как
+        CSVImporter.read. Части разбираются процессами пула, а в работе
+        одновременно не больше двух частей на процесс, поэтому память
+        не зависит от размера файла
+
+    Raises
+    -------
+    ParseError
+        в заголовке нет обязательных колонок или часть файла кончается
+        внутри значения в кавычках
+    """
+    with open(path, 'rb') as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        header_end = mm.find(b'\n') + 1 or len(mm)
+        fieldnames = next(
+            csv.reader([mm[:header_end].decode(IMPORT_ENCODING)]), []
+        )
+        importer.check_header(fieldnames)
+        shards = shard_offsets(mm, header_end, shard_size)
+        workers = workers or os.cpu_count() or 1
+        # процессы создаются fork: модели и правила проверки уже
+        # загружены, а подключение к БД дочерним процессам не нужно
+        with ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('fork')
+        ) as pool:
+            def submit(shard):
+                return pool.submit(
+                    parse_shard, type(importer), path, *shard, fieldnames
+                )
+
+            pending = deque(map(submit, islice(shards, workers * 2)))
+            # номер строки перед частью, первая строка - заголовок
+            offset = 1
+            while pending:
+                lines, rows, errors, closed = pending.popleft().result()
+                if not closed:
+                    for future in pending:
+                        future.cancel()
+                    raise ParseError(
+                        f'Строка {offset + lines}: кавычки значения не'
+                        ' закрыты до конца части файла, значения с'
+                        ' переводом строки импортируйте через API'
+                    )
+                pending.extend(map(submit, islice(shards, 1)))
+                importer.errors.extend(
+                    (offset + line, field, message)
+                    for line, field, message in errors
+                )
+                for line, data in rows:
+                    yield offset + line, data
+                offset += lines
+                if importer.failed:
+                    for future in pending:
+                        future.cancel()
+                    return
+
+
+def import_file_parallel(
+        path: str, importer: CSVImporter, workers: int = None,
+        shard_size: int = SHARD_SIZE
+) -> ImportResult:
+    """
+    Импорт файла на сервере: разбор и проверка колонок идут в пуле
+    процессов, а запись - в текущем процессе пачками bulk_create,
+    так как писать в SQLite может только одно подключение. Импорт без
+    задачи пишет все в одной транзакции и держит блокировку записи
+    до конца файла, с задачей пачки коммитятся по одной.
+
+    Returns
+    -------
+    result :
+        см. CSVImporter.run
+    """
+    return importer.import_rows(
+        read_file_parallel(path, importer, workers, shard_size)
+    )
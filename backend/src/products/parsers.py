@@ -0,0 +1,117 @@
+import gzip
+import zlib
+from typing import BinaryIO, Iterator
+
+from django.utils.http import parse_header_parameters
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+UPLOAD_NAME = 'import.csv'
+GZIP_SUFFIX = '.gz'
+GZIP_ERRORS = (gzip.BadGzipFile, EOFError, zlib.error)
+
+
+def open_csv(file: BinaryIO, gzipped: bool) -> BinaryIO:
+    """
+    Returns
+    -------
+    file :
+        file или распаковка gzip поверх него на лету
+    """
+    return gzip.GzipFile(fileobj=file, mode='rb') if gzipped else file
+
+
+def iter_lines(file: BinaryIO, gzipped: bool) -> Iterator[bytes]:
+    """
+    Parameters
+    ----------
+    file :
+        поток с CSV, читается построчно
+    gzipped :
+        поток сжат gzip
+
+    Returns
+    -------
+    lines :
+        строки CSV
+
+    Raises
+    -------
+    ParseError
+        поврежденный или обрезанный архив gzip
+    """
+    try:
+        yield from open_csv(file, gzipped)
+    except GZIP_ERRORS:
+        raise ParseError('Поврежденный архив gzip')
+
+
+class CSVUpload:
+    """
+    CSV в теле запроса, которое еще не прочитано.
+
+    Строки читаются из потока запроса при обходе, поэтому импорт идет
+    параллельно с приемом тела, а в памяти нет ничего, кроме буфера
+    текущей строки. Обойти можно только один раз.
+    """
+    __slots__ = ('stream', 'name', 'size', 'gzipped')
+
+    def __init__(
+            self, stream: BinaryIO, name: str, size: int | None,
+            gzipped: bool
+    ):
+        """
+        Parameters
+        ----------
+        stream :
+            поток тела запроса
+        name :
+            имя файла, у сжатых с суффиксом .gz
+        size :
+            размер тела из Content-Length (сжатого, если gzip),
+            None если неизвестен
+        gzipped :
+            тело сжато gzip
+        """
+        self.stream = stream
+        self.name = name
+        self.size = size
+        self.gzipped = gzipped
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter_lines(self.stream, self.gzipped)
+
+
+class StreamingCSVParser(BaseParser):
+    """
+    Тело запроса как CSVUpload без сохранения во временный файл.
+
+    Сжатие gzip определяется по Content-Encoding: gzip, типу контента
+    application/gzip или имени файла *.gz из Content-Disposition.
+    """
+    media_type = 'text/csv'
+    gzipped = False
+
+    @staticmethod
+    def get_filename(meta: dict) -> str:
+        _, params = parse_header_parameters(
+            meta.get('HTTP_CONTENT_DISPOSITION', '')
+        )
+        return params.get('filename') or UPLOAD_NAME
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        meta = parser_context['request'].META
+        name = self.get_filename(meta)
+        gzipped = (
+            self.gzipped or name.endswith(GZIP_SUFFIX)
+            or meta.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip'
+        )
+        if gzipped and not name.endswith(GZIP_SUFFIX):
+            name += GZIP_SUFFIX
+        size = int(meta.get('CONTENT_LENGTH') or 0) or None
+        return CSVUpload(stream, name, size, gzipped)
+
+
+class GzipCSVParser(StreamingCSVParser):
+    media_type = 'application/gzip'
+    gzipped = True
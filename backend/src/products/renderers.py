@@ -0,0 +1,11 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    Каталог колонками: {"columns": [...], "values": [[...], ...]},
+    values[i] - значения колонки columns[i] по всем строкам.
+    Выбирается заголовком Accept или параметром ?format=columnar.
+    """
+    media_type = 'application/vnd.skillbox.columnar+json'
+    format = 'columnar'
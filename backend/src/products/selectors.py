@@ -1,7 +1,13 @@
-from django.db.models import DateField, F, QuerySet, Sum
+import datetime
+import re
+from typing import Sequence
+
+from django.conf import settings
+from django.db.models import DateField, DecimalField, F, Q, QuerySet, Sum
 from django.db.models.functions import Cast
 
-from products.models import Order
+from products.importer import INTEGER_LIMIT
+from products.models import LOW_STOCK_INDEX_LIMIT, Order, Product
 
 
 def orders_report(queryset: QuerySet[Order]) -> QuerySet[Order]:
@@ -16,9 +22,188 @@ def orders_report(queryset: QuerySet[Order]) -> QuerySet[Order]:
     queryset :
         аннотированный кверист заказов QuerySet[Order]
     """
+    # заказы отбираются подзапросом по их собственным индексам (pk, дата),
+    # иначе ради GROUP BY по pk SQLite проходит всю таблицу заказов
+    queryset = Order.objects.filter(pk__in=queryset.values('pk'))
     return queryset.annotate(
         date=Cast('created_at', DateField())
     ).values('pk', 'date').annotate(
         total_sum=Sum(
             F('products__price') * F('products__amount'))
     )
+
+
+def build_fts_query(search: str) -> str:
+    """
+    Parameters
+    ----------
+    search :
+        поисковая строка пользователя
+
+    Returns
+    -------
+    query :
+        выражение FTS5 MATCH: все слова строки как префиксы,
+        пустая строка если слов нет
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', search))
+
+
+def search_products(
+        queryset: QuerySet[Product], search: str
+) -> QuerySet[Product]:
+    """
+    Parameters
+    ----------
+    queryset :
+        кверист товаров QuerySet[Product]
+    search :
+        поисковая строка по названию и артикулу
+
+    Returns
+    -------
+    queryset :
+        товары из индекса product_fts, отсортированные по bm25
+    """
+    query = build_fts_query(search)
+    if not query:
+        return queryset.none()
+    return queryset.extra(
+        tables=['product_fts'],
+        where=['product_fts.rowid = product.id', 'product_fts MATCH %s'],
+        params=[query],
+        select={'rank': 'bm25(product_fts)'},
+        order_by=['rank'],
+    )
+
+
+def price_range_q(price_min=None, price_max=None) -> Q:
+    """
+    Returns
+    -------
+    Q :
+        условие на цену в границах [price_min, price_max]
+    """
+    q = Q()
+    if price_min is not None:
+        q &= Q(price__gte=price_min)
+    if price_max is not None:
+        q &= Q(price__lte=price_max)
+    return q
+
+
+def filter_products(
+        queryset: QuerySet[Product], name: str = None, search: str = None,
+        group: Sequence[int] = None, price_min=None, price_max=None,
+        in_stock: bool = None
+) -> QuerySet[Product]:
+    """
+    Parameters
+    ----------
+    queryset :
+        кверист товаров QuerySet[Product]
+    name :
+        вхождение в название без учета регистра
+    search :
+        полнотекстовый поиск по названию и артикулу
+    group :
+        pk групп, товар должен входить в одну из них
+    price_min, price_max :
+        границы цены включительно
+    in_stock :
+        True - только в наличии, False - только отсутствующие
+
+    Returns
+    -------
+    queryset :
+        отфильтрованный кверисет, None в параметре - фильтра нет
+    """
+    if name:
+        queryset = queryset.filter(name__icontains=name)
+    if group is not None:
+        queryset = queryset.filter(group_id__in=group)
+    queryset = queryset.filter(price_range_q(price_min, price_max))
+    if in_stock is not None:
+        stock = Q(amount__gt=0)
+        queryset = queryset.filter(stock if in_stock else ~stock)
+    if search:
+        queryset = search_products(queryset, search)
+    return queryset
+
+
+def low_stock_products(
+        queryset: QuerySet[Product], threshold: int = None
+) -> QuerySet[Product]:
+    """
+    Parameters
+    ----------
+    queryset :
+        кверист товаров QuerySet[Product]
+    threshold :
+        остаток, ниже которого товар заканчивается,
+        по умолчанию LOW_STOCK_THRESHOLD
+
+    Returns
+    -------
+    queryset :
+        заканчивающиеся товары по возрастанию остатка
+    """
+    if threshold is None:
+        threshold = settings.LOW_STOCK_THRESHOLD
+    if threshold <= LOW_STOCK_INDEX_LIMIT:
+        # условие частичного индекса повторяется явно, иначе SQLite
+        # не сможет доказать, что индекс покрывает запрос
+        queryset = queryset.filter(amount__lt=LOW_STOCK_INDEX_LIMIT)
+    return queryset.filter(amount__lt=threshold).order_by('amount', 'id')
+
+
+def get_product_updated_at(pk) -> datetime.datetime | None:
+    """
+    Parameters
+    ----------
+    pk :
+        pk товара из url
+
+    Returns
+    -------
+    updated_at :
+        дата изменения товара или None, если товара нет
+    """
+    try:
+        pk = int(pk)
+    except ValueError:
+        return None
+    # pk вне диапазона INTEGER sqlite не найти, а драйвер на нем падает
+    if not 0 < pk < INTEGER_LIMIT:
+        return None
+    return Product.objects.filter(pk=pk).values_list(
+        'updated_at', flat=True
+    ).first()
+
+
+def columnar_values(queryset: QuerySet, fields: dict) -> dict:
+    """
+    Parameters
+    ----------
+    queryset :
+        кверисет в порядке выдачи
+    fields :
+        поля сериализатора по именам, источники - поля модели
+
+    Returns
+    -------
+    columns :
+        имена колонок и списки значений по колонкам из values_list без
+        создания экземпляров модели. Decimal отдается строкой, как в
+        сериализаторе
+    """
+    opts = queryset.model._meta
+    names = list(fields)
+    sources = [field.source for field in fields.values()]
+    columns = list(zip(*queryset.values_list(*sources))) or [()] * len(names)
+    values = []
+    for source, column in zip(sources, columns):
+        if isinstance(opts.get_field(source), DecimalField):
+            column = map(str, column)
+        values.append(list(column))
+    return {'columns': names, 'values': values}
@@ -1,31 +1,180 @@
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
-from products.models import Cart, Group, Order, Product
+from products.cache import bump_stock_version
+from products.importer import INTEGER_LIMIT
+from products.jobs import get_progress, get_throughput
+from products.models import Cart, Group, ImportJob, Order, Product
+from products.services import take_product_amount
+from services.fieldsets import SparseFieldsetSerializerMixin
 
+BULK_LIMIT = 100
 
-class FileSerializer(serializers.Serializer):
-    file = serializers.FileField(required=True)
 
-    @staticmethod
-    def validate_file(value):
-        if not value.content_type == 'text/csv':
-            raise serializers.ValidationError('Ожидался тип контента text/csv')
+def pk_field() -> serializers.IntegerField:
+    """
+    Returns
+    -------
+    field :
+        pk в пределах 64-битного INTEGER, большие числа SQLite не может
+        даже сравнить
+    """
+    return serializers.IntegerField(min_value=1, max_value=INTEGER_LIMIT - 1)
+
+
+@extend_schema_field({'oneOf': [{'type': 'integer'}, {'type': 'string'}]})
+class BulkKeyField(serializers.Field):
+    """Ключ товара из запроса bulk: pk числом или артикул строкой"""
+
+    def to_representation(self, value):
         return value
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ImportModeSerializer(serializers.Serializer):
+    mode = serializers.ChoiceField(
+        choices=(
+            ('insert', 'только новые, существующие - ошибка'),
+            ('upsert', 'новые создаются, существующие обновляются'),
+        ),
+        default='insert', required=False
+    )
+    background = serializers.BooleanField(
+        required=False, allow_null=True, default=None,
+        help_text='true - фоновая задача с ответом 202, false - импорт в'
+                  ' запросе, по умолчанию в фоне файлы больше'
+                  ' IMPORT_SYNC_MAX_SIZE'
+    )
+
+    @property
+    def upsert(self) -> bool:
+        return self.validated_data['mode'] == 'upsert'
+
+    def is_background(self, file) -> bool:
+        background = self.validated_data['background']
+        if background is None:
+            # размер тела без Content-Length не известен заранее
+            return file.size is None or (
+                file.size > settings.IMPORT_SYNC_MAX_SIZE
+            )
+        return background
+
+
+class ImportResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    updated = serializers.IntegerField()
+    skipped = serializers.IntegerField()
+
+
+class CatalogImportResultSerializer(ImportResultSerializer):
+    groups_created = serializers.IntegerField()
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_done = serializers.SerializerMethodField()
+    throughput = serializers.SerializerMethodField(
+        help_text='строк в секунду'
+    )
+
+    class Meta:
+        model = ImportJob
+        exclude = ('file', 'user')
+
+    @staticmethod
+    def get_rows_done(obj) -> int:
+        return get_progress(obj)
+
+    @staticmethod
+    def get_throughput(obj) -> float | None:
+        return get_throughput(obj)
+
+
+class ProductSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     group_id = serializers.IntegerField()
 
     class Meta:
         model = Product
-        exclude = ('group',)
+        exclude = ('group', 'content_hash')
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    name = serializers.CharField(required=False)
+    search = serializers.CharField(required=False)
+    group = serializers.ListField(child=pk_field(), required=False)
+    price_min = serializers.DecimalField(
+        max_digits=10, decimal_places=2, required=False
+    )
+    price_max = serializers.DecimalField(
+        max_digits=10, decimal_places=2, required=False
+    )
+    in_stock = serializers.BooleanField(required=False)
+
+    @classmethod
+    def from_query_params(cls, query_params) -> 'ProductFilterSerializer':
+        """
+        Parameters
+        ----------
+        query_params :
+            параметры запроса, group можно повторять или
+            перечислять через запятую
+        """
+        data = {
+            key: query_params[key] for key in cls._declared_fields
+            if key != 'group' and query_params.get(key)
+        }
+        groups = [
+            group for values in query_params.getlist('group')
+            for group in values.split(',') if group
+        ]
+        if groups:
+            data['group'] = groups
+        return cls(data=data)
+
+
+class ProductBulkSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=pk_field(), required=False,
+        min_length=1, max_length=BULK_LIMIT
+    )
+    article = serializers.ListField(
+        child=serializers.CharField(max_length=150), required=False,
+        min_length=1, max_length=BULK_LIMIT
+    )
+
+    def validate(self, attrs):
+        if len(attrs) != 1:
+            raise serializers.ValidationError(
+                'Нужно передать ровно один из параметров ids или article'
+            )
+        return attrs
+
+    @property
+    def lookup(self) -> tuple[str, list]:
+        """
+        Returns
+        -------
+        lookup :
+            поле товара и список значений в порядке запроса
+        """
+        if 'ids' in self.validated_data:
+            return 'id', self.validated_data['ids']
+        return 'article', self.validated_data['article']
+
+
+class ProductBulkResultSerializer(serializers.Serializer):
+    results = ProductSerializer(many=True, allow_null=True)
+    missing = serializers.ListField(child=BulkKeyField())
 
 
 class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
-        fields = '__all__'
+        exclude = ('content_hash',)
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -39,42 +188,42 @@ class CartSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Кол-во товаров не может быть меньше 1'
             )
-        return value
-
-    @staticmethod
-    def check_amount(amount: int):
-        if amount <= 0:
+        if value >= INTEGER_LIMIT:
             raise serializers.ValidationError(
-                'Нельзя добавить товар не в наличии'
+                'Кол-во товаров слишком большое'
             )
+        return value
 
     @transaction.atomic
     def create(self, validated_data):
         user = validated_data.get('user')
         product = validated_data.get('product')
         amount = validated_data.get('amount')
-        cart = self.Meta.model.objects.select_for_update().filter(
-            user=user, product=product
+        transaction.on_commit(lambda: bump_stock_version([product.pk]))
+        carts = self.Meta.model.objects.filter(user=user, product=product)
+        # разница с корзиной считается в самом UPDATE: запись идет первой
+        # в транзакции, и SQLite не повышает разделяемую блокировку
+        # чтения до записи, на чем параллельные запросы взаимно ждут
+        in_cart = Coalesce(
+            Subquery(carts.order_by('pk').values('amount')[:1]), 0
         )
-        if cart.exists():
-            cart = cart.first()
-            diff_amount = amount - cart.amount
-            cart.amount = amount
-            product.amount -= diff_amount
-            self.check_amount(product.amount)
-            product.save()
-            cart.save()
-        else:
-            product.amount -= amount
-            self.check_amount(product.amount)
-            product.save()
+        if not take_product_amount(product.pk, amount - in_cart):
+            raise serializers.ValidationError(
+                'Нельзя добавить товар не в наличии'
+            )
+        cart = carts.first()
+        if cart is None:
             return Cart.objects.create(
                 user=user, amount=amount, product=product
             )
+        cart.amount = amount
+        cart.save(update_fields=['amount'])
         return cart
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     total_price = serializers.SerializerMethodField()
 
     class Meta:
@@ -1,70 +1,161 @@
-import codecs
-import csv
+import logging
+from typing import Iterable
 
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.conf import settings
 from django.db import transaction
-from django.db.models import QuerySet
-from rest_framework.exceptions import APIException, ParseError
+from django.db.models import Expression, F, QuerySet
+from django.utils import timezone
 
-from products.models import Cart, Group, Order, Product
-from products.serializers import GroupSerializer, ProductSerializer
+from products.importer import (CatalogImporter, CatalogImportResult,
+                               GroupImporter, ImportResult, ProductImporter)
+from products.models import Cart, LowStockAlert, Order, Product, Tombstone
+from products.selectors import low_stock_products
 
+logger = logging.getLogger(__name__)
 
-def import_products_csv(file: InMemoryUploadedFile) -> None:
+
+def import_products_csv(
+        file: Iterable[bytes], upsert: bool = False
+) -> ImportResult:
+    """
+    Parameters
+    ----------
+    file :
+        строки файла CSV, например CSVUpload из тела запроса
+    upsert :
+        обновлять существующие по article вместо ошибки
+
+    Returns
+    -------
+    result :
+        кол-во созданных, обновленных и пропущенных без изменений товаров
+
+    Raises
+    -------
+    ParseError
+    ValidationError
+        ошибки в строках файла с номерами строк
+    """
+    return ProductImporter(upsert).run(file)
+
+
+def import_groups_csv(
+        file: Iterable[bytes], upsert: bool = False
+) -> ImportResult:
     """
     Parameters
     ----------
     file :
-        файл InMemoryUploadedFile
+        строки файла CSV, например CSVUpload из тела запроса
+    upsert :
+        обновлять существующие по name вместо ошибки
+
+    Returns
+    -------
+    result :
+        кол-во созданных, обновленных и пропущенных без изменений групп
+
     Raises
     -------
     ParseError
+    ValidationError
+        ошибки в строках файла с номерами строк
     """
-    csvfile = csv.DictReader(codecs.iterdecode(file, 'cp1251'))
-    bulk_create = []
-    groups_pk = set(Group.objects.values_list('pk', flat=True))
-
-    for el in csvfile:
-
-        serializer = ProductSerializer(data=el)
-        serializer.is_valid(raise_exception=True)
-        data = serializer.validated_data
-        group_id = data.get('group_id')
-        if group_id not in groups_pk:
-            name = data.get('name')
-            raise APIException(
-                f'группа {group_id} отутсвует в продукте {name}'
-            )
-        bulk_create.append(Product(**data))
-    if not bulk_create:
-        raise ParseError('Не найдены данные для импорта')
-    Product.objects.bulk_create(bulk_create)
-
-
-def import_groups_csv(file: InMemoryUploadedFile) -> None:
+    return GroupImporter(upsert).run(file)
+
+
+def import_catalog_csv(
+        file: Iterable[bytes], upsert: bool = False
+) -> CatalogImportResult:
     """
     Parameters
     ----------
     file :
-        файл InMemoryUploadedFile
+        строки файла CSV с товарами, группа в колонке group по названию
+    upsert :
+        обновлять существующие по article вместо ошибки
+
+    Returns
+    -------
+    result :
+        кол-во созданных, обновленных и пропущенных товаров
+        и кол-во созданных групп
+
     Raises
     -------
     ParseError
+    ValidationError
+        ошибки в строках файла с номерами строк
+    """
+    return CatalogImporter(upsert).run(file)
+
+
+@transaction.atomic
+def record_tombstones(model: str, pks: list[int]) -> None:
+    """
+    Parameters
+    ----------
+    model :
+        имя модели, например product
+    pks :
+        pk удаляемых объектов, пишутся для дельта-синхронизации
+    """
+    Tombstone.objects.bulk_create(
+        Tombstone(model=model, object_id=pk) for pk in pks
+    )
+
+
+@transaction.atomic
+def send_low_stock_alerts() -> list[Product]:
+    """
+    Оповещает о товарах, остаток которых впервые опустился ниже
+    LOW_STOCK_THRESHOLD. Уже оповещенные товары хранятся в
+    LowStockAlert и снимаются оттуда, когда остаток восстановился,
+    поэтому читаются только заканчивающиеся товары по частичному индексу
+
+    Returns
+    -------
+    products :
+        товары, по которым отправлено оповещение
+    """
+    threshold = settings.LOW_STOCK_THRESHOLD
+    LowStockAlert.objects.filter(product__amount__gte=threshold).delete()
+    products = list(low_stock_products(
+        Product.objects.filter(low_stock_alert__isnull=True), threshold
+    ))
+    LowStockAlert.objects.bulk_create(
+        LowStockAlert(product=product, amount=product.amount)
+        for product in products
+    )
+    for product in products:
+        logger.warning(
+            'Заканчивается товар %s (%s): осталось %s',
+            product.article, product.name, product.amount
+        )
+    return products
+
+
+def take_product_amount(pk: int, amount: int | Expression) -> bool:
+    """
+    Parameters
+    ----------
+    pk :
+        pk товара
+    amount :
+        сколько списать с остатка, отрицательное - вернуть на остаток.
+        Может быть выражением, оно вычисляется в том же UPDATE
+
+    Returns
+    -------
+    taken :
+        False, если товара нет или остатка не хватает. Проверка и
+        списание - один UPDATE ... WHERE amount >= n, поэтому
+        параллельные запросы не могут списать один остаток дважды
     """
-    csvfile = csv.DictReader(codecs.iterdecode(file, 'cp1251'))
-    bulk_create = []
-    groups_name = set(Group.objects.values_list('name', flat=True))
-
-    for el in csvfile:
-        serializer = GroupSerializer(data=el)
-        serializer.is_valid(raise_exception=True)
-        data = serializer.validated_data
-        if data.get('name') in groups_name:
-            data.pop('name')
-        bulk_create.append(Group(**data))
-    if not bulk_create:
-        raise ParseError('Не найдены данные для импорта')
-    Group.objects.bulk_create(bulk_create)
+    return bool(Product.objects.filter(pk=pk, amount__gte=amount).update(
+        amount=F('amount') - amount, updated_at=timezone.now(),
+        content_hash=None
+    ))
 
 
 @transaction.atomic
@@ -0,0 +1,145 @@
+import heapq
+import threading
+from bisect import bisect_left
+from typing import Iterable
+
+from products.cache import get_catalog_version
+from products.models import Product
+
+
+class SuggestIndex:
+    """
+    Индекс автодополнения по названию и артикулу товаров в памяти процесса.
+
+    Хранит отсортированный массив ключей (название, артикул и хвосты
+    названия с каждого слова) и параллельный массив pk, префиксный запрос -
+    бинарный поиск. Снимок индекса неизменяемый и подменяется целиком,
+    поэтому чтение идет без блокировок. Строится лениво при первом запросе
+    и перестраивается, когда меняется версия каталога в кеше, как снимок
+    CatalogStore. Изменения этого процесса применяются точечно через
+    add/remove после смены версии, которую они вызвали.
+    """
+    __slots__ = ('_lock', '_snapshot')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def clear(self) -> None:
+        """Сбросить индекс, следующий запрос построит его заново из БД"""
+        with self._lock:
+            self._snapshot = None
+
+    @staticmethod
+    def _entries(pk: int, name: str, article: str) -> list[tuple[str, int]]:
+        words = name.casefold().split()
+        keys = {name.casefold(), article.casefold()}
+        keys.update(' '.join(words[i:]) for i in range(1, len(words)))
+        return [(key, pk) for key in keys]
+
+    def _build(self, version: int) -> tuple:
+        products = {
+            pk: (name, article) for pk, name, article in
+            Product.objects.values_list('id', 'name', 'article').iterator()
+        }
+        entries = sorted(
+            entry for pk, (name, article) in products.items()
+            for entry in self._entries(pk, name, article)
+        )
+        keys = tuple(key for key, _ in entries)
+        ids = tuple(pk for _, pk in entries)
+        return version, keys, ids, products
+
+    def _get_snapshot(self) -> tuple:
+        version = get_catalog_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0] != version:
+            with self._lock:
+                if self._snapshot is None or self._snapshot[0] != version:
+                    self._snapshot = self._build(version)
+                snapshot = self._snapshot
+        return snapshot
+
+    def _replace(self, removed: set, added: Iterable[Product]) -> None:
+        with self._lock:
+            if self._snapshot is None:
+                return
+            version, keys, ids, products = self._snapshot
+            # изменение вызывается после своей смены версии: если кроме
+            # нее версия не менялась, снимок можно довести точечно, иначе
+            # в нем нет чужих изменений и проще построить его заново
+            current = get_catalog_version()
+            if current != version + 1:
+                self._snapshot = None
+                return
+            products = {
+                pk: value for pk, value in products.items()
+                if pk not in removed
+            }
+            new_entries = []
+            for product in added:
+                products[product.pk] = (product.name, product.article)
+                new_entries += self._entries(
+                    product.pk, product.name, product.article
+                )
+            entries = list(heapq.merge(
+                ((key, pk) for key, pk in zip(keys, ids) if pk not in removed),
+                sorted(new_entries)
+            ))
+            self._snapshot = (
+                current,
+                tuple(key for key, _ in entries),
+                tuple(pk for _, pk in entries),
+                products
+            )
+
+    def add(self, products: Iterable[Product]) -> None:
+        """
+        Parameters
+        ----------
+        products :
+            созданные или измененные товары, их старые ключи удаляются.
+            Вызывается после смены версии каталога этим изменением
+        """
+        products = list(products)
+        self._replace({product.pk for product in products}, products)
+
+    def remove(self, pks: Iterable[int]) -> None:
+        """
+        Parameters
+        ----------
+        pks :
+            pk удаленных товаров, вызывается после смены версии каталога
+        """
+        self._replace(set(pks), ())
+
+    def search(self, prefix: str, limit: int = 10) -> list[dict]:
+        """
+        Parameters
+        ----------
+        prefix :
+            начало названия, слова в названии или артикула
+        limit :
+            максимальное кол-во подсказок
+
+        Returns
+        -------
+        suggestions :
+            список словарей id, name, article
+        """
+        _, keys, ids, products = self._get_snapshot()
+        prefix = prefix.casefold()
+        suggestions, seen = [], set()
+        for pos in range(bisect_left(keys, prefix), len(keys)):
+            if len(suggestions) >= limit or not keys[pos].startswith(prefix):
+                break
+            pk = ids[pos]
+            if pk in seen:
+                continue
+            seen.add(pk)
+            name, article = products[pk]
+            suggestions.append({'id': pk, 'name': name, 'article': article})
+        return suggestions
+
+
+suggest_index = SuggestIndex()
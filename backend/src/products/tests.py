@@ -1,11 +1,52 @@
+import datetime
+import gzip
+import io
+import json
 import os
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from decimal import Decimal
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Sum
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.reverse import reverse
-from rest_framework.test import APIClient, APITestCase
+from rest_framework.test import (APIClient, APIRequestFactory, APITestCase,
+                                 force_authenticate)
 
-from products.models import Cart, Group, Order, Product
+from products import counters
+from products.cache import (STOCK_CHANGES_KEY, bump_catalog_version,
+                            get_or_set_single_flight, get_stock_version)
+from products.catalog import catalog_store
+from products.counters import (FLUSH_LOCK_KEY, RedisViewBuffer,
+                               flush_view_counters, get_view_buffer,
+                               memory_view_buffer, record_view)
+from products.delta import decode_since, get_delta
+from products.importer import (CatalogImporter, CSVImporter, ImportUndo,
+                               ProductImporter)
+from products.jobs import recover_stale_import_jobs, run_import_job
+from products.models import (Cart, Group, ImportJob, ImportJobUndo,
+                             LowStockAlert, Order, OrderProduct, Product,
+                             ProductCounter, Tombstone)
+from products.serializers import CartSerializer, ProductSerializer
+from products.services import take_product_amount
+from products.suggest import suggest_index
+from products.views import OrderView, ProductView
+from services.values import ValuesSerializer
 from test_utils.auth import client_auth
+from test_utils.redis import REDIS_CACHES, FakeRedis
 
 User = get_user_model()
 
@@ -79,6 +120,11 @@ class TestProduct(APITestCase):
         )
         super().setUpTestData()
 
+    def setUp(self):
+        cache.clear()
+        suggest_index.clear()
+        memory_view_buffer.drain()
+
     def test_01_guest_cant_import_products(self):
         response = self.guest_client.post(
             reverse('import_products')
@@ -273,3 +319,1533 @@ class TestProduct(APITestCase):
         is_order = Order.objects.filter(user_id=self.admin_user.pk).exists()
         self.assertEqual(response.status_code, 201)
         self.assertEqual(is_order, True)
+
+    def create_products(self, count: int) -> list[Product]:
+        group = Group.objects.create(name='cursor')
+        return Product.objects.bulk_create(
+            Product(
+                article=f'art{i}', name=f'product {i}', amount=i,
+                price=i % 7, group=group
+            )
+            for i in range(count)
+        )
+
+    def test_24_cursor_pagination_walks_all_products(self):
+        self.create_products(25)
+        for ordering in ('-id', 'price', '-created_at'):
+            url = f"{reverse('products')}?cursor=&ordering={ordering}"
+            ids = []
+            while url:
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('count', response.json())
+                ids += [el['id'] for el in response.json()['results']]
+                previous, url = (
+                    response.json()['previous'], response.json()['next']
+                )
+            self.assertEqual(len(ids), 25)
+            self.assertEqual(len(set(ids)), 25)
+            response = self.guest_client.get(previous)
+            self.assertEqual(
+                [el['id'] for el in response.json()['results']], ids[10:20]
+            )
+
+    def test_25_cursor_pagination_deep_page_has_single_query(self):
+        self.create_products(25)
+        response = self.guest_client.get(f"{reverse('products')}?cursor=")
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(response.json()['next'])
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertIsNone(response.json()['next'])
+
+    def test_26_cursor_pagination_invalid_cursor(self):
+        response = self.guest_client.get(
+            f"{reverse('products')}?cursor=invalid"
+        )
+        self.assertEqual(response.status_code, 404)
+        self.create_products(15)
+        response = self.guest_client.get(f"{reverse('products')}?cursor=")
+        next_url = response.json()['next']
+        # курсор сортировки -id без позиции для сортировки по цене
+        response = self.guest_client.get(f'{next_url}&ordering=price')
+        self.assertEqual(response.status_code, 404)
+        for tokens in ('i=1&p=abc', f'i={2 ** 64}&p=1', 'i=1'):
+            cursor = b64encode(tokens.encode('ascii')).decode('ascii')
+            response = self.guest_client.get(
+                reverse('products'), {'cursor': cursor, 'ordering': 'price'}
+            )
+            self.assertEqual(response.status_code, 404)
+        response = self.admin_client.get(
+            reverse('low_stock_products'),
+            {'cursor': b64encode(b'i=1&p=abc').decode('ascii')}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_27_search_products_by_name_and_article(self):
+        group = Group.objects.create(name='search')
+        Product.objects.bulk_create([
+            Product(
+                article='KB-100', name='Клавиатура беспроводная',
+                amount=1, price=10, group=group
+            ),
+            Product(
+                article='MS-200', name='Мышь беспроводная',
+                amount=1, price=10, group=group
+            ),
+            Product(
+                article='KB-300', name='Клавиатура игровая клавиатура',
+                amount=1, price=10, group=group
+            ),
+        ])
+        response = self.guest_client.get(
+            reverse('products'), {'search': 'клавиат'}
+        )
+        names = [el['name'] for el in response.json()['results']]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(names, [
+            'Клавиатура игровая клавиатура', 'Клавиатура беспроводная'
+        ])
+        response = self.guest_client.get(
+            reverse('products'), {'search': 'ms беспров'}
+        )
+        articles = [el['article'] for el in response.json()['results']]
+        self.assertEqual(articles, ['MS-200'])
+        response = self.guest_client.get(
+            reverse('products'), {'search': 'клавиат', 'cursor': ''}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('search', response.json())
+
+    def test_28_search_index_follows_product_updates(self):
+        product = self.create_products(1)[0]
+        pk = product.pk
+        product = Product.objects.get(pk=pk)
+        product.name = 'переименованный'
+        product.save()
+        renamed = self.guest_client.get(
+            reverse('products'), {'search': 'переименов'}
+        ).json()['results']
+        product.delete()
+        bump_catalog_version()
+        deleted = self.guest_client.get(
+            reverse('products'), {'search': 'переименов'}
+        ).json()['results']
+        self.assertEqual([el['id'] for el in renamed], [pk])
+        self.assertEqual(deleted, [])
+
+    def test_29_suggest_products_by_prefix(self):
+        self.import_groups_csv()
+        self.import_products_csv()
+        response = self.guest_client.get(
+            reverse('suggest_products'), {'q': 'EFE'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(el['article'] for el in response.json()), ['efef', 'efefr']
+        )
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(
+                reverse('suggest_products'), {'q': 'efefr'}
+            )
+        self.assertEqual([el['article'] for el in response.json()], ['efefr'])
+
+    def test_30_suggest_index_follows_import(self):
+        self.import_groups_csv()
+        self.guest_client.get(reverse('suggest_products'), {'q': 'efef'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_products_csv()
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(
+                reverse('suggest_products'), {'q': 'efef'}
+            )
+        self.assertEqual(len(response.json()), 2)
+        bump_catalog_version()
+        suggest_index.remove(Product.objects.values_list('pk', flat=True))
+        response = self.guest_client.get(
+            reverse('suggest_products'), {'q': 'efef'}
+        )
+        self.assertEqual(response.json(), [])
+
+    def test_31_products_list_is_cached_until_catalog_changes(self):
+        self.create_products(3)
+        Product.objects.update(amount=10)
+        self.guest_client.get(reverse('products'))
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(reverse('products'))
+        self.assertEqual(len(response.json()['results']), 3)
+        Product.objects.filter(pk=response.json()['results'][0]['id']).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin_client.post(
+                reverse('add_to_cart', kwargs={
+                    'pk': response.json()['results'][1]['id']
+                }),
+                data={'amount': 1}
+            )
+        response = self.guest_client.get(reverse('products'))
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertEqual(response.json()['results'][0]['amount'], 9)
+
+    def test_32_single_flight_calls_producer_once(self):
+        calls = []
+
+        def producer():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'data': 1}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                get_or_set_single_flight('single_flight', producer)
+            ))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'data': 1}] * 10)
+        self.assertNotEqual(bump_catalog_version(), bump_catalog_version())
+
+    def test_33_products_list_not_modified_by_etag(self):
+        self.create_products(3)
+        response = self.guest_client.get(reverse('products'))
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(
+                reverse('products'), HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+        bump_catalog_version()
+        response = self.guest_client.get(
+            reverse('products'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_34_product_retrieve_not_modified_by_row_version(self):
+        product = self.create_products(1)[0]
+        url = reverse('product', kwargs={'pk': product.pk})
+        response = self.guest_client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+        product.amount = 100
+        product.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['amount'], 100)
+        response = self.guest_client.get(
+            reverse('product', kwargs={'pk': 'unknown'})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_35_products_list_reuses_product_fragments(self):
+        products = self.create_products(3)
+        self.guest_client.get(reverse('products'))
+        bump_catalog_version()
+        with mock.patch.object(
+                ValuesSerializer, 'to_representation',
+                autospec=True, side_effect=ValuesSerializer.to_representation
+        ) as to_representation:
+            response = self.guest_client.get(reverse('products'))
+            self.assertEqual(to_representation.call_count, 0)
+            self.assertEqual(len(response.json()['results']), 3)
+            product = Product.objects.get(pk=products[0].pk)
+            product.name = 'новое название'
+            product.save()
+            bump_catalog_version()
+            response = self.guest_client.get(reverse('products'))
+            self.assertEqual(to_representation.call_count, 1)
+        names = {el['id']: el['name'] for el in response.json()['results']}
+        self.assertEqual(names[product.pk], 'новое название')
+
+    def test_36_in_memory_catalog_matches_orm(self):
+        products = self.create_products(25)
+        other = Group.objects.create(name='other')
+        Product.objects.filter(
+            pk__in=[product.pk for product in products[::3]]
+        ).update(group=other)
+        Product.objects.filter(
+            pk__in=[product.pk for product in products[::4]]
+        ).update(name='Клавиатура')
+        cases = [
+            {'name': 'клав'}, {'name': 'КЛАВ'}, {'name': 'Клав'},
+            {}, {'page': 2}, {'page': 3}, {'group': other.pk},
+            {'group': products[1].group_id, 'ordering': '-price'},
+            {'name': 'PRODUCT 1', 'ordering': 'price'},
+            {'name': '2', 'group': other.pk, 'ordering': 'created_at'},
+            {'ordering': 'id', 'page': 2}, {'group': 0},
+        ]
+        expected = [
+            self.guest_client.get(reverse('products'), params).json()
+            for params in cases
+        ]
+        cache.clear()
+        with override_settings(CATALOG_IN_MEMORY=1):
+            self.guest_client.get(reverse('products'))
+            with self.assertNumQueries(0):
+                actual = [
+                    self.guest_client.get(reverse('products'), params).json()
+                    for params in cases
+                ]
+        self.assertEqual(actual, expected)
+
+    def test_37_bulk_products_by_ids_and_articles(self):
+        products = self.create_products(5)
+        ids = [products[3].pk, 999999, products[0].pk, products[3].pk]
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(
+                reverse('products_bulk'), {'ids': ','.join(map(str, ids))}
+            )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(
+            [el and el['id'] for el in results],
+            [products[3].pk, None, products[0].pk, products[3].pk]
+        )
+        self.assertEqual(response.json()['missing'], [999999])
+        self.assertEqual(
+            results[0],
+            self.guest_client.get(
+                reverse('product', kwargs={'pk': products[3].pk})
+            ).json()
+        )
+        response = self.guest_client.get(
+            reverse('products_bulk'), {'article': ['art2', 'nope,art1']}
+        )
+        self.assertEqual(
+            [el and el['article'] for el in response.json()['results']],
+            ['art2', None, 'art1']
+        )
+        self.assertEqual(response.json()['missing'], ['nope'])
+
+    def test_38_bulk_products_validation(self):
+        cases = [
+            {}, {'ids': 'a,b'}, {'ids': '1', 'article': 'art1'},
+            {'ids': ','.join(map(str, range(101)))},
+        ]
+        for params in cases:
+            response = self.guest_client.get(reverse('products_bulk'), params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_39_products_sparse_fieldsets(self):
+        products = self.create_products(3)
+        url = reverse('products')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(
+                url, {'fields': 'id,name', 'ordering': 'price'}
+            )
+        self.assertEqual(response.status_code, 200)
+        select = next(
+            query['sql'] for query in queries if 'LIMIT' in query['sql']
+        )
+        self.assertIn('"product"."name"', select)
+        self.assertNotIn('"product"."article"', select)
+        for el in response.json()['results']:
+            self.assertEqual(set(el), {'id', 'name'})
+        response = self.guest_client.get(url, {'exclude': 'created_at'})
+        self.assertNotIn('created_at', response.json()['results'][0])
+        self.assertIn('price', response.json()['results'][0])
+        response = self.guest_client.get(url, {'cursor': '', 'fields': 'id'})
+        self.assertIsNone(response.json()['next'])
+        full = self.guest_client.get(
+            reverse('product', kwargs={'pk': products[0].pk})
+        )
+        sparse = self.guest_client.get(
+            reverse('product', kwargs={'pk': products[0].pk}),
+            {'fields': 'article'}
+        )
+        self.assertEqual(sparse.json(), {'article': 'art0'})
+        self.assertGreater(len(full.json()), 1)
+        self.assertNotEqual(full['ETag'], sparse['ETag'])
+
+    def test_40_products_columnar_format(self):
+        self.create_products(3)
+        url = reverse('products')
+        expected = ProductSerializer(Product.objects.all(), many=True).data
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url, {'format': 'columnar'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Type'], 'application/vnd.skillbox.columnar+json'
+        )
+        data = response.json()
+        rows = [
+            dict(zip(data['columns'], row)) for row in zip(*data['values'])
+        ]
+        self.assertEqual(rows, json.loads(json.dumps(expected)))
+        response = self.guest_client.get(
+            url, {'fields': 'id,price', 'group': 999999},
+            HTTP_ACCEPT='application/vnd.skillbox.columnar+json'
+        )
+        self.assertEqual(
+            response.json(), {'columns': ['id', 'price'], 'values': [[], []]}
+        )
+        response = self.guest_client.get(url, {'group': 999999})
+        self.assertEqual(response.json()['results'], [])
+        response = self.guest_client.get(
+            reverse('product', kwargs={'pk': rows[0]['id']}),
+            {'format': 'columnar'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_41_products_delta_sync(self):
+        products = self.create_products(4)
+        url = reverse('products')
+        response = self.guest_client.get(url, {'updated_since': '0'})
+        self.assertEqual(response.status_code, 200)
+        delta = response.json()
+        self.assertEqual(
+            [el['id'] for el in delta['results']],
+            [product.pk for product in products]
+        )
+        self.assertEqual(delta['deleted'], [])
+        self.assertFalse(delta['has_more'])
+        since = delta['next']
+        response = self.guest_client.get(url, {'updated_since': since})
+        self.assertEqual(response.json()['results'], [])
+
+        products[1].name = 'changed'
+        products[1].save()
+        deleted_pk = products[2].pk
+        self.client.force_login(
+            User.objects.create_superuser('staff', 'staff@mail.ru', 'x')
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('admin:products_product_delete', args=[deleted_pk]),
+                {'post': 'yes'}
+            )
+        self.assertFalse(Product.objects.filter(pk=deleted_pk).exists())
+        response = self.guest_client.get(url, {'updated_since': since})
+        delta = response.json()
+        self.assertEqual(
+            [el['name'] for el in delta['results']], ['changed']
+        )
+        self.assertEqual(delta['deleted'], [deleted_pk])
+        response = self.guest_client.get(
+            url, {'updated_since': delta['next']}
+        )
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(response.json()['deleted'], [])
+        response = self.guest_client.get(url, {'updated_since': 'bad'})
+        self.assertEqual(response.status_code, 400)
+
+        position, synced = decode_since('0'), []
+        has_more = True
+        while has_more:
+            page, deleted, position, has_more = get_delta(
+                Product.objects.all(), 'product', position, limit=2
+            )
+            synced += [product.pk for product in page]
+        self.assertEqual(
+            synced,
+            list(Product.objects.order_by('updated_at', 'pk').values_list(
+                'pk', flat=True
+            ))
+        )
+
+    def test_42_export_products_round_trip(self):
+        self.assertEqual(self.guest_client.get(
+            reverse('export_products')
+        ).status_code, 403)
+        self.import_groups_csv()
+        self.import_products_csv()
+        Product.objects.create(
+            article='ёжик', name='Ёжик, "в" тумане', amount=1, price='1.50',
+            group=Group.objects.first()
+        )
+        Product.objects.create(
+            article='без группы', name='без группы', amount=0, price=2
+        )
+        fields = ('article', 'name', 'amount', 'price', 'group_id')
+        expected = list(Product.objects.order_by('id').values_list(*fields))
+        response = self.admin_client.get(reverse('export_products'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        ndjson = self.admin_client.get(
+            reverse('export_products'), {'type': 'ndjson'}
+        )
+        rows = [
+            json.loads(line)
+            for line in b''.join(ndjson.streaming_content).splitlines()
+        ]
+        self.assertEqual(len(rows), len(expected))
+        self.assertEqual(rows[-2]['name'], 'Ёжик, "в" тумане')
+        self.assertEqual(rows[-2]['price'], '1.50')
+        self.assertEqual(rows[-2]['group_name'], Group.objects.first().name)
+        self.assertIsNone(rows[-1]['group_id'])
+
+        Product.objects.all().delete()
+        response = self.admin_client.post(
+            reverse('import_products'), data=content,
+            content_type='text/csv',
+            headers={'Content-Disposition': 'attachement; filename=export'}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list(*fields)),
+            expected
+        )
+        self.assertEqual(self.admin_client.get(
+            reverse('export_products'), {'type': 'xml'}
+        ).status_code, 400)
+
+    def test_43_export_products_command(self):
+        self.create_products(5)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'products.ndjson')
+            call_command(
+                'export_products', format='ndjson', output=path,
+                chunk_size=2, stdout=io.StringIO()
+            )
+            with open(path, encoding='utf-8') as f:
+                ids = [json.loads(line)['id'] for line in f]
+        self.assertEqual(
+            ids, list(Product.objects.order_by('id').values_list(
+                'id', flat=True
+            ))
+        )
+
+    def test_44_products_filters_and_facets(self):
+        products = self.create_products(14)
+        other = Group.objects.create(name='other')
+        Product.objects.filter(
+            pk__in=[product.pk for product in products[:4]]
+        ).update(group=other, price=700)
+        url = reverse('products')
+        params = {
+            'group': f'{other.pk},{products[5].group_id}',
+            'price_min': '1', 'price_max': '700', 'in_stock': 'true',
+        }
+        with self.assertNumQueries(2):
+            response = self.guest_client.get(url, params)
+        self.assertNotIn('facets', response.json())
+        params['facets'] = '1'
+        with self.assertNumQueries(3):
+            response = self.guest_client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        expected = Product.objects.filter(
+            group__in=[other, products[5].group], price__gte=1,
+            price__lte=700, amount__gt=0
+        )
+        self.assertEqual(data['count'], expected.count())
+        self.assertEqual(data['facets']['groups'], [
+            {'id': products[5].group_id, 'name': 'cursor', 'count': 9},
+            {'id': other.pk, 'name': 'other', 'count': 3},
+        ])
+        self.assertEqual(
+            [bucket['count'] for bucket in data['facets']['prices']],
+            [10, 0, 3, 0, 0]
+        )
+        # другая страница и сортировка - те же фасеты из кеша
+        with self.assertNumQueries(2):
+            response = self.guest_client.get(
+                url, {**params, 'ordering': '-price', 'page': 2}
+            )
+        self.assertEqual(response.json()['facets'], data['facets'])
+        with override_settings(CATALOG_IN_MEMORY=1):
+            cache.clear()
+            response = self.guest_client.get(url, params)
+        self.assertEqual(response.json(), data)
+        response = self.guest_client.get(url, {'price_min': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_45_product_view_counters(self):
+        products = self.create_products(3)
+        for product, views in zip(products, (2, 5, 1)):
+            for _ in range(views):
+                self.guest_client.get(
+                    reverse('product', kwargs={'pk': product.pk})
+                )
+        self.guest_client.get(reverse('product', kwargs={'pk': 999999}))
+        self.assertFalse(ProductCounter.objects.exists())
+        url = reverse('products')
+        response = self.guest_client.get(url, {'sort': 'popular'})
+        self.assertEqual(
+            [el['id'] for el in response.json()['results']],
+            [product.pk for product in reversed(products)]
+        )
+        with CaptureQueriesContext(connection) as queries:
+            call_command('flush_view_counters', stdout=io.StringIO())
+        self.assertEqual(
+            [query['sql'][:6] for query in queries].count('INSERT'), 1
+        )
+        self.guest_client.get(
+            reverse('product', kwargs={'pk': products[0].pk})
+        )
+        with override_settings(VIEW_COUNTERS_FLUSH_INTERVAL=0):
+            self.guest_client.get(
+                reverse('product', kwargs={'pk': products[0].pk})
+            )
+        self.assertEqual(
+            dict(ProductCounter.objects.values_list('product_id', 'views')),
+            {products[0].pk: 4, products[1].pk: 5, products[2].pk: 1}
+        )
+        response = self.guest_client.get(url, {'sort': 'popular'})
+        self.assertEqual(
+            [el['id'] for el in response.json()['results']],
+            [products[1].pk, products[0].pk, products[2].pk]
+        )
+        response = self.guest_client.get(
+            url, {'sort': 'popular', 'cursor': ''}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_46_low_stock_products_and_alerts(self):
+        products = self.create_products(15)
+        url = reverse('low_stock_products')
+        response = self.auth_user_client.get(url)
+        self.assertEqual(response.status_code, 403)
+        response = self.admin_client.get(url)
+        self.assertEqual(response.json()['count'], 10)
+        self.assertEqual(
+            [el['amount'] for el in response.json()['results']],
+            list(range(10))
+        )
+        response = self.admin_client.get(url, {'threshold': 1})
+        self.assertEqual(
+            [el['id'] for el in response.json()['results']], [products[0].pk]
+        )
+        response = self.admin_client.get(url, {'threshold': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.admin_client.get(url, {'cursor': '', 'threshold': 5})
+        self.assertEqual(
+            [el['amount'] for el in response.json()['results']],
+            list(range(5))
+        )
+
+        with self.assertLogs('products.services', 'WARNING') as logs:
+            call_command('low_stock_alerts', stdout=io.StringIO())
+        self.assertEqual(len(logs.output), 10)
+        self.assertEqual(LowStockAlert.objects.count(), 10)
+        with self.assertNoLogs('products.services', 'WARNING'):
+            call_command('low_stock_alerts', stdout=io.StringIO())
+        products[0].amount = 50
+        products[0].save()
+        products[12].amount = 3
+        products[12].save()
+        with self.assertLogs('products.services', 'WARNING') as logs:
+            call_command('low_stock_alerts', stdout=io.StringIO())
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(products[12].article, logs.output[0])
+        self.assertFalse(
+            LowStockAlert.objects.filter(product=products[0]).exists()
+        )
+        self.assertEqual(LowStockAlert.objects.count(), 10)
+
+        self.client.force_login(
+            User.objects.create_superuser('staff', 'staff@mail.ru', 'x')
+        )
+        response = self.client.get(
+            reverse('admin:products_product_changelist'), {'stock': 'out'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 0)
+        response = self.client.get(
+            reverse('admin:products_product_changelist'), {'stock': 'low'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 10)
+
+    def test_47_values_serializer_matches_product_serializer(self):
+        group = Group.objects.create(name='values')
+        Product.objects.bulk_create(
+            Product(
+                article=f'art{i}', name=f'product «{i}»', amount=i,
+                price=price, group=group if i % 2 else None
+            )
+            for i, price in enumerate(('0', '12.5', '999.99', '1000000'))
+        )
+        renderer = JSONRenderer()
+        for params in ({}, {'fields': 'id,price'}, {'exclude': 'created_at'}):
+            with self.subTest(params=params):
+                request = APIRequestFactory().get(reverse('products'), params)
+                serializer = ProductSerializer(
+                    Product.objects.all(), many=True,
+                    context={'request': Request(request)}
+                )
+                values = ValuesSerializer(serializer.child.fields)
+                self.assertEqual(
+                    renderer.render(values.many(
+                        Product.objects.values(*values.sources)
+                    )),
+                    renderer.render(serializer.data)
+                )
+                response = self.guest_client.get(reverse('products'), params)
+                self.assertEqual(
+                    response.json()['results'],
+                    json.loads(renderer.render(serializer.data))
+                )
+
+    def test_48_stream_unpaginated_lists(self):
+        products = self.create_products(5)
+        url = reverse('products')
+        response = self.auth_user_client.get(url, {'stream': 1})
+        self.assertEqual(response.status_code, 403)
+        with mock.patch.object(ProductView, 'stream_chunk_size', 2):
+            response = self.admin_client.get(
+                url, {'stream': 1, 'ordering': 'id', 'fields': 'id,name'}
+            )
+            self.assertTrue(response.streaming)
+            content = list(response.streaming_content)
+        # скобки массива и по части на каждые stream_chunk_size товаров
+        self.assertEqual(len(content), 2 + 3)
+        self.assertEqual(
+            json.loads(b''.join(content)),
+            [{'id': el.pk, 'name': el.name} for el in products]
+        )
+        response = self.admin_client.get(
+            url, {'stream': 1, 'group': 999999}
+        )
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+        orders = []
+        for product in products[:3]:
+            order = Order.objects.create(user=self.test_user)
+            OrderProduct.objects.create(
+                order=order, product=product, amount=1
+            )
+            orders.append(order)
+        request = APIRequestFactory().get('/', {'stream': 'true'})
+        force_authenticate(request, self.admin_user)
+        response = OrderView.as_view({'get': 'list'})(request)
+        with self.assertNumQueries(2):
+            data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(
+            [(el['id'], el['products']) for el in data],
+            [(order.pk, [product.pk]) for order, product in zip(
+                reversed(orders), reversed(products[:3])
+            )]
+        )
+
+    def post_csv(self, name: str, content: str):
+        return self.admin_client.post(
+            reverse(name), data=content.encode('cp1251'),
+            content_type='text/csv',
+            headers={'Content-Disposition': 'attachement; filename=import'}
+        )
+
+    def test_49_import_reports_errors_with_line_numbers(self):
+        group = Group.objects.create(name='import')
+        Product.objects.create(
+            article='exists', name='exists', amount=1, price=1, group=group
+        )
+        response = self.post_csv('import_products', (
+            'article,name,amount,price,group_id\n'
+            f'ok,товар,1,10.50,{group.pk}\n'
+            f'price,товар,1,10.555,{group.pk}\n'
+            'group,товар,1,1,999999\n'
+            f'ok,повтор,x,1,{group.pk}\n'
+            f'ok,повтор,1,1,{group.pk}\n'
+            f'exists,"многострочное\nназвание",1,1,{group.pk}\n'
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            {line: list(fields) for line, fields in response.json().items()},
+            {
+                '3': ['price'], '4': ['group_id'], '5': ['amount'],
+                '6': ['article'], '8': ['article'],
+            }
+        )
+        self.assertEqual(Product.objects.count(), 1)
+        response = self.post_csv(
+            'import_products', 'article,name,amount\nnew,товар,1\n'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.filter(article='new').exists())
+        response = self.post_csv(
+            'import_groups', 'name,description\nimport,дубль\nновая,\n'
+        )
+        self.assertEqual(
+            {line: list(fields) for line, fields in response.json().items()},
+            {'2': ['name'], '3': ['description']}
+        )
+
+    def test_50_import_writes_products_in_batches(self):
+        group = Group.objects.create(name='import')
+        content = 'article,name,amount,price,group_id\n' + ''.join(
+            f'art{i},товар {i},{i},{i}.5,{group.pk}\n' for i in range(5)
+        )
+        self.guest_client.get(reverse('suggest_products'), {'q': 'art'})
+        with mock.patch.object(ProductImporter, 'batch_size', 2):
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.post_csv('import_products', content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [
+                query['sql'][:6] for query in queries
+                if 'INSERT INTO "product"' in query['sql']
+            ],
+            ['INSERT'] * 3
+        )
+        self.assertEqual(
+            sorted(Product.objects.values_list('article', 'price')),
+            [(f'art{i}', Decimal(f'{i}.5')) for i in range(5)]
+        )
+        response = self.guest_client.get(
+            reverse('suggest_products'), {'q': 'art'}
+        )
+        self.assertEqual(len(response.json()), 5)
+
+    def test_51_upsert_import_skips_unchanged_rows(self):
+        groups = 'name,description\nпервая,описание\nвторая,описание\n'
+        response = self.admin_client.post(
+            f"{reverse('import_groups')}?mode=upsert",
+            data=groups.encode('cp1251'), content_type='text/csv',
+            headers={'Content-Disposition': 'attachement; filename=import'}
+        )
+        self.assertEqual(
+            response.json(), {'created': 2, 'updated': 0, 'skipped': 0}
+        )
+        group = Group.objects.get(name='первая')
+        content = 'article,name,amount,price,group_id\n' + ''.join(
+            f'art{i},товар {i},{i},{i}.5,{group.pk}\n' for i in range(3)
+        )
+        url = f"{reverse('import_products')}?mode=upsert"
+        upsert = {
+            'content_type': 'text/csv',
+            'headers': {'Content-Disposition': 'attachement; filename=p'},
+        }
+        response = self.admin_client.post(
+            url, data=content.encode('cp1251'), **upsert
+        )
+        self.assertEqual(
+            response.json(), {'created': 3, 'updated': 0, 'skipped': 0}
+        )
+        updated_at = dict(Product.objects.values_list('article', 'updated_at'))
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.admin_client.post(
+                    url, data=content.encode('cp1251'), **upsert
+                )
+        self.assertEqual(
+            response.json(), {'created': 0, 'updated': 0, 'skipped': 3}
+        )
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith(('INSERT', 'UPDATE'))
+        ])
+        self.assertEqual(callbacks, [])
+        self.assertEqual(
+            dict(Product.objects.values_list('article', 'updated_at')),
+            updated_at
+        )
+
+        product = Product.objects.get(article='art0')
+        product.amount = 100
+        product.save()
+        changed = content.replace('art2,товар 2,2,2.5', 'art2,товар 2,2,9.5')
+        response = self.admin_client.post(
+            url, data=f'{changed}art3,новый,1,1,{group.pk}\n'.encode('cp1251'),
+            **upsert
+        )
+        self.assertEqual(
+            response.json(), {'created': 1, 'updated': 2, 'skipped': 1}
+        )
+        self.assertEqual(
+            list(Product.objects.order_by('article').values_list(
+                'amount', 'price'
+            )),
+            [(0, Decimal('0.5')), (1, Decimal('1.5')), (2, Decimal('9.5')),
+             (1, Decimal('1'))]
+        )
+        self.assertEqual(Product.objects.count(), 4)
+
+        response = self.admin_client.post(
+            f"{reverse('import_groups')}?mode=upsert",
+            data=groups.replace('вторая,описание', 'вторая,новое').encode(
+                'cp1251'
+            ),
+            content_type='text/csv',
+            headers={'Content-Disposition': 'attachement; filename=import'}
+        )
+        self.assertEqual(
+            response.json(), {'created': 0, 'updated': 1, 'skipped': 1}
+        )
+        self.assertEqual(
+            Group.objects.get(name='вторая').description, 'новое'
+        )
+        response = self.admin_client.post(
+            f"{reverse('import_groups')}?mode=replace",
+            data=groups.encode('cp1251'), content_type='text/csv',
+            headers={'Content-Disposition': 'attachement; filename=import'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_52_background_import_job(self):
+        group = Group.objects.create(name='группа')
+        content = 'article,name,amount,price,group_id\n' + ''.join(
+            f'art{i},товар {i},{i},{i}.5,{group.pk}\n' for i in range(5)
+        )
+        csv = {
+            'content_type': 'text/csv',
+            'headers': {'Content-Disposition': 'attachement; filename=p'},
+        }
+        url = f"{reverse('import_products')}?background=1"
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root
+        ):
+            response = self.client.post(
+                url, data=content.encode('cp1251'), **csv
+            )
+            self.assertEqual(response.status_code, 403)
+            response = self.admin_client.post(
+                url, data=content.encode('cp1251'), **csv
+            )
+            self.assertEqual(response.status_code, 202)
+            job = response.json()
+            self.assertEqual(job['status'], 'pending')
+            self.assertEqual(
+                response['Location'],
+                reverse('import_job', kwargs={'pk': job['id']})
+            )
+            self.assertFalse(Product.objects.exists())
+
+            call_command('run_import_jobs', stdout=io.StringIO())
+            job = self.admin_client.get(response['Location']).json()
+            self.assertEqual(job['status'], 'done')
+            self.assertEqual(job['rows_done'], 5)
+            self.assertEqual(
+                [job['created_rows'], job['updated_rows'],
+                 job['skipped_rows']],
+                [5, 0, 0]
+            )
+            self.assertIsNotNone(job['throughput'])
+            self.assertEqual(Product.objects.count(), 5)
+            self.assertEqual(os.listdir(f'{media_root}/imports'), [])
+
+            response = self.admin_client.post(
+                url, data=content.encode('cp1251'), **csv
+            )
+            call_command('run_import_jobs', stdout=io.StringIO())
+            job = self.admin_client.get(response['Location']).json()
+            self.assertEqual(job['status'], 'failed')
+            self.assertEqual(
+                job['errors']['2'], {'article': ['Значение уже существует']}
+            )
+            self.assertEqual(Product.objects.count(), 5)
+
+            # файл больше IMPORT_SYNC_MAX_SIZE уходит в фон без параметра
+            with override_settings(
+                    IMPORT_SYNC_MAX_SIZE=10, IMPORT_JOBS_IN_PROCESS=1
+            ), mock.patch('products.jobs.get_executor') as get_executor:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.admin_client.post(
+                        f"{reverse('import_products')}?mode=upsert",
+                        data=content.encode('cp1251'), **csv
+                    )
+            self.assertEqual(response.status_code, 202)
+            get_executor.return_value.submit.assert_called_once()
+            self.assertEqual(
+                get_executor.return_value.submit.call_args.args[1],
+                response.json()['id']
+            )
+            self.assertEqual(
+                self.client.get(response['Location']).status_code, 403
+            )
+
+    def test_53_import_streams_gzip_body(self):
+        group = Group.objects.create(name='группа')
+        content = 'article,name,amount,price,group_id\n' + ''.join(
+            f'art{i},товар {i},{i},{i}.5,{group.pk}\n' for i in range(5)
+        )
+        compressed = gzip.compress(content.encode('cp1251'))
+        url = reverse('import_products')
+        response = self.admin_client.post(
+            url, data=compressed, content_type='text/csv',
+            headers={'Content-Encoding': 'gzip'}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 5)
+
+        response = self.admin_client.post(
+            f'{url}?mode=upsert', data=compressed,
+            content_type='application/gzip',
+            headers={'Content-Disposition': 'attachment; filename=p.csv.gz'}
+        )
+        self.assertEqual(
+            response.json(), {'created': 0, 'updated': 0, 'skipped': 5}
+        )
+
+        response = self.admin_client.post(
+            f'{url}?mode=upsert', data=compressed[:-10],
+            content_type='application/gzip'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'detail': 'Поврежденный архив gzip'}
+        )
+        response = self.admin_client.post(url, content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        response = self.admin_client.post(
+            url, data=compressed, content_type='application/zip'
+        )
+        self.assertEqual(response.status_code, 415)
+
+        # в фоне сохраняется сжатый файл и распаковывается при импорте
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root
+        ):
+            response = self.admin_client.post(
+                f'{url}?mode=upsert&background=1',
+                data=gzip.compress(
+                    content.replace(',0.5', ',7.5').encode('cp1251')
+                ),
+                content_type='application/gzip'
+            )
+            self.assertEqual(response.status_code, 202)
+            job = ImportJob.objects.get()
+            self.assertTrue(job.file.name.endswith('.csv.gz'))
+            call_command('run_import_jobs', stdout=io.StringIO())
+            job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.DONE)
+        self.assertEqual((job.updated_rows, job.skipped_rows), (1, 4))
+        self.assertEqual(
+            Product.objects.get(article='art0').price, Decimal('7.5')
+        )
+
+    def test_54_catalog_import_creates_groups_by_name(self):
+        existing = Group.objects.create(name='есть')
+        content = 'article,name,amount,price,group\n' + ''.join(
+            f'art{i},товар {i},{i},{i}.5,{("есть", "новая", "еще")[i % 3]}\n'
+            for i in range(6)
+        )
+        url = reverse('import_catalog')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_csv('import_catalog', content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.json(),
+            {'created': 6, 'updated': 0, 'skipped': 0, 'groups_created': 2}
+        )
+        self.assertEqual(
+            len([q for q in queries if 'INSERT INTO "group"' in q['sql']]), 1
+        )
+        groups = dict(Group.objects.values_list('name', 'pk'))
+        self.assertEqual(groups['есть'], existing.pk)
+        self.assertEqual(
+            dict(Product.objects.values_list('article', 'group_id')),
+            {f'art{i}': groups[('есть', 'новая', 'еще')[i % 3]]
+             for i in range(6)}
+        )
+        group = Group.objects.get(name='новая')
+        self.assertEqual(group.content_hash, group.get_content_hash())
+
+        changed = content.replace('1.5,новая', '1.5,еще')
+        response = self.admin_client.post(
+            f'{url}?mode=upsert', data=changed.encode('cp1251'),
+            content_type='text/csv'
+        )
+        self.assertEqual(
+            response.json(),
+            {'created': 0, 'updated': 1, 'skipped': 5, 'groups_created': 0}
+        )
+        self.assertEqual(
+            Product.objects.get(article='art1').group_id, groups['еще']
+        )
+
+        response = self.post_csv(
+            'import_catalog',
+            'article,name,amount,price,group\nart9,товар,1,1,третья\n'
+            f'art0,товар,1,1,{"x" * 151}\n'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'3': {'group': ['Не больше 150 символов']}}
+        )
+        self.assertFalse(Group.objects.filter(name='третья').exists())
+
+    def test_55_import_catalog_command_parses_shards_in_processes(self):
+        content = 'article,name,amount,price,group\r\n' + ''.join(
+            f'art{i},товар {i},{i},{i}.5,группа {i % 3}\r\n' for i in range(50)
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.csv')
+            with open(path, 'wb') as f:
+                f.write(content.encode('cp1251'))
+            stdout = io.StringIO()
+            call_command(
+                'import_catalog', path, workers=2, shard_size=64,
+                stdout=stdout
+            )
+            self.assertIn(
+                'Создано 50, обновлено 0, пропущено 0', stdout.getvalue()
+            )
+            self.assertEqual(
+                list(Product.objects.order_by('id').values_list(
+                    'article', 'group__name', 'price'
+                )),
+                [(f'art{i}', f'группа {i % 3}', Decimal(f'{i}.5'))
+                 for i in range(50)]
+            )
+
+            broken = content.replace('art7,товар 7,7,', 'art7,товар 7,x,')
+            broken = broken.replace('art42,', 'art1,')
+            with open(path, 'wb') as f:
+                f.write(broken.encode('cp1251'))
+            stderr = io.StringIO()
+            with self.assertRaisesMessage(
+                    CommandError, 'Импорт отменен: ошибки в файле'
+            ):
+                call_command(
+                    'import_catalog', path, upsert=True, workers=2,
+                    shard_size=64, stderr=stderr
+                )
+            self.assertEqual(
+                stderr.getvalue().splitlines(),
+                ['строка 9, amount: Ожидалось целое число',
+                 'строка 44, article: Значение повторяется в файле']
+            )
+            self.assertEqual(
+                Product.objects.get(article='art1').name, 'товар 1'
+            )
+
+    def test_56_add_to_cart_takes_stock_with_one_update(self):
+        product = self.create_products(3)[2]
+        url = reverse('add_to_cart', kwargs={'pk': product.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.admin_client.post(url, data={'amount': 2})
+        self.assertEqual(response.status_code, 201)
+        sql = [query['sql'] for query in queries]
+        updates = [
+            i for i, query in enumerate(sql)
+            if query.startswith('UPDATE "product"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"amount" >= (2 - COALESCE', sql[updates[0]])
+        # списание - первый запрос в транзакции, до чтения корзины
+        self.assertTrue(sql[updates[0] - 1].startswith('SAVEPOINT'))
+        product.refresh_from_db()
+        self.assertEqual(product.amount, 0)
+        self.assertIsNone(product.content_hash)
+
+        response = self.admin_client.post(url, data={'amount': 3})
+        self.assertEqual(response.status_code, 400)
+        response = self.admin_client.post(url, data={'amount': 1})
+        self.assertEqual(response.status_code, 201)
+        product.refresh_from_db()
+        self.assertEqual(product.amount, 1)
+        self.assertEqual(Cart.objects.get(product=product).amount, 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.filter(pk=product.pk).update(amount=-1)
+
+    def test_57_redis_view_counters_shared_between_processes(self):
+        products = self.create_products(2)
+        redis = FakeRedis()
+        with override_settings(CACHES=REDIS_CACHES), mock.patch(
+                'django.core.cache.backends.redis.RedisCacheClient'
+                '.get_client', return_value=redis
+        ):
+            buffer = get_view_buffer()
+            self.assertIsInstance(buffer, RedisViewBuffer)
+            for pk in (products[0].pk, products[0].pk, products[1].pk):
+                record_view(pk)
+            # выгрузка в другом процессе читает тот же хеш Redis
+            self.assertEqual(flush_view_counters(get_view_buffer()), 2)
+            self.assertEqual(flush_view_counters(), 0)
+            # интервал прошел: ключ выгрузки истек, выгружает запрос
+            cache.delete(FLUSH_LOCK_KEY)
+            record_view(products[1].pk)
+        self.assertEqual(
+            dict(ProductCounter.objects.values_list('product_id', 'views')),
+            {products[0].pk: 2, products[1].pk: 2}
+        )
+        self.assertIs(get_view_buffer(), memory_view_buffer)
+
+    def test_58_create_order_is_atomic(self):
+        product = self.create_products(3)[2]
+        self.admin_client.post(
+            reverse('add_to_cart', kwargs={'pk': product.pk}),
+            data={'amount': 1}
+        )
+        with mock.patch.object(
+                Order, 'add_products', side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            self.admin_client.post(reverse('create_order'))
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(Cart.objects.filter(product=product).exists())
+
+    def test_59_suggest_index_follows_catalog_version(self):
+        self.import_groups_csv()
+        self.import_products_csv()
+        self.guest_client.get(reverse('suggest_products'), {'q': 'efef'})
+        # товар изменили в другом процессе: точечного обновления нет,
+        # есть только новая версия каталога
+        Product.objects.filter(article='efefr').update(article='qwerty')
+        bump_catalog_version()
+        response = self.guest_client.get(
+            reverse('suggest_products'), {'q': 'efef'}
+        )
+        self.assertEqual(
+            [el['article'] for el in response.json()], ['efef']
+        )
+        # две смены версии, а точечно пришла одна: индекс строится заново
+        product = Product.objects.get(article='efef')
+        bump_catalog_version()
+        bump_catalog_version()
+        suggest_index.remove([product.pk])
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(
+                reverse('suggest_products'), {'q': 'qwe'}
+            )
+        self.assertEqual(
+            [el['article'] for el in response.json()], ['qwerty']
+        )
+
+    def test_60_integer_params_are_bounded(self):
+        self.create_products(3)
+        for value in (0, -1, 2 ** 63, 2 ** 64):
+            response = self.guest_client.get(
+                reverse('products_bulk'), {'ids': f'1,{value}'}
+            )
+            self.assertEqual(response.status_code, 400)
+            response = self.guest_client.get(
+                reverse('products'), {'group': value}
+            )
+            self.assertEqual(response.status_code, 400)
+        response = self.guest_client.get(
+            reverse('products_bulk'), {'ids': 2 ** 63 - 1}
+        )
+        self.assertEqual(response.json()['missing'], [2 ** 63 - 1])
+
+    def test_61_stock_change_updates_snapshot_in_place(self):
+        products = self.create_products(5)
+        url = reverse('products')
+        with override_settings(CATALOG_IN_MEMORY=1):
+            self.guest_client.get(url)
+            snapshot = catalog_store.get_snapshot()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.admin_client.post(
+                    reverse('add_to_cart', kwargs={'pk': products[4].pk}),
+                    data={'amount': 4}
+                )
+            # версия каталога та же, перечитываются только остатки
+            with self.assertNumQueries(1):
+                response = self.guest_client.get(url, {'in_stock': 'true'})
+            updated = catalog_store.get_snapshot()
+            self.assertEqual(updated.version, snapshot.version)
+            self.assertIs(updated.names, snapshot.names)
+            self.assertEqual(
+                [el['id'] for el in response.json()['results']],
+                [product.pk for product in reversed(products[1:4])]
+            )
+            product = Product.objects.get(pk=products[4].pk)
+            row = updated.row(updated.index(product.pk))
+            self.assertEqual(
+                (row['amount'], row['updated_at']),
+                (0, product.updated_at)
+            )
+            # изменения остатков вытеснены из кеша: снимок строится заново
+            with self.captureOnCommitCallbacks(execute=True):
+                self.admin_client.post(
+                    reverse('add_to_cart', kwargs={'pk': products[3].pk}),
+                    data={'amount': 1}
+                )
+            cache.delete(STOCK_CHANGES_KEY.format(
+                version=get_stock_version()
+            ))
+            self.guest_client.get(url)
+            self.assertIsNot(catalog_store.get_snapshot().names, updated.names)
+
+    def test_62_product_pk_out_of_range(self):
+        for pk in (0, -1, 2 ** 63, 2 ** 70, 'abc'):
+            response = self.guest_client.get(
+                reverse('product', kwargs={'pk': pk})
+            )
+            self.assertEqual(response.status_code, 404, pk)
+
+    def test_63_redis_view_counters_survive_interrupted_flush(self):
+        products = self.create_products(2)
+        redis = FakeRedis()
+        with override_settings(CACHES=REDIS_CACHES), mock.patch(
+                'django.core.cache.backends.redis.RedisCacheClient'
+                '.get_client', return_value=redis
+        ):
+            for pk in (products[0].pk, products[1].pk):
+                get_view_buffer().incr(pk)
+            # процесс упал между выгрузкой хеша и записью в БД
+            self.assertEqual(len(get_view_buffer().drain()), 2)
+            get_view_buffer().incr(products[0].pk)
+            with mock.patch.object(
+                    ProductCounter._meta, 'db_table', 'missing'
+            ), self.assertRaises(OperationalError), transaction.atomic():
+                flush_view_counters(get_view_buffer())
+            # брошенные хеши еще не устарели и остаются в Redis
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(flush_view_counters(get_view_buffer()), 0)
+            self.assertEqual(len(redis.scan_iter('*:draining:*')), 2)
+            with mock.patch.object(
+                    counters, 'DRAIN_STALE_TIMEOUT', 0
+            ), self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(flush_view_counters(get_view_buffer()), 2)
+            self.assertEqual(redis.scan_iter('*:draining:*'), [])
+        self.assertEqual(
+            dict(ProductCounter.objects.values_list('product_id', 'views')),
+            {products[0].pk: 2, products[1].pk: 1}
+        )
+
+
+class TestStockConcurrency(TransactionTestCase):
+    threads = 8
+    attempts_per_thread = 5
+    stock = 30
+    # на запрос и в среднем на запрос за весь тест
+    max_retries = 100
+    mean_retries = 20
+
+    def setUp(self):
+        self.retries = 0
+        self.retries_lock = threading.Lock()
+
+    def add_to_cart(self, user, product: Product, amount: int) -> bool:
+        data = {'user': user.pk, 'product': product.pk, 'amount': amount}
+        # SQLite в тестах пишет по одному подключению, занятая
+        # таблица - не ответ на запрос, а повод повторить его
+        for _ in range(self.max_retries):
+            serializer = CartSerializer(data=data)
+            try:
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+            except ValidationError:
+                return False
+            except OperationalError:
+                with self.retries_lock:
+                    self.retries += 1
+                time.sleep(0.001)
+                continue
+            return True
+        raise AssertionError(f'Таблица занята {self.max_retries} раз подряд')
+
+    def worker(self, user, product: Product, results: list) -> None:
+        in_cart = 0
+        try:
+            for _ in range(self.attempts_per_thread):
+                # каждый запрос увеличивает корзину на 1
+                taken = self.add_to_cart(user, product, in_cart + 1)
+                in_cart += taken
+                results.append(taken)
+        except AssertionError as e:
+            results.append(e)
+        finally:
+            connection.close()
+
+    def test_01_concurrent_add_to_cart_never_oversells(self):
+        group = Group.objects.create(name='stress')
+        product = Product.objects.create(
+            article='stress', name='stress', amount=self.stock, price=1,
+            group=group
+        )
+        users = [
+            User.objects.create_user(
+                username=f'stress{i}', email=f'stress{i}@mail.ru',
+                password='password'
+            )
+            for i in range(self.threads)
+        ]
+        results = []
+        threads = [
+            threading.Thread(
+                target=self.worker, args=(user, product, results)
+            )
+            for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        in_carts = Cart.objects.aggregate(total=Sum('amount'))['total']
+        self.assertEqual(
+            [el for el in results if isinstance(el, Exception)], []
+        )
+        self.assertEqual(
+            len(results), self.threads * self.attempts_per_thread
+        )
+        self.assertEqual(results.count(True), self.stock)
+        self.assertLess(self.retries, self.mean_retries * len(results))
+        self.assertEqual(product.amount, 0)
+        self.assertEqual(product.amount + in_carts, self.stock)
+
+
+class TestChunkedImport(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_01_background_import_rolls_back_committed_batches(self):
+        group = Group.objects.create(name='есть')
+        product = Product.objects.create(
+            article='art0', name='старое', amount=1, price=1, group=group
+        )
+        content = 'article,name,amount,price,group\n' + ''.join((
+            'art0,новое,5,2,есть\n', 'art1,товар,1,1,новая\n',
+            'art2,товар,1,1,есть\n', 'art3,товар,1,1,есть\n',
+            'art4,товар,-1,1,есть\n',
+        ))
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root
+        ):
+            job = ImportJob.objects.create(
+                kind=ImportJob.Kind.CATALOG, upsert=True,
+                file=ContentFile(content.encode('cp1251'), name='c.csv')
+            )
+            with mock.patch.object(
+                    CSVImporter, 'batch_size', 2
+            ), CaptureQueriesContext(connection) as queries:
+                job = run_import_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertEqual(
+            job.errors, {'6': {'amount': ['Не может быть меньше 0']}}
+        )
+        # группа и две пачки товаров записаны с журналом и откатаны
+        self.assertEqual(len([
+            query for query in queries
+            if query['sql'].startswith('INSERT INTO "import_job_undo"')
+        ]), 3)
+        self.assertFalse(ImportJobUndo.objects.exists())
+        restored = Product.objects.get()
+        self.assertEqual(
+            (restored.name, restored.amount, restored.price),
+            ('старое', 1, 1)
+        )
+        self.assertGreater(restored.updated_at, product.updated_at)
+        self.assertEqual(list(Group.objects.all()), [group])
+        self.assertEqual(
+            Tombstone.objects.filter(model='product').count(), 3
+        )
+        self.assertEqual(Tombstone.objects.filter(model='group').count(), 1)
+
+    def import_catalog(self, job: ImportJob, progress) -> None:
+        content = 'article,name,amount,price,group\n' + ''.join((
+            'art0,новое,5,2,есть\n', 'art1,товар,1,1,новая\n',
+            'art2,товар,1,1,есть\n', 'art3,товар,1,1,есть\n',
+            'art4,товар,-1,1,есть\n',
+        ))
+        importer = CatalogImporter(upsert=True, progress=progress, job=job)
+        with mock.patch.object(CSVImporter, 'batch_size', 2):
+            importer.run([
+                line.encode('cp1251')
+                for line in content.splitlines(keepends=True)
+            ])
+
+    def test_02_rollback_keeps_rows_changed_after_import(self):
+        group = Group.objects.create(name='есть')
+        Product.objects.create(
+            article='art0', name='старое', amount=1, price=1, group=group
+        )
+        user = User.objects.create_user(
+            username='buyer', email='buyer@mail.ru', password='password'
+        )
+        job = ImportJob.objects.create(kind=ImportJob.Kind.CATALOG)
+
+        def progress(rows):
+            # после первой пачки товары меняет корзина
+            if rows == 2:
+                take_product_amount(Product.objects.get(article='art0').pk, 1)
+                Cart.objects.create(
+                    user=user, amount=1,
+                    product=Product.objects.get(article='art1')
+                )
+
+        with self.assertRaises(ValidationError):
+            self.import_catalog(job, progress)
+        changed = Product.objects.get(article='art0')
+        self.assertEqual((changed.name, changed.amount), ('новое', 4))
+        self.assertEqual(
+            sorted(Product.objects.values_list('article', flat=True)),
+            ['art0', 'art1']
+        )
+        self.assertTrue(Group.objects.filter(name='новая').exists())
+        self.assertFalse(ImportJobUndo.objects.exists())
+
+    def test_03_stale_job_is_rolled_back_from_its_journal(self):
+        group = Group.objects.create(name='есть')
+        Product.objects.create(
+            article='art0', name='старое', amount=1, price=1, group=group
+        )
+        job = ImportJob.objects.create(
+            kind=ImportJob.Kind.CATALOG, status=ImportJob.Status.RUNNING,
+            heartbeat_at=timezone.now()
+        )
+
+        def progress(rows):
+            if rows == 4:
+                raise SystemExit
+
+        # обработчик остановился после двух пачек, не успев их откатить
+        with mock.patch.object(
+                ImportUndo, 'rollback', return_value=False
+        ), self.assertRaises(SystemExit):
+            self.import_catalog(job, progress)
+        self.assertEqual(Product.objects.count(), 4)
+        self.assertEqual(recover_stale_import_jobs(), 0)
+        ImportJob.objects.filter(pk=job.pk).update(
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        with self.assertLogs('products.jobs', 'WARNING'):
+            self.assertEqual(recover_stale_import_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertEqual(
+            list(Product.objects.values_list('article', 'name', 'amount')),
+            [('art0', 'старое', 1)]
+        )
+        self.assertEqual(list(Group.objects.all()), [group])
+        self.assertFalse(ImportJobUndo.objects.exists())
+        self.assertEqual(recover_stale_import_jobs(), 0)
+
+    def test_04_import_catalog_command_commits_batches_as_job(self):
+        rows = [f'art{i},товар,1,1,g\n' for i in range(6)]
+        long_value = 'x' * 100 + '\n' + 'y'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.csv')
+            with open(path, 'wb') as f:
+                f.write((
+                    'article,name,amount,price,group\n' + ''.join(rows)
+                    + f'art6,"{long_value}",1,1,g\n'
+                ).encode('cp1251'))
+            # значение с переводом строки внутри части разбирается целым
+            call_command('import_catalog', path, stdout=io.StringIO())
+            self.assertEqual(
+                Product.objects.get(article='art6').name, long_value
+            )
+            job = ImportJob.objects.get()
+            self.assertEqual(
+                (job.status, job.created_rows, job.rows_done),
+                (ImportJob.Status.DONE, 7, 7)
+            )
+            Product.objects.all().delete()
+            Group.objects.all().delete()
+
+            # вторая часть кончается внутри значения в кавычках: первая
+            # уже записана двумя пачками и откатывается
+            with mock.patch.object(
+                    CSVImporter, 'batch_size', 2
+            ), self.assertRaisesMessage(
+                CommandError,
+                'Строка 8: кавычки значения не закрыты до конца части файла'
+            ):
+                call_command(
+                    'import_catalog', path, workers=1, shard_size=64,
+                    stdout=io.StringIO()
+                )
+        job = ImportJob.objects.latest('id')
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertEqual(job.rows_done, 4)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Group.objects.exists())
+        self.assertFalse(ImportJobUndo.objects.exists())
@@ -0,0 +1,419 @@
+import gc
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+from base64 import b64encode
+from urllib import parse
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from products.importer import CatalogImporter, ProductImporter
+from products.models import Group, Product
+from products.parallel import import_file_parallel, read_file_parallel
+from products.parsers import CSVUpload
+from products.serializers import ProductSerializer
+from services.values import ValuesSerializer
+
+User = get_user_model()
+
+BENCHMARK_ROWS = int(os.environ.get('BENCHMARK_ROWS', 1_000_000))
+BENCHMARK_CATALOG_ROWS = int(
+    os.environ.get('BENCHMARK_CATALOG_ROWS', 100_000)
+)
+
+
+def seed_products(count: int, groups: int = 1) -> None:
+    """
+    Parameters
+    ----------
+    count :
+        кол-во товаров, вставляемых одним INSERT ... SELECT
+    groups :
+        кол-во групп, товары распределяются по ним по кругу
+    """
+    first_group = Group.objects.bulk_create(
+        Group(name=f'benchmark {i}') for i in range(groups)
+    )[0]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO product'
+            ' (article, name, amount, price, created_at, updated_at,'
+            ' group_id)'
+            ' WITH RECURSIVE seq(x) AS'
+            ' (SELECT 1 UNION ALL SELECT x + 1 FROM seq WHERE x < %s)'
+            " SELECT 'art' || x, 'product ' || x, x %% 100, x %% 1000,"
+            " datetime('2023-01-01', '+' || x || ' seconds'),"
+            " datetime('2023-01-01', '+' || x || ' seconds'),"
+            ' %s + x %% %s FROM seq',
+            [count, first_group.pk, groups]
+        )
+
+
+def encode_cursor(**tokens) -> str:
+    querystring = parse.urlencode(tokens)
+    return b64encode(querystring.encode('ascii')).decode('ascii')
+
+
+@unittest.skipUnless(
+    os.environ.get('BENCHMARK'), 'бенчмарки запускаются с BENCHMARK=1'
+)
+class BenchmarkCursorPagination(APITestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_products(BENCHMARK_ROWS)
+        cls.guest_client = cls.client_class()
+        super().setUpTestData()
+
+    def setUp(self):
+        cache.clear()
+
+    def measure(self, url: str) -> tuple[float, int]:
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = self.guest_client.get(url)
+            elapsed = time.perf_counter() - start
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 10)
+        return elapsed, len(queries)
+
+    def test_01_deep_cursor_page_costs_as_first_page(self):
+        url = reverse('products')
+        deep_pk = Product.objects.order_by('id').values_list(
+            'id', flat=True
+        )[20]
+        deep = Product.objects.order_by('-price', '-id').values(
+            'id', 'price'
+        )[BENCHMARK_ROWS - 20]
+        cases = (
+            ('-id', encode_cursor(i=deep_pk)),
+            ('-price', encode_cursor(i=deep['id'], p=deep['price'])),
+        )
+        for ordering, cursor in cases:
+            first_time, first_queries = self.measure(
+                f'{url}?cursor=&ordering={ordering}'
+            )
+            deep_time, deep_queries = self.measure(
+                f'{url}?cursor={cursor}&ordering={ordering}'
+            )
+            offset_time, offset_queries = self.measure(
+                f'{url}?page={BENCHMARK_ROWS // 10 - 2}&ordering={ordering}'
+            )
+            print(
+                f'\n{BENCHMARK_ROWS} строк, ordering={ordering}:'
+                f' cursor первая {first_time * 1000:.1f}ms'
+                f' ({first_queries} q),'
+                f' cursor глубокая {deep_time * 1000:.1f}ms'
+                f' ({deep_queries} q),'
+                f' page глубокая {offset_time * 1000:.1f}ms'
+                f' ({offset_queries} q)'
+            )
+            self.assertEqual(first_queries, 1)
+            self.assertEqual(deep_queries, 1)
+            self.assertLess(deep_time, first_time * 3 + 0.01)
+
+
+@unittest.skipUnless(
+    os.environ.get('BENCHMARK'), 'бенчмарки запускаются с BENCHMARK=1'
+)
+class BenchmarkCatalogSnapshot(APITestCase):
+    client_class = APIClient
+    requests = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_products(BENCHMARK_CATALOG_ROWS, groups=50)
+        cls.guest_client = cls.client_class()
+        cls.group_ids = list(Group.objects.values_list('pk', flat=True))
+        super().setUpTestData()
+
+    def setUp(self):
+        cache.clear()
+
+    def run_requests(self) -> float:
+        url = reverse('products')
+        cases = (
+            {'ordering': '-price'},
+            {'group': self.group_ids[7]},
+            {'group': self.group_ids[3], 'ordering': 'price'},
+            {'name': 'product 12', 'ordering': '-created_at'},
+        )
+        start = time.perf_counter()
+        for i in range(self.requests):
+            # уникальный параметр, чтобы не попадать в кеш ответов
+            params = {**cases[i % len(cases)], 'page': i % 20 + 1, '_': i}
+            response = self.guest_client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+        return time.perf_counter() - start
+
+    def test_01_in_memory_catalog_is_faster_than_orm(self):
+        self.run_requests()
+        orm_time = self.run_requests()
+        with override_settings(CATALOG_IN_MEMORY=1):
+            start = time.perf_counter()
+            self.guest_client.get(reverse('products'))
+            build_time = time.perf_counter() - start
+            self.run_requests()
+            memory_time = self.run_requests()
+        print(
+            f'\n{BENCHMARK_CATALOG_ROWS} товаров, {self.requests} запросов:'
+            f' ORM {self.requests / orm_time:.0f} rps,'
+            f' память {self.requests / memory_time:.0f} rps,'
+            f' построение снимка {build_time * 1000:.0f}ms'
+        )
+        self.assertLess(memory_time, orm_time)
+
+
+@unittest.skipUnless(
+    os.environ.get('BENCHMARK'), 'бенчмарки запускаются с BENCHMARK=1'
+)
+class BenchmarkColumnarFormat(APITestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_products(BENCHMARK_CATALOG_ROWS, groups=50)
+        cls.guest_client = cls.client_class()
+        super().setUpTestData()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_01_columnar_catalog_is_smaller_and_faster(self):
+        start = time.perf_counter()
+        objects = JSONRenderer().render(
+            ProductSerializer(Product.objects.all(), many=True).data
+        )
+        objects_time = time.perf_counter() - start
+        start = time.perf_counter()
+        response = self.guest_client.get(
+            reverse('products'), {'format': 'columnar'}
+        )
+        columnar_time = time.perf_counter() - start
+        self.assertEqual(response.status_code, 200)
+        print(
+            f'\n{BENCHMARK_CATALOG_ROWS} товаров:'
+            f' объекты {len(objects) / 2 ** 20:.1f}MB'
+            f' за {objects_time * 1000:.0f}ms,'
+            f' колонки {len(response.content) / 2 ** 20:.1f}MB'
+            f' за {columnar_time * 1000:.0f}ms'
+        )
+        self.assertLess(len(response.content), len(objects) * 0.7)
+        self.assertLess(columnar_time, objects_time / 2)
+
+
+@unittest.skipUnless(
+    os.environ.get('BENCHMARK'), 'бенчмарки запускаются с BENCHMARK=1'
+)
+class BenchmarkValuesSerializer(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_products(BENCHMARK_CATALOG_ROWS, groups=50)
+        super().setUpTestData()
+
+    def test_01_values_serializer_is_faster_than_model_serializer(self):
+        start = time.perf_counter()
+        expected = ProductSerializer(Product.objects.all(), many=True).data
+        model_time = time.perf_counter() - start
+        start = time.perf_counter()
+        values = ValuesSerializer(ProductSerializer().fields)
+        actual = values.many(Product.objects.values(*values.sources))
+        values_time = time.perf_counter() - start
+        print(
+            f'\n{BENCHMARK_CATALOG_ROWS} товаров:'
+            f' ProductSerializer {BENCHMARK_CATALOG_ROWS / model_time:.0f}'
+            f' строк/с, ValuesSerializer'
+            f' {BENCHMARK_CATALOG_ROWS / values_time:.0f} строк/с'
+        )
+        self.assertEqual(actual, expected)
+        self.assertLess(values_time, model_time / 2)
+
+
+@unittest.skipUnless(
+    os.environ.get('BENCHMARK'), 'бенчмарки запускаются с BENCHMARK=1'
+)
+class BenchmarkStreamingList(APITestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_products(BENCHMARK_CATALOG_ROWS, groups=50)
+        cls.admin_client = cls.client_class()
+        cls.admin_client.force_authenticate(
+            User.objects.create_superuser('bench', 'bench@mail.ru', 'x')
+        )
+        super().setUpTestData()
+
+    @staticmethod
+    def measure_peak(callback) -> int:
+        gc.collect()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        callback()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak - baseline
+
+    def test_01_stream_peak_memory_does_not_grow_with_rows(self):
+        rendered_peak = self.measure_peak(lambda: JSONRenderer().render(
+            ProductSerializer(Product.objects.all(), many=True).data
+        ))
+        sizes = []
+        streamed_peak = self.measure_peak(lambda: sizes.extend(
+            len(chunk) for chunk in self.admin_client.get(
+                reverse('products'), {'stream': 1}
+            ).streaming_content
+        ))
+        print(
+            f'\n{BENCHMARK_CATALOG_ROWS} товаров,'
+            f' {sum(sizes) / 2 ** 20:.1f}MB: пик памяти при рендере списка'
+            f' {rendered_peak / 2 ** 20:.1f}MB,'
+            f' потоком {streamed_peak / 2 ** 20:.1f}MB'
+        )
+        self.assertLess(streamed_peak, rendered_peak / 10)
+
+
+@unittest.skipUnless(
+    os.environ.get('BENCHMARK'), 'бенчмарки запускаются с BENCHMARK=1'
+)
+class BenchmarkCSVImport(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name='benchmark')
+        super().setUpTestData()
+
+    def write_csv(self, directory: str, count: int, offset: int) -> str:
+        path = os.path.join(directory, f'products_{count}.csv')
+        with open(path, 'w', encoding='cp1251') as f:
+            f.write('article,name,amount,price,group_id\n')
+            for i in range(offset, offset + count):
+                f.write(f'art{i},товар {i},{i % 100},{i % 1000}.50,'
+                        f'{self.group.pk}\n')
+        return path
+
+    def measure_import(
+            self, path: str, gzipped: bool = False
+    ) -> tuple[float, int]:
+        gc.collect()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            ProductImporter().run(CSVUpload(f, path, None, gzipped))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak - baseline
+
+    def test_01_import_memory_does_not_grow_with_rows(self):
+        small_count = BENCHMARK_CATALOG_ROWS // 10
+        with tempfile.TemporaryDirectory() as directory:
+            small = self.write_csv(directory, small_count, 0)
+            large = self.write_csv(
+                directory, BENCHMARK_CATALOG_ROWS, small_count
+            )
+            _, small_peak = self.measure_import(small)
+            large_time, large_peak = self.measure_import(large)
+        print(
+            f'\nимпорт {BENCHMARK_CATALOG_ROWS} товаров:'
+            f' {BENCHMARK_CATALOG_ROWS / large_time:.0f} строк/с'
+            f' (с tracemalloc), пик памяти {large_peak / 2 ** 20:.1f}MB,'
+            f' на {small_count} строк {small_peak / 2 ** 20:.1f}MB'
+        )
+        self.assertEqual(
+            Product.objects.count(), small_count + BENCHMARK_CATALOG_ROWS
+        )
+        self.assertLess(large_peak, small_peak * 2)
+
+    def test_02_gzip_upload_memory_does_not_grow_with_rows(self):
+        small_count = BENCHMARK_CATALOG_ROWS // 10
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for count, offset in (
+                    (small_count, 0),
+                    (BENCHMARK_CATALOG_ROWS, small_count)
+            ):
+                path = self.write_csv(directory, count, offset)
+                with open(path, 'rb') as src, gzip.open(
+                        f'{path}.gz', 'wb'
+                ) as dst:
+                    shutil.copyfileobj(src, dst)
+                paths.append((f'{path}.gz', os.path.getsize(path)))
+            (small, _), (large, large_size) = paths
+            _, small_peak = self.measure_import(small, gzipped=True)
+            large_time, large_peak = self.measure_import(large, gzipped=True)
+            compressed_size = os.path.getsize(large)
+        print(
+            f'\nимпорт {BENCHMARK_CATALOG_ROWS} товаров из gzip'
+            f' ({large_size / 2 ** 20:.1f}MB,'
+            f' сжатый {compressed_size / 2 ** 20:.1f}MB):'
+            f' {BENCHMARK_CATALOG_ROWS / large_time:.0f} строк/с'
+            f' (с tracemalloc), пик памяти {large_peak / 2 ** 20:.1f}MB,'
+            f' на {small_count} строк {small_peak / 2 ** 20:.1f}MB'
+        )
+        self.assertEqual(
+            Product.objects.count(), small_count + BENCHMARK_CATALOG_ROWS
+        )
+        self.assertLess(large_peak, small_peak * 2)
+
+
+@unittest.skipUnless(
+    os.environ.get('BENCHMARK'), 'бенчмарки запускаются с BENCHMARK=1'
+)
+class BenchmarkParallelImport(APITestCase):
+
+    def write_csv(self, path: str) -> None:
+        with open(path, 'w', encoding='cp1251') as f:
+            f.write('article,name,amount,price,group\n')
+            for i in range(BENCHMARK_CATALOG_ROWS):
+                f.write(f'art{i},товар {i},{i % 100},{i % 1000}.50,'
+                        f'группа {i % 50}\n')
+
+    def test_01_parse_scales_with_workers(self):
+        cpus = os.cpu_count() or 1
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.csv')
+            self.write_csv(path)
+            start = time.perf_counter()
+            with open(path, 'rb') as f:
+                rows = sum(1 for _ in CatalogImporter().read(f))
+            sequential = BENCHMARK_CATALOG_ROWS / (time.perf_counter() - start)
+            self.assertEqual(rows, BENCHMARK_CATALOG_ROWS)
+            lines = [f'\nразбор {BENCHMARK_CATALOG_ROWS} строк (ядер {cpus}):'
+                     f' в одном процессе {sequential:.0f} строк/с']
+            for workers in sorted({1, 2, 4, cpus}):
+                start = time.perf_counter()
+                rows = sum(1 for _ in read_file_parallel(
+                    path, CatalogImporter(), workers, shard_size=2 ** 20
+                ))
+                elapsed = time.perf_counter() - start
+                self.assertEqual(rows, BENCHMARK_CATALOG_ROWS)
+                lines.append(
+                    f'процессов {workers}:'
+                    f' {BENCHMARK_CATALOG_ROWS / elapsed:.0f} строк/с'
+                )
+
+            start = time.perf_counter()
+            result = import_file_parallel(path, CatalogImporter(), cpus)
+            elapsed = time.perf_counter() - start
+        lines.append(
+            f'импорт с записью, процессов {cpus}:'
+            f' {BENCHMARK_CATALOG_ROWS / elapsed:.0f} строк/с'
+        )
+        print('\n'.join(lines))
+        self.assertEqual(result.created, BENCHMARK_CATALOG_ROWS)
+        self.assertEqual(Group.objects.count(), 50)
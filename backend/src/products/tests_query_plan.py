@@ -0,0 +1,87 @@
+import datetime
+import re
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import QuerySet
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from products.models import LOW_STOCK_INDEX_LIMIT, Group, Order, Product
+from products.selectors import low_stock_products, orders_report
+from products.views import ProductView
+from users.models import AuthCode
+
+User = get_user_model()
+
+# SCAN - полный проход по таблице или индексу,
+# TEMP B-TREE - сортировка результата в памяти
+FULL_SCAN = re.compile(r'\bSCAN \w+|USE TEMP B-TREE')
+
+
+@unittest.skipUnless(
+    connection.vendor == 'sqlite', 'план запроса в формате SQLite'
+)
+class TestQueryPlan(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='plan', email='plan@mail.ru')
+        cls.group = Group.objects.create(name='plan')
+        super().setUpTestData()
+
+    def assertNoFullScan(self, queryset: QuerySet):
+        plan = queryset.explain()
+        self.assertIsNone(
+            FULL_SCAN.search(plan), f'\n{queryset.query}\n{plan}'
+        )
+
+    @staticmethod
+    def product_list_queryset(**params) -> QuerySet:
+        request = APIRequestFactory().get(reverse('products'), params)
+        view = ProductView(
+            action_map={'get': 'list'}, format_kwarg=None, args=(), kwargs={}
+        )
+        view.request = view.initialize_request(request)
+        return view.filter_queryset(view.get_queryset())
+
+    def test_01_products_by_group(self):
+        for ordering in ProductView.cursor_ordering_fields:
+            with self.subTest(ordering=ordering):
+                self.assertNoFullScan(self.product_list_queryset(
+                    group=self.group.pk, ordering=ordering
+                )[:11])
+
+    def test_02_cart_and_orders_by_user(self):
+        self.assertNoFullScan(self.user.cart.all()[:10])
+        self.assertNoFullScan(self.user.order.all()[:10])
+
+    def test_03_expired_auth_codes(self):
+        # exists() и delete() в expire_auth_code_control идут без сортировки
+        self.assertNoFullScan(
+            AuthCode.objects.filter(
+                exp__lte=datetime.datetime.now(datetime.timezone.utc)
+            ).order_by()
+        )
+
+    def test_04_orders_report_by_date(self):
+        today = datetime.datetime.now(datetime.timezone.utc)
+        self.assertNoFullScan(orders_report(Order.objects.filter(
+            created_at__gte=today - datetime.timedelta(days=7),
+            created_at__lt=today
+        )))
+        self.assertNoFullScan(
+            orders_report(Order.objects.filter(pk__in=[1, 2]))
+        )
+
+    def test_05_low_stock_products(self):
+        for threshold in (None, 1, LOW_STOCK_INDEX_LIMIT):
+            with self.subTest(threshold=threshold):
+                queryset = low_stock_products(Product.objects.all(), threshold)
+                self.assertNoFullScan(queryset[:11])
+                self.assertIn('product_low_stock_idx', queryset.explain())
+        # новые заканчивающиеся товары в send_low_stock_alerts
+        self.assertNoFullScan(low_stock_products(
+            Product.objects.filter(low_stock_alert__isnull=True)
+        ))
@@ -1,21 +1,47 @@
 from django.urls import path
 
-from products.views import (ProductView, add_to_cart, create_order,
-                            import_groups, import_products)
+from products.views import (LowStockView, ProductView, add_to_cart,
+                            create_order, export_products_view, import_catalog,
+                            import_groups, import_job_status, import_products,
+                            suggest_products)
 
 urlpatterns = [
     path(
         'import', import_products,
         name='import_products'
     ),
+    path(
+        'import/jobs/<int:pk>', import_job_status,
+        name='import_job'
+    ),
+    path(
+        'export', export_products_view,
+        name='export_products'
+    ),
     path(
         'groups/import', import_groups,
         name='import_groups'
     ),
+    path(
+        'catalog/import', import_catalog,
+        name='import_catalog'
+    ),
     path(
         '', ProductView.as_view({'get': 'list'}),
         name='products'
     ),
+    path(
+        'bulk', ProductView.as_view({'get': 'bulk'}),
+        name='products_bulk'
+    ),
+    path(
+        'low-stock', LowStockView.as_view({'get': 'list'}),
+        name='low_stock_products'
+    ),
+    path(
+        'suggest', suggest_products,
+        name='suggest_products'
+    ),
     path(
         '<str:pk>', ProductView.as_view({'get': 'retrieve'}),
         name='product'
@@ -1,40 +1,353 @@
-from drf_spectacular.utils import extend_schema, inline_serializer
+from dataclasses import asdict
+from typing import Sequence
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F, QuerySet
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import (OpenApiParameter, extend_schema,
+                                   inline_serializer)
 from rest_framework import mixins, serializers
 from rest_framework.decorators import (api_view, parser_classes,
                                        permission_classes)
-from rest_framework.exceptions import NotFound
-from rest_framework.parsers import FileUploadParser
+from rest_framework.exceptions import NotFound, ParseError, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet
 
-from products.models import Cart, Order, Product
+from products.cache import (catalog_cache_key, catalog_etag,
+                            get_or_render_fragments, get_or_set_single_flight,
+                            row_version)
+from products.catalog import CatalogSnapshot, catalog_store
+from products.counters import get_flushed_version, record_view
+from products.delta import DeltaPosition, decode_since, encode_since, get_delta
+from products.export import EXPORT_FORMATS, export_products
+from products.facets import (FACETS_PARAM, build_facets, build_snapshot_facets,
+                             get_or_build_facets)
+from products.jobs import create_import_job
+from products.models import Cart, ImportJob, Order, Product
+from products.pagination import CursorModePagination, keyset_ordering
+from products.parsers import CSVUpload, GzipCSVParser, StreamingCSVParser
 from products.permissions import ImportPermission, UserItemPermission
-from products.serializers import (CartSerializer, FileSerializer,
-                                  OrderSerializer, ProductSerializer)
-from products.services import (cart_to_order, import_groups_csv,
-                               import_products_csv)
+from products.renderers import ColumnarJSONRenderer
+from products.selectors import (columnar_values, filter_products,
+                                get_product_updated_at, low_stock_products)
+from products.serializers import (BULK_LIMIT, CartSerializer,
+                                  CatalogImportResultSerializer,
+                                  ImportJobSerializer, ImportModeSerializer,
+                                  ImportResultSerializer, OrderSerializer,
+                                  ProductBulkResultSerializer,
+                                  ProductBulkSerializer,
+                                  ProductFilterSerializer, ProductSerializer)
+from products.services import (cart_to_order, import_catalog_csv,
+                               import_groups_csv, import_products_csv)
+from products.suggest import suggest_index
+from services.fieldsets import SparseFieldsetViewMixin, fieldset_signature
+from services.streaming import STREAM_PARAM, StreamingListMixin
+from services.values import ValuesSerializer
 
 
 class ProductView(
+    StreamingListMixin,
+    SparseFieldsetViewMixin,
     GenericViewSet,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin
 ):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = CursorModePagination
+    renderer_classes = (
+        *api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer
+    )
+    cursor_ordering_fields = (
+        '-id', 'id', 'price', '-price', 'created_at', '-created_at'
+    )
     lookup_field = 'pk'
+    filters = None
+
+    def get_filters(self) -> dict:
+        """
+        Returns
+        -------
+        filters :
+            провалидированные фильтры списка, запоминаются на запрос
+        """
+        if self.filters is None:
+            serializer = ProductFilterSerializer.from_query_params(
+                self.request.query_params
+            )
+            serializer.is_valid(raise_exception=True)
+            self.filters = dict(serializer.validated_data)
+        return self.filters
 
     def get_queryset(self):
-        queryset = self.queryset
-        name = self.request.query_params.get('name')
-        group = self.request.query_params.get('group')
-        if name:
-            queryset = queryset.filter(name__icontains=name)
-        if group:
-            queryset = queryset.filter(group_id=group)
+        queryset = filter_products(
+            super().get_queryset(), **self.get_filters()
+        )
+        params = self.request.query_params
+        # курсор держит порядок по полю ordering и pk и отбросил бы
+        # сортировку поиска по релевантности
+        if 'cursor' in params and self.get_filters().get('search'):
+            raise ValidationError(
+                {'search': 'Поиск search не работает с cursor'}
+            )
+        if params.get('sort') == 'popular':
+            if 'cursor' in params:
+                raise ValidationError(
+                    {'sort': 'Сортировка popular не работает с cursor'}
+                )
+            return queryset.order_by(
+                F('counter__views').desc(nulls_last=True), '-id'
+            )
+        ordering = params.get('ordering')
+        if ordering in self.cursor_ordering_fields:
+            queryset = queryset.order_by(*keyset_ordering(ordering))
         return queryset
 
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action == 'list':
+            return renderers
+        return [
+            renderer for renderer in renderers
+            if not isinstance(renderer, ColumnarJSONRenderer)
+        ]
+
+    def get_sparse_required_fields(self) -> tuple:
+        # pk и updated_at нужны ключам фрагментов, поле сортировки - курсору
+        ordering = self.request.query_params.get('ordering')
+        if ordering not in self.cursor_ordering_fields:
+            ordering = self.cursor_ordering_fields[0]
+        return 'id', 'updated_at', ordering.lstrip('-')
+
+    def get_memory_rows(self) -> tuple | None:
+        """
+        Returns
+        -------
+        rows :
+            снимок каталога и индексы строк под фильтры запроса или None,
+            если режим CATALOG_IN_MEMORY выключен или запрос ему не подходит
+            (курсор, сортировка sort, полнотекстовый поиск)
+        """
+        filters = self.get_filters()
+        params = self.request.query_params
+        if not settings.CATALOG_IN_MEMORY or (
+                'cursor' in params or 'sort' in params
+                or filters.get('search')
+        ):
+            return None
+        ordering = params.get('ordering')
+        if ordering not in self.cursor_ordering_fields:
+            ordering = '-id'
+        snapshot = catalog_store.get_snapshot()
+        return snapshot, snapshot.select(**filters, ordering=ordering)
+
+    def get_values_serializer(self) -> ValuesSerializer:
+        return ValuesSerializer(self.get_serializer().fields)
+
+    def get_values_queryset(self) -> QuerySet:
+        """
+        Returns
+        -------
+        queryset :
+            строки values() под поля сериализатора, курсор и ключи
+            фрагментов, с фильтрами и сортировкой запроса
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return queryset.values(*dict.fromkeys((
+            *self.get_values_serializer().sources,
+            *self.get_sparse_required_fields(),
+            *queryset.query.extra_select
+        )))
+
+    def get_stream_queryset(self) -> QuerySet:
+        return self.get_values_queryset()
+
+    def serialize_stream_chunk(self, rows: list) -> list:
+        return self.get_values_serializer().many(rows)
+
+    def get_facets(self, snapshot: CatalogSnapshot = None) -> dict:
+        filters = self.get_filters()
+        if snapshot is None:
+            return get_or_build_facets(
+                filters, lambda: build_facets(Product.objects.all(), filters)
+            )
+        return get_or_build_facets(
+            filters, lambda: build_snapshot_facets(snapshot, filters)
+        )
+
+    @extend_schema(parameters=[
+        ProductFilterSerializer,
+        OpenApiParameter(
+            'updated_since', str,
+            description='время (ISO 8601 или unix) или курсор next: отдать'
+                        ' только измененные и удаленные с этого момента'
+                        ' товары'
+        ),
+        OpenApiParameter(
+            'sort', str, enum=['popular'],
+            description='popular - по просмотрам, вместо ordering'
+        ),
+        OpenApiParameter(
+            FACETS_PARAM, bool,
+            description='добавить к странице фасеты по группам и ценам'
+        ),
+        OpenApiParameter(
+            STREAM_PARAM, bool,
+            description='весь список одним потоковым JSON-массивом без'
+                        ' пагинации и фасетов, только для администраторов'
+        ),
+    ])
+    def list(self, request, *args, **kwargs):
+        if self.is_streaming():
+            return self.stream_list()
+        key = catalog_cache_key(request)
+        if request.query_params.get('sort') == 'popular':
+            # просмотры выгружаются без смены версии каталога
+            key = f'{key}:views:{get_flushed_version()}'
+        return self.conditional_response(
+            request, key, catalog_etag(key), self.render_list
+        )
+
+    def render_list(self) -> Response:
+        """
+        Собирает страницу из закешированных фрагментов товаров,
+        промахи сериализуются из строк values() без экземпляров модели
+        через ValuesSerializer, и с ?facets=1 добавляет к ней
+        фасеты по группам и ценам. Колоночный формат
+        отдает всю выборку без пагинации - он для выгрузки каталога.
+        С updated_since отдается дельта вместо страницы
+        """
+        since = self.request.query_params.get('updated_since')
+        if since:
+            return self.render_delta(decode_since(since))
+        if isinstance(self.request.accepted_renderer, ColumnarJSONRenderer):
+            return Response(columnar_values(
+                self.filter_queryset(self.get_queryset()),
+                self.get_serializer().fields
+            ))
+        values = self.get_values_serializer()
+        snapshot, memory_rows = None, self.get_memory_rows()
+        if memory_rows is None:
+            queryset = self.get_values_queryset()
+            page = self.paginate_queryset(queryset)
+            products = list(queryset) if page is None else page
+        else:
+            snapshot, rows = memory_rows
+            page = self.paginate_queryset(rows)
+            products = [
+                snapshot.row(i) for i in (rows if page is None else page)
+            ]
+        data = get_or_render_fragments(
+            products, values.many, variant=fieldset_signature(self.request)
+        )
+        if page is None:
+            return Response(data)
+        response = self.get_paginated_response(data)
+        if self.request.query_params.get(FACETS_PARAM) in ('1', 'true'):
+            response.data['facets'] = self.get_facets(snapshot)
+        return response
+
+    def render_delta(self, position: DeltaPosition) -> Response:
+        products, deleted, position, has_more = get_delta(
+            self.filter_queryset(self.get_queryset()),
+            Product._meta.model_name, position
+        )
+        return Response({
+            'results': self.render_products(products),
+            'deleted': deleted,
+            'next': encode_since(position),
+            'has_more': has_more,
+        })
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_field)
+        updated_at = get_product_updated_at(pk)
+        if updated_at is None:
+            raise NotFound()
+        record_view(int(pk))
+        etag = f'{pk}-{row_version(updated_at)}{fieldset_signature(request)}'
+        return self.conditional_response(
+            request, f'{catalog_cache_key(request)}:{etag}', etag,
+            lambda: Response(self.render_products([self.get_object()])[0]),
+            last_modified=int(updated_at.timestamp())
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'ids', str,
+                description=f'pk товаров через запятую, до {BULK_LIMIT}'
+            ),
+            OpenApiParameter(
+                'article', str,
+                description=f'артикулы через запятую, до {BULK_LIMIT}'
+            ),
+        ],
+        responses={200: ProductBulkResultSerializer}
+    )
+    def bulk(self, request, *args, **kwargs):
+        """
+        Товары по списку pk или артикулов одним запросом в порядке
+        запроса, на месте отсутствующих - null и их ключ в missing
+        """
+        serializer = ProductBulkSerializer(data={
+            field: [
+                value for values in request.query_params.getlist(field)
+                for value in values.split(',') if value
+            ]
+            for field in ('ids', 'article')
+            if field in request.query_params
+        })
+        serializer.is_valid(raise_exception=True)
+        field, keys = serializer.lookup
+        products = {
+            getattr(product, field): product
+            for product in self.queryset.filter(**{f'{field}__in': keys})
+        }
+        fragments = dict(zip(
+            products, self.render_products(list(products.values()))
+        ))
+        return Response({
+            'results': [fragments.get(key) for key in keys],
+            'missing': [key for key in keys if key not in fragments],
+        })
+
+    def render_products(self, products: Sequence[Product]) -> Sequence[dict]:
+        return get_or_render_fragments(
+            products,
+            lambda products: self.get_serializer(products, many=True).data,
+            variant=fieldset_signature(self.request)
+        )
+
+    @staticmethod
+    def conditional_response(
+            request, key, etag, handler, last_modified=None
+    ):
+        """
+        Отвечает 304 по If-None-Match/If-Modified-Since без запроса к
+        каталогу, иначе отдает ответ из кеша или от handler
+        """
+        etag = quote_etag(etag)
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
+        data = get_or_set_single_flight(key, lambda: handler().data)
+        response = Response(data)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
 
 class CartView(
     GenericViewSet,
@@ -44,10 +357,13 @@ class CartView(
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
     permission_classes = (UserItemPermission,)
+    pagination_class = CursorModePagination
     lookup_field = 'pk'
 
 
 class OrderView(
+    StreamingListMixin,
+    SparseFieldsetViewMixin,
     GenericViewSet,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin
@@ -55,8 +371,59 @@ class OrderView(
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = (UserItemPermission,)
+    pagination_class = CursorModePagination
     lookup_field = 'pk'
 
+    def get_stream_queryset(self):
+        # итератор с chunk_size подгружает товары заказов на каждую часть
+        return super().get_stream_queryset().prefetch_related('products')
+
+
+@extend_schema(
+    parameters=[OpenApiParameter('threshold', int)], methods=('GET',)
+)
+class LowStockView(GenericViewSet, mixins.ListModelMixin):
+    """
+    Заканчивающиеся товары: остаток ниже threshold, по умолчанию
+    LOW_STOCK_THRESHOLD, по возрастанию остатка
+    """
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+    permission_classes = (ImportPermission,)
+    pagination_class = CursorModePagination
+    cursor_ordering_fields = ('amount',)
+
+    def get_queryset(self):
+        threshold = self.request.query_params.get('threshold')
+        if threshold is not None:
+            field = serializers.IntegerField(min_value=1)
+            try:
+                threshold = field.run_validation(threshold)
+            except ValidationError as e:
+                raise ValidationError({'threshold': e.detail})
+        return low_stock_products(super().get_queryset(), threshold)
+
+
+@extend_schema(
+    parameters=[OpenApiParameter('q', str, required=True)],
+    responses={200: inline_serializer(
+        name='suggest',
+        fields={
+            'id': serializers.IntegerField(),
+            'name': serializers.CharField(),
+            'article': serializers.CharField(),
+        },
+        many=True
+    )},
+    methods=('GET',)
+)
+@api_view(('GET',))
+def suggest_products(request):
+    prefix = request.query_params.get('q', '').strip()
+    if not prefix:
+        return Response(data=[])
+    return Response(data=suggest_index.search(prefix))
+
 
 @extend_schema(
     request=inline_serializer(
@@ -93,26 +460,105 @@ def create_order(request):
 
 
 @extend_schema(
-    request=FileSerializer, responses={201: None}, methods=('POST',)
+    parameters=[OpenApiParameter('type', str, enum=list(EXPORT_FORMATS))],
+    responses={(200, media_type): OpenApiTypes.BINARY for media_type in {
+        value.split(';')[0] for value in EXPORT_FORMATS.values()
+    }},
+    methods=('GET',)
+)
+@api_view(('GET',))
+@permission_classes((ImportPermission,))
+def export_products_view(request):
+    export_format = request.query_params.get('type', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise ValidationError({'type': list(EXPORT_FORMATS)})
+    response = StreamingHttpResponse(
+        export_products(export_format),
+        content_type=EXPORT_FORMATS[export_format]
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename=products.{export_format}'
+    )
+    return response
+
+
+IMPORT_REQUEST = {
+    StreamingCSVParser.media_type: OpenApiTypes.BINARY,
+    GzipCSVParser.media_type: OpenApiTypes.BINARY,
+}
+
+
+def run_import(request, kind: str) -> Response:
+    """
+    Импорт в запросе с ответом 201 и итогом или фоновая задача
+    с ответом 202, см. ImportModeSerializer.background
+    """
+    mode = ImportModeSerializer(data=request.query_params)
+    mode.is_valid(raise_exception=True)
+    file = request.data
+    if not isinstance(file, CSVUpload):
+        raise ParseError('Ожидался файл CSV в теле запроса')
+    if mode.is_background(file):
+        job = create_import_job(
+            kind, File(file.stream, name=file.name), mode.upsert,
+            request.user
+        )
+        return Response(
+            data=ImportJobSerializer(job).data, status=202, headers={
+                'Location': reverse('import_job', kwargs={'pk': job.pk})
+            }
+        )
+    import_csv = {
+        ImportJob.Kind.PRODUCTS: import_products_csv,
+        ImportJob.Kind.GROUPS: import_groups_csv,
+        ImportJob.Kind.CATALOG: import_catalog_csv,
+    }[kind]
+    return Response(
+        data=asdict(import_csv(file, upsert=mode.upsert)), status=201
+    )
+
+
+@extend_schema(
+    request=IMPORT_REQUEST, parameters=[ImportModeSerializer],
+    responses={201: ImportResultSerializer, 202: ImportJobSerializer},
+    methods=('POST',)
 )
 @api_view(('POST',))
 @permission_classes((ImportPermission,))
-@parser_classes((FileUploadParser,))
+@parser_classes((StreamingCSVParser, GzipCSVParser))
 def import_products(request):
-    serializer = FileSerializer(data=request.FILES)
-    serializer.is_valid(raise_exception=True)
-    import_products_csv(serializer.validated_data.get('file'))
-    return Response(status=201)
+    return run_import(request, ImportJob.Kind.PRODUCTS)
 
 
 @extend_schema(
-    request=FileSerializer, responses={201: None}, methods=('POST',)
+    request=IMPORT_REQUEST, parameters=[ImportModeSerializer],
+    responses={201: ImportResultSerializer, 202: ImportJobSerializer},
+    methods=('POST',)
 )
 @api_view(('POST',))
 @permission_classes((ImportPermission,))
-@parser_classes((FileUploadParser,))
+@parser_classes((StreamingCSVParser, GzipCSVParser))
 def import_groups(request):
-    serializer = FileSerializer(data=request.FILES)
-    serializer.is_valid(raise_exception=True)
-    import_groups_csv(serializer.validated_data.get('file'))
-    return Response(status=201)
+    return run_import(request, ImportJob.Kind.GROUPS)
+
+
+@extend_schema(
+    request=IMPORT_REQUEST, parameters=[ImportModeSerializer],
+    responses={
+        201: CatalogImportResultSerializer, 202: ImportJobSerializer
+    },
+    methods=('POST',)
+)
+@api_view(('POST',))
+@permission_classes((ImportPermission,))
+@parser_classes((StreamingCSVParser, GzipCSVParser))
+def import_catalog(request):
+    return run_import(request, ImportJob.Kind.CATALOG)
+
+
+@extend_schema(responses={200: ImportJobSerializer}, methods=('GET',))
+@api_view(('GET',))
+@permission_classes((ImportPermission,))
+def import_job_status(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    return Response(data=ImportJobSerializer(job).data)
@@ -0,0 +1,92 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def _split(request, param: str) -> set[str] | None:
+    values = request.query_params.getlist(param)
+    if not values:
+        return None
+    return {
+        name.strip() for value in values for name in value.split(',')
+        if name.strip()
+    }
+
+
+def get_fieldset(request) -> tuple[set[str] | None, set[str]]:
+    """
+    Parameters
+    ----------
+    request :
+        запрос с параметрами fields и exclude
+
+    Returns
+    -------
+    fieldset :
+        запрошенные поля (None - все) и исключенные поля
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, set()
+    exclude = _split(request, EXCLUDE_PARAM) or set()
+    return _split(request, FIELDS_PARAM), exclude
+
+
+def fieldset_signature(request) -> str:
+    """
+    Returns
+    -------
+    signature :
+        каноничная запись fields/exclude запроса для ключей кеша и ETag,
+        пустая строка если ответ полный
+    """
+    fields, exclude = get_fieldset(request)
+    signature = ''
+    if fields is not None:
+        signature += f':f={",".join(sorted(fields))}'
+    if exclude:
+        signature += f':e={",".join(sorted(exclude))}'
+    return signature
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Оставляет в сериализаторе только поля из ?fields= и убирает поля
+    из ?exclude= при чтении. Неизвестные имена полей игнорируются.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, exclude = get_fieldset(self.context.get('request'))
+        for name in list(self.fields):
+            if name in exclude or (fields is not None and name not in fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsetViewMixin:
+    """
+    Сужает SELECT до колонок, которые нужны полям сериализатора
+    после применения fields/exclude
+    """
+    sparse_required_fields = ('pk',)
+
+    def get_sparse_required_fields(self) -> tuple:
+        return self.sparse_required_fields
+
+    def get_queryset(self) -> QuerySet:
+        queryset = super().get_queryset()
+        fields, exclude = get_fieldset(self.request)
+        if fields is None and not exclude:
+            return queryset
+        opts = queryset.model._meta
+        columns = set()
+        for field in self.get_serializer().fields.values():
+            try:
+                model_field = opts.get_field(field.source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(model_field.name)
+        return queryset.only(*columns, *self.get_sparse_required_fields())
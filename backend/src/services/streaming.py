@@ -0,0 +1,85 @@
+from itertools import islice
+from typing import Iterable, Iterator
+
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+STREAM_PARAM = 'stream'
+STREAM_CHUNK_SIZE = 1000
+
+
+def iter_chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """
+    JSON-массив по частям: каждая часть рендерится отдельно
+    и отдается сразу, весь ответ в памяти не собирается
+    """
+
+    def render_chunks(self, chunks: Iterable[list]) -> Iterator[bytes]:
+        """
+        Parameters
+        ----------
+        chunks :
+            списки сериализованных объектов
+
+        Returns
+        -------
+        content :
+            байты одного JSON-массива из всех элементов chunks
+        """
+        yield b'['
+        separator = b''
+        for chunk in chunks:
+            if not chunk:
+                continue
+            # рендерим часть списком и снимаем с нее скобки
+            yield separator + self.render(chunk)[1:-1]
+            separator = b','
+        yield b']'
+
+
+class StreamingListMixin:
+    """
+    Список без пагинации по ?stream=1: queryset читается
+    итератором частями по stream_chunk_size, каждая часть
+    сериализуется и сразу уходит клиенту, поэтому память не зависит
+    от размера выборки. Доступно только администраторам.
+    """
+    stream_chunk_size = STREAM_CHUNK_SIZE
+
+    def is_streaming(self) -> bool:
+        return self.request.query_params.get(STREAM_PARAM) in ('1', 'true')
+
+    def get_stream_queryset(self) -> QuerySet:
+        return self.filter_queryset(self.get_queryset())
+
+    def serialize_stream_chunk(self, objects: list) -> list:
+        return self.get_serializer(objects, many=True).data
+
+    def stream_list(self) -> StreamingHttpResponse:
+        if not self.request.user.is_superuser:
+            self.permission_denied(
+                self.request,
+                message='Список целиком доступен только администраторам'
+            )
+        queryset = self.get_stream_queryset()
+        chunks = iter_chunks(
+            queryset.iterator(chunk_size=self.stream_chunk_size),
+            self.stream_chunk_size
+        )
+        renderer = StreamingJSONRenderer()
+        return StreamingHttpResponse(
+            renderer.render_chunks(map(self.serialize_stream_chunk, chunks)),
+            content_type=renderer.media_type
+        )
+
+    def list(self, request, *args, **kwargs):
+        if self.is_streaming():
+            return self.stream_list()
+        return super().list(request, *args, **kwargs)
@@ -0,0 +1,105 @@
+from decimal import Decimal
+from typing import Callable, Iterable, Mapping
+
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+IDENTITY_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField
+)
+
+
+def _decimal_converter(field: serializers.DecimalField) -> Callable:
+    coerce_to_string = getattr(
+        field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING
+    )
+    if not coerce_to_string or field.localize or (
+            field.decimal_places is None
+    ):
+        return field.to_representation
+    exponent = Decimal(1).scaleb(-field.decimal_places)
+    return lambda value: '{:f}'.format(value.quantize(exponent))
+
+
+def _datetime_converter(field: serializers.DateTimeField) -> Callable:
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if hasattr(field, 'timezone'):
+        field_timezone = field.timezone
+    else:
+        field_timezone = field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or (
+            field_timezone is None
+    ):
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return convert
+
+
+def get_converter(field: serializers.Field) -> Callable | None:
+    """
+    Parameters
+    ----------
+    field :
+        поле сериализатора
+
+    Returns
+    -------
+    converter :
+        преобразование значения колонки в значение JSON, как
+        field.to_representation, или None, если значение из БД
+        отдается как есть
+    """
+    if isinstance(field, IDENTITY_FIELDS):
+        return None
+    if isinstance(field, serializers.DecimalField):
+        return _decimal_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_converter(field)
+    return field.to_representation
+
+
+class ValuesSerializer:
+    """
+    Сериализация строк values() для чтения без экземпляров модели.
+
+    Преобразования полей выбираются один раз при создании, а не на
+    каждое значение, поэтому результат совпадает с serializer.data
+    для тех же строк, но без обхода полей DRF. Поддерживаются только
+    поля, источник которых - колонка модели.
+    """
+    __slots__ = ('sources', '_converters')
+
+    def __init__(self, fields: Mapping[str, serializers.Field]):
+        """
+        Parameters
+        ----------
+        fields :
+            поля сериализатора по именам, после fields/exclude запроса
+        """
+        self._converters = tuple(
+            (name, field.source, get_converter(field))
+            for name, field in fields.items()
+        )
+        self.sources = tuple(dict.fromkeys(
+            source for _, source, _ in self._converters
+        ))
+
+    def to_representation(self, row: Mapping) -> dict:
+        data = {}
+        for name, source, converter in self._converters:
+            value = row[source]
+            if converter is not None and value is not None:
+                value = converter(value)
+            data[name] = value
+        return data
+
+    def many(self, rows: Iterable[Mapping]) -> list[dict]:
+        return [self.to_representation(row) for row in rows]
@@ -108,6 +108,20 @@ CACHES = {
                     f"{os.environ.get('REDIS_PORT')}",
     }
 }
+CATALOG_CACHE_TIMEOUT = 60 * 60
+CATALOG_IN_MEMORY = int(os.environ.get('CATALOG_IN_MEMORY', 0))
+VIEW_COUNTERS_FLUSH_INTERVAL = int(
+    os.environ.get('VIEW_COUNTERS_FLUSH_INTERVAL', 60)
+)
+LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 10))
+IMPORT_JOBS_IN_PROCESS = int(os.environ.get('IMPORT_JOBS_IN_PROCESS', 1))
+IMPORT_JOBS_WORKERS = int(os.environ.get('IMPORT_JOBS_WORKERS', 1))
+IMPORT_SYNC_MAX_SIZE = int(
+    os.environ.get('IMPORT_SYNC_MAX_SIZE', 1024 * 1024)
+)
+IMPORT_JOB_STALE_TIMEOUT = int(
+    os.environ.get('IMPORT_JOB_STALE_TIMEOUT', 10 * 60)
+)
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
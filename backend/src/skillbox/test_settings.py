@@ -105,6 +105,14 @@ CACHES = {
             'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         }
 }
+CATALOG_CACHE_TIMEOUT = 60 * 60
+CATALOG_IN_MEMORY = 0
+VIEW_COUNTERS_FLUSH_INTERVAL = 60
+LOW_STOCK_THRESHOLD = 10
+IMPORT_JOBS_IN_PROCESS = 0
+IMPORT_JOBS_WORKERS = 1
+IMPORT_SYNC_MAX_SIZE = 1024 * 1024
+IMPORT_JOB_STALE_TIMEOUT = 10 * 60
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
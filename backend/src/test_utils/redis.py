@@ -0,0 +1,57 @@
+import fnmatch
+
+from redis.exceptions import ResponseError
+
+REDIS_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379',
+    }
+}
+
+
+class FakeRedis:
+    """
+    Клиент Redis в памяти с командами, которые нужны RedisCache
+    и счетчикам просмотров. Значения хранятся байтами, как в Redis
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = self.encode(value)
+        return True
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def hincrby(self, key, field, amount=1):
+        hash_ = self.data.setdefault(key, {})
+        field = self.encode(field)
+        hash_[field] = self.encode(int(hash_.get(field, 0)) + amount)
+        return int(hash_[field])
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def rename(self, src, dst):
+        if src not in self.data:
+            raise ResponseError('no such key')
+        self.data[dst] = self.data.pop(src)
+        return True
+
+    def scan_iter(self, match='*'):
+        return [
+            key.encode() for key in list(self.data)
+            if fnmatch.fnmatchcase(key, match)
+        ]
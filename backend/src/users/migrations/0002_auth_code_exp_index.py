@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='authcode',
+            name='exp',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -53,7 +53,7 @@ class AuthCode(models.Model):
         User, related_name='codes', on_delete=CASCADE
     )
     code = models.IntegerField()
-    exp = models.DateTimeField()
+    exp = models.DateTimeField(db_index=True)
 
     class Meta:
         db_table = 'auth_code'
@@ -1,3 +1,5 @@
+import json
+
 from django.contrib.auth import get_user_model
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient, APITestCase
@@ -149,3 +151,32 @@ class TestUser(APITestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertGreater(len(response.json()), 0)
+
+    def test_11_admin_get_users_sparse_fieldsets(self):
+        response = self.admin_client.get(
+            reverse('users'), {'fields': 'username,password'}
+        )
+        self.assertEqual(response.status_code, 200)
+        for el in response.json()['results']:
+            self.assertEqual(set(el), {'username'})
+        response = self.admin_client.get(
+            reverse('user', kwargs={'username': self.test_user.username}),
+            {'exclude': 'email'}
+        )
+        self.assertNotIn('email', response.json())
+        self.assertIn('first_name', response.json())
+
+    def test_12_admin_stream_users(self):
+        response = self.auth_user_client.get(reverse('users'), {'stream': 1})
+        self.assertEqual(response.status_code, 403)
+        response = self.admin_client.get(
+            reverse('users'), {'stream': 1, 'fields': 'username'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(
+                el['username']
+                for el in json.loads(b''.join(response.streaming_content))
+            ),
+            sorted(User.objects.values_list('username', flat=True))
+        )
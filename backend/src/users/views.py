@@ -3,6 +3,8 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, mixins
 
+from services.fieldsets import SparseFieldsetViewMixin
+from services.streaming import StreamingListMixin
 from users.permissions import UserPermission
 from users.serializers import UserSerializer
 from users.services import send_confirm
@@ -11,6 +13,8 @@ User = get_user_model()
 
 
 class UserView(
+    StreamingListMixin,
+    SparseFieldsetViewMixin,
     GenericViewSet,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,